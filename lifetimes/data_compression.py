@@ -1,74 +1,123 @@
+import numpy as np
 import pandas as pd
 
 
-def compress_data(data):
+def compress(data, keys, columns=None, weights=None, return_inverse=False):
     """
-    Takes id-level data and compress them by recency/frequency, data must contain columns 'frequency', 'recency', 'T'
+    Takes id-level data and counts the ids sharing the same values of the key columns, in a single pass.
+    Rows are ordered as a nested scan over the keys would produce them: by first occurrence of keys[0], then by
+    first occurrence of keys[1] among the rows with that keys[0], and so on. Rows with a missing key are dropped.
     :param data:    id-level data
     :type data:     pandas df
-    :return:        Compressed data frame
+    :param keys:    key columns, from the outermost to the innermost
+    :type keys:     list
+    :param columns: order of the key columns in the output, defaults to keys
+    :type columns:  list
+    :param weights: optional column with the number of ids of every row, e.g. 'N' to compress compressed data
+    :type weights:  str
+    :param return_inverse:  if True, also return the row of the compressed data of every row of data (-1 for the
+                            rows with a missing key), so values computed per row of the compressed data can be
+                            scattered back to the ids with values[inverse]
+    :type return_inverse:   bool
+    :return:        Compressed data frame, with the key columns followed by the count column 'N', and the inverse
+                    if return_inverse
+    """
+    keys = list(keys)
+    columns = keys if columns is None else list(columns)
+    missing = [key for key in keys if key not in data]
+    if missing:
+        raise ValueError("Input data frame must contain %s" % ", ".join(missing))
+    if weights is not None and weights not in data:
+        raise ValueError("Input data frame must contain %s" % weights)
+    if sorted(columns) != sorted(keys):
+        raise ValueError("columns must be a permutation of keys")
+
+    # factorize codes follow first occurrence, so sorting groups by the codes of their key prefixes reproduces
+    # the order of the nested scan
+    valid = np.ones(len(data), dtype=bool)
+    prefix_code = np.zeros(len(data), dtype=np.int64)
+    prefix_codes = []
+    for key in keys:
+        key_code, key_uniques = pd.factorize(data[key])
+        valid &= key_code >= 0
+        prefix_code, _ = pd.factorize(prefix_code * (len(key_uniques) + 1) + key_code)
+        prefix_codes.append(prefix_code)
+
+    group_code, first_row = np.unique(prefix_code[valid], return_index=True)
+    first_row = np.flatnonzero(valid)[first_row]
+    if weights is None:
+        counts = np.bincount(prefix_code[valid])[group_code].astype(np.int64)
+    else:
+        weights = np.asarray(data[weights])
+        counts = np.bincount(prefix_code[valid], weights=weights[valid])[group_code]
+        if weights.dtype.kind in 'iub':
+            counts = np.rint(counts).astype(np.int64)
+    order = np.lexsort([code[first_row] for code in reversed(prefix_codes)])
+
+    compressed_data = pd.DataFrame(
+        dict((column, data[column].values[first_row[order]]) for column in columns), columns=columns)
+    compressed_data['N'] = counts[order]
+    if not return_inverse:
+        return compressed_data
+
+    row = np.empty(len(order), dtype=np.int64)
+    row[order] = np.arange(len(order))
+    inverse = np.full(len(data), -1, dtype=np.int64)
+    inverse[valid] = row[np.searchsorted(group_code, prefix_code[valid])]
+    return compressed_data, inverse
+
+
+def _extra_keys(extra_keys):
+    return [] if extra_keys is None else list(extra_keys)
+
+
+def compress_data(data, extra_keys=None):
+    """
+    Takes id-level data and compress them by recency/frequency, data must contain columns 'frequency', 'recency', 'T'
+    :param data:        id-level data
+    :type data:         pandas df
+    :param extra_keys:  additional columns to compress by, after T, frequency and recency
+    :type extra_keys:   list
+    :return:            Compressed data frame
     """
     if 'T' not in data or 'frequency' not in data or 'recency' not in data:
         raise ValueError("Input data frame must contain recency, frequency and T")
 
-    newData = []
-    for T in pd.Series.unique(data['T']):
-        data_T = data[data['T'] == T]
-        for frequency in pd.Series.unique(data_T['frequency']):
-            data_f = data_T[data_T['frequency'] == frequency]
-            for recency in pd.Series.unique(data_f['recency']):
-                N = len(data_f[data_f['recency'] == recency])
-                newData.append([recency, frequency, T, N])
-
-    compressed_data = pd.DataFrame(newData, columns=['recency', 'frequency', 'T', 'N'])
-    return compressed_data
+    extra_keys = _extra_keys(extra_keys)
+    return compress(data, ['T', 'frequency', 'recency'] + extra_keys, ['recency', 'frequency', 'T'] + extra_keys)
 
 
-def compress_bgext_data(data):
+def compress_bgext_data(data, extra_keys=None):
     """
     Takes id-level data and compress them by frequency, T. Data must contain columns 'frequency', 'T'
-    :param data:    id-level data
-    :type data:     pandas df
-    :return:        Compressed data frame
+    :param data:        id-level data
+    :type data:         pandas df
+    :param extra_keys:  additional columns to compress by, after T and frequency
+    :type extra_keys:   list
+    :return:            Compressed data frame
     """
     if 'T' not in data or 'frequency' not in data:
         raise ValueError("Input data frame must contain recency, T")
 
-    newData = []
-    for T in pd.Series.unique(data['T']):
-        data_T = data[data['T'] == T]
-        for frequency in pd.Series.unique(data_T['frequency']):
-            data_f = data_T[data_T['frequency'] == frequency]
-            N = len(data_f)
-            newData.append([frequency, T, N])
+    extra_keys = _extra_keys(extra_keys)
+    return compress(data, ['T', 'frequency'] + extra_keys, ['frequency', 'T'] + extra_keys)
 
-    compressed_data = pd.DataFrame(newData, columns=['frequency', 'T', 'N'])
-    return compressed_data
 
-
-def compress_session_session_before_conversion_data(data):
+def compress_session_session_before_conversion_data(data, extra_keys=None):
     """
     Takes id-level data and compress them by recency/frequency, data must contain columns 'frequency', 'recency', 'T'
-    :param data:    id-level data
-    :type data:     pandas df
-    :return:        Compressed data frame
+    :param data:        id-level data
+    :type data:         pandas df
+    :param extra_keys:  additional columns to compress by, after T, frequency, recency and frequency_before_conversion
+    :type extra_keys:   list
+    :return:            Compressed data frame
     """
     if 'T' not in data or 'frequency' not in data or 'frequency_before_conversion' not in data or 'recency' not in data:
         raise ValueError("Input data frame must contain recency, frequency, frequency_purchases and T")
 
-    newData = []
-    for T in pd.Series.unique(data['T']):
-        data_T = data[data['T'] == T]
-        for frequency in pd.Series.unique(data_T['frequency']):
-            data_f = data_T[data_T['frequency'] == frequency]
-            for recency in pd.Series.unique(data_f['recency']):
-                data_r = data_f[data_f['recency'] == recency]
-                for frequency_purchases in pd.Series.unique(data_r['frequency_before_conversion']):
-                    N = len(data_r[data_r['frequency_before_conversion'] == frequency_purchases])
-                    newData.append([recency, frequency, T, frequency_purchases, N])
-
-    compressed_data = pd.DataFrame(newData, columns=['recency', 'frequency', 'T', 'frequency_before_conversion', 'N'])
-    return compressed_data
+    extra_keys = _extra_keys(extra_keys)
+    return compress(data, ['T', 'frequency', 'recency', 'frequency_before_conversion'] + extra_keys,
+                    ['recency', 'frequency', 'T', 'frequency_before_conversion'] + extra_keys)
 
 
 def filter_data_by_T(data, T1, T2):
@@ -80,3 +129,128 @@ def filter_data_by_T(data, T1, T2):
         raise ValueError("Input data frame must contain T")
 
     return data[(data['T'] >= T1) & (data['T'] <= T2)]
+
+
+class CompressedTable(object):
+    """
+    Compressed data built incrementally from chunks of id-level data, e.g. daily shards that do not fit in memory
+    together. Memory is bounded by the number of distinct cells.
+    Tables with the same keys can be merged (summing N on matching cells) and subtracted. A table behaves like its
+    compressed data frame as a mapping of columns, so it can be passed directly to the fitters: fitter.fit(**table)
+    """
+
+    def __init__(self, keys=None, columns=None):
+        """
+        :param keys:    key columns, from the outermost to the innermost, defaults to T, frequency, recency
+        :type keys:     list
+        :param columns: order of the key columns in the output, defaults to keys (recency, frequency, T for the
+                        default keys, like compress_data)
+        :type columns:  list
+        """
+        if keys is None:
+            keys = ['T', 'frequency', 'recency']
+            if columns is None:
+                columns = ['recency', 'frequency', 'T']
+        self.key_columns = list(keys)
+        self.columns = self.key_columns if columns is None else list(columns)
+        if sorted(self.columns) != sorted(self.key_columns):
+            raise ValueError("columns must be a permutation of keys")
+        self._data = None
+
+    @classmethod
+    def from_chunks(cls, chunks, keys=None, columns=None):
+        """
+        :param chunks:  iterable of id-level data frames
+        :return:        the table of all the chunks
+        """
+        table = cls(keys, columns)
+        for chunk in chunks:
+            table.update(chunk)
+        return table
+
+    def _merged(self, data):
+        if self._data is not None:
+            data = pd.concat([self._data, data[self.columns + ['N']]], ignore_index=True)
+        return compress(data, self.key_columns, self.columns, weights='N')
+
+    def _check_compatible(self, other):
+        if not isinstance(other, CompressedTable):
+            raise ValueError("Expected a CompressedTable, got %s" % type(other).__name__)
+        if other.key_columns != self.key_columns:
+            raise ValueError("Tables with different keys cannot be combined: %s and %s" %
+                             (self.key_columns, other.key_columns))
+
+    def update(self, data):
+        """
+        Adds a chunk of id-level data to the table.
+        :param data:    id-level data
+        :type data:     pandas df
+        :return:        self
+        """
+        self._data = self._merged(compress(data, self.key_columns, self.columns))
+        return self
+
+    def merge(self, other):
+        """
+        Adds the cells of another table, summing N on matching cells.
+        :return:        self
+        """
+        self._check_compatible(other)
+        if other._data is not None:
+            self._data = self._merged(other._data)
+        return self
+
+    def subtract(self, other):
+        """
+        Removes the cells of another table, e.g. a shard that has been restated. Every cell of other must be in
+        the table with at least the same N.
+        :return:        self
+        """
+        self._check_compatible(other)
+        if other._data is None:
+            return self
+        negated = other._data.copy()
+        negated['N'] = -negated['N']
+        data = self._merged(negated)
+        if (data['N'] < 0).any():
+            raise ValueError("Cannot subtract cells that are not in the table")
+        self._data = data[data['N'] != 0].reset_index(drop=True)
+        return self
+
+    def copy(self):
+        table = CompressedTable(self.key_columns, self.columns)
+        if self._data is not None:
+            table._data = self._data.copy()
+        return table
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def __sub__(self, other):
+        return self.copy().subtract(other)
+
+    def to_frame(self):
+        """
+        :return:        Compressed data frame, with the key columns followed by the count column 'N'
+        """
+        if self._data is None:
+            return pd.DataFrame(columns=self.columns + ['N'])
+        return self._data.copy()
+
+    def keys(self):
+        return self.columns + ['N']
+
+    def __getitem__(self, column):
+        return self.to_frame()[column] if self._data is None else self._data[column]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, column):
+        return column in self.keys()
+
+    def __len__(self):
+        return 0 if self._data is None else len(self._data)
+
+    def __repr__(self):
+        return "<CompressedTable: %d cells, %d ids>" % (len(self), 0 if self._data is None else self._data['N'].sum())
@@ -2,16 +2,19 @@ from __future__ import print_function
 from collections import OrderedDict
 import math
 import numpy as np
-from numpy import log, exp, logaddexp, asarray, any as npany, c_ as vconcat, \
+from numpy import log, exp, logaddexp, asarray, any as npany, all as npall, c_ as vconcat, \
     isinf, isnan, ones_like
 from pandas import DataFrame
 from scipy import special
-from scipy import misc
-from lifetimes.utils import _fit, _scale_time, _check_inputs, customer_lifetime_value, ncr
+try:
+    from scipy.special import logsumexp
+except ImportError:
+    from scipy.misc import logsumexp
+from lifetimes.utils import _fit, _scale_time, _check_inputs, _expand_ages, customer_lifetime_value, ncr, \
+    delta_method_errors
 from lifetimes.generate_data import pareto_nbd_model, beta_geometric_nbd_model, modified_beta_geometric_nbd_model, \
     bgbb_model, bgbbbg_model, bgbbbgext_model, bgext_model
-from lifetimes.formulas import gamma_ratio
-from functools import reduce
+from lifetimes.formulas import gamma_ratio, LogBetaTable
 __all__ = ['BetaGeoFitter', 'ParetoNBDFitter', 'GammaGammaFitter', 'ModifiedBetaGeoFitter']
 
 B = special.beta
@@ -42,30 +45,149 @@ class BaseFitter(object):
             s += "%s: %.2f, " % (p, value)
         return s.strip(', ')
 
+    @classmethod
+    def _batch_negative_log_likelihood(cls, params, *args, **kwargs):
+        """
+        Negative log-likelihood of many parameter vectors, evaluated in a single vectorized pass over the data.
+        The fitters implement _batch_negative_log_likelihood_values, with the arguments of _negative_log_likelihood
+        (without jac), and _batch_in_domain if their parameters are not all positive.
+
+        Parameters:
+            params: array of shape (K, number of parameters), one parameter vector per row, in the order of
+                _negative_log_likelihood.
+            args, kwargs: the data, penalizer_coef and N arguments of _negative_log_likelihood.
+
+        Returns:
+            an array with the K negative log-likelihoods (inf for parameters outside of the domain)
+        """
+        params = np.atleast_2d(asarray(params, dtype=float))
+        with np.errstate(all='ignore'):
+            ll = cls._batch_negative_log_likelihood_values(params, *args, **kwargs)
+        ll[~cls._batch_in_domain(params)] = np.inf
+        return ll
+
+    @staticmethod
+    def _batch_in_domain(params):
+        return npall(params > 0., axis=1)
+
+    @staticmethod
+    def _batch_penalized_sum(llj, params, penalizer_coef=0, N=None):
+        """
+        Negative sum over the customers of the log-likelihoods llj, of shape (customers, K), weighted by N, plus the
+        penalizer term of every parameter vector.
+        """
+        if N is not None:
+            llj = llj * asarray(N)[:, None]
+        return -llj.sum(axis=0) + penalizer_coef * log(params).sum(axis=1)
+
+
+class _ContinuousTimeFitter(BaseFitter):
+    """
+    Base class of the continuous-time fitters, whose customers are described by frequency, recency and T, with the
+    predictions on the grid of frequencies and recencies.
+    """
+
+    def conditional_probability_alive_matrix(self, max_frequency=None, max_recency=None):
+        """
+        Compute the probability alive matrix
+        Parameters:
+            max_frequency: the maximum frequency to plot. Default is max observed frequency.
+            max_recency: the maximum recency to plot. This also determines the age of the customer.
+                Default to max observed age.
+
+        Returns a matrix of the form [t_x: historical recency, x: historical frequency]
+
+        """
+
+        max_frequency = max_frequency or int(self.data['frequency'].max())
+        max_recency = max_recency or int(self.data['T'].max())
+
+        # a column of recencies against a row of frequencies, broadcast to the whole grid in one call
+        recency, frequency = np.ogrid[:max_recency + 1, :max_frequency + 1]
+        return self.conditional_probability_alive(frequency, recency, max_recency)
+
+    def conditional_expected_purchases_matrix(self, t, max_frequency=None, max_recency=None, T=None):
+        """
+        Compute the expected number of repeat purchases up to time t on the grid of frequencies and recencies
+        Parameters:
+            t: a scalar or array of times.
+            max_frequency: the maximum frequency. Default is max observed frequency.
+            max_recency: the maximum recency. Default to max observed age.
+            T: the age of the customers. Default to max_recency.
+
+        Returns a matrix of the form [t_x: historical recency, x: historical frequency], or, if t is an array, an
+        array of the form [t, t_x, x]
+        """
+        max_frequency = max_frequency or int(self.data['frequency'].max())
+        max_recency = max_recency or int(self.data['T'].max())
+        T = max_recency if T is None else T
+
+        # the times on the first axis, a column of recencies against a row of frequencies on the last two
+        t = asarray(t, dtype=float)[..., None, None]
+        recency, frequency = np.ogrid[:max_recency + 1, :max_frequency + 1]
+        return self.conditional_expected_number_of_purchases_up_to_time(t, frequency, recency, T)
+
 
 class GammaGammaFitter(BaseFitter):
     def __init__(self, penalizer_coef=0.):
         self.penalizer_coef = penalizer_coef
 
     @staticmethod
-    def _negative_log_likelihood(params, frequency, avg_monetary_value, penalizer_coef=0):
+    def _negative_log_likelihood(params, frequency, avg_monetary_value, penalizer_coef=0, N=None, jac=False):
         if any(i < 0 for i in params):
+            if jac:
+                return np.inf, np.zeros(3)
             return np.inf
 
         p, q, v = params
 
-        x = frequency
-        m = avg_monetary_value
+        x = asarray(frequency, dtype=float)
+        m = asarray(avg_monetary_value, dtype=float)
+        # customers without repeated purchases carry no monetary information, their (nan) terms are skipped
+        returning = x > 0
 
-        negative_log_likelihood_values = special.gammaln(p * x + q) - special.gammaln(p * x) - special.gammaln(q) \
-                                         + q * np.log(v) + (p * x - 1) * np.log(m) + (p * x) * np.log(x) - (
-                                                                                                               p * x + q) * np.log(
-            x * m + v)
+        with np.errstate(all='ignore'):
+            negative_log_likelihood_values = special.gammaln(p * x + q) - special.gammaln(p * x) - \
+                special.gammaln(q) + q * np.log(v) + (p * x - 1) * np.log(m) + (p * x) * np.log(x) - \
+                (p * x + q) * np.log(x * m + v)
+        negative_log_likelihood_values = np.where(returning, negative_log_likelihood_values, 0.)
+
+        weights = 1. if N is None else asarray(N)
+        negative_log_likelihood_values = weights * negative_log_likelihood_values
 
         penalizer_term = penalizer_coef * log(params).sum()
         negative_log_likelihood = -np.sum(negative_log_likelihood_values) + penalizer_term
 
-        return negative_log_likelihood
+        if jac is False:
+            return negative_log_likelihood
+
+        with np.errstate(all='ignore'):
+            dll_dp = x * (special.psi(p * x + q) - special.psi(p * x) + np.log(m) + np.log(x) - np.log(x * m + v))
+            dll_dq = special.psi(p * x + q) - special.psi(q) + np.log(v) - np.log(x * m + v)
+            dll_dv = q / v - (p * x + q) / (x * m + v)
+        dll_dp, dll_dq, dll_dv = [np.where(returning, d, 0.) for d in (dll_dp, dll_dq, dll_dv)]
+
+        d_penalizer_term = penalizer_coef / asarray(params, dtype=float)
+        d_negative_log_likelihood = -np.array([np.sum(weights * dll_dp), np.sum(weights * dll_dq),
+                                               np.sum(weights * dll_dv)]) + d_penalizer_term
+
+        return negative_log_likelihood, d_negative_log_likelihood
+
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, avg_monetary_value, penalizer_coef=0, N=None):
+        p, q, v = params.T
+        x = asarray(frequency, dtype=float)[..., None]
+        m = asarray(avg_monetary_value, dtype=float)[..., None]
+
+        log_likelihood_values = special.gammaln(p * x + q) - special.gammaln(p * x) - special.gammaln(q) + \
+            q * np.log(v) + (p * x - 1) * np.log(m) + (p * x) * np.log(x) - (p * x + q) * np.log(x * m + v)
+        # customers without repeated purchases carry no monetary information
+        log_likelihood_values = np.where(x > 0, log_likelihood_values, 0.)
+        return GammaGammaFitter._batch_penalized_sum(log_likelihood_values, params, penalizer_coef, N)
+
+    @staticmethod
+    def _batch_in_domain(params):
+        return npall(params >= 0., axis=1)
 
     def conditional_expected_average_profit(self, frequency=None, monetary_value=None):
         """
@@ -84,12 +206,12 @@ class GammaGammaFitter(BaseFitter):
         p, q, v = self._unload_params('p', 'q', 'v')
         return (((q - 1) / (p * x + q - 1)) * (v * p / (q - 1))) + (p * x / (p * x + q - 1)) * m
 
-    def fit(self, frequency, monetary_value, iterative_fitting=5, initial_params=None, verbose=False, N=None):
+    def fit(self, frequency, monetary_value, iterative_fitting=5, initial_params=None, verbose=False, N=None,
+            jac=False, **fit_options):
         """
         This methods fits the data to the Gamma/Gamma model.
 
         Parameters:
-            N:
             frequency: the frequency vector of customers' purchases (denoted x in literature).
             monetary_value: the monetary value vector of customer's purchases (denoted m in literature).
             iterative_fitting: perform `iterative_fitting` additional fits to find the best
@@ -97,16 +219,17 @@ class GammaGammaFitter(BaseFitter):
                 hurt estimates. This model is not very stable so we suggest >10 for best estimates evaluation.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same frequency,
+                monetary_value
+            jac: if true, the analytic gradient of the likelihood is used with a gradient based minimizer.
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
 
         Returns:
             self, fitted and with parameters estimated
         """
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, monetary_value, self.penalizer_coef],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      3,
-                                                      verbose)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood, [frequency, monetary_value, self.penalizer_coef, N, jac],
+            iterative_fitting, initial_params, 3, verbose, jac, full_output=True, **fit_options)
 
         self.data = DataFrame(vconcat[frequency, monetary_value], columns=['frequency', 'monetary_value'])
         self.params_ = OrderedDict(zip(['p', 'q', 'v'], params))
@@ -135,11 +258,12 @@ class GammaGammaFitter(BaseFitter):
                                        time, discount_rate)
 
 
-class ParetoNBDFitter(BaseFitter):
+class ParetoNBDFitter(_ContinuousTimeFitter):
     def __init__(self, penalizer_coef=0.):
         self.penalizer_coef = penalizer_coef
 
-    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None):
+    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None,
+            jac=False, **fit_options):
         """
         This methods fits the data to the Pareto/NBD model.
 
@@ -152,6 +276,9 @@ class ParetoNBDFitter(BaseFitter):
                 hurt estimates.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency, T
+            jac: if true, the gradient of the likelihood is used with a gradient based minimizer.
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
 
         Returns:
             self, with additional properties and methods like params_ and plot
@@ -162,26 +289,33 @@ class ParetoNBDFitter(BaseFitter):
         T = asarray(T)
         _check_inputs(frequency, recency, T)
 
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, recency, T, self.penalizer_coef],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      4,
-                                                      verbose)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood, [frequency, recency, T, self.penalizer_coef, N, jac],
+            iterative_fitting, initial_params, 4, verbose, jac, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['r', 'alpha', 's', 'beta'], params))
         self.data = DataFrame(vconcat[frequency, recency, T], columns=['frequency', 'recency', 'T'])
-        self.generate_new_data = lambda size=1: pareto_nbd_model(T, *params, size=size)
+        gen_t = _expand_ages(T, N)  # compressed data are expanded to one age per customer
+        self.generate_new_data = lambda size=1, ts=gen_t, random_state=None: pareto_nbd_model(
+            ts, *params, size=size, random_state=random_state)
 
         self.predict = self.conditional_expected_number_of_purchases_up_to_time
         return self
 
     @staticmethod
     def _log_A_0(params, frequency, recency, age):
+        """
+        The parameters can be scalars or arrays broadcastable against the data, e.g. vectors of K values
+        against data with a trailing axis of length one.
+        """
 
         r, alpha, s, beta = params
+        frequency, recency, age = [asarray(v, dtype=float) for v in (frequency, recency, age)]
 
-        min_of_alpha_beta, max_of_alpha_beta, t = (alpha, beta, r + frequency) if alpha < beta else (beta, alpha, s + 1)
+        alpha_less_than_beta = alpha < beta
+        min_of_alpha_beta = np.where(alpha_less_than_beta, alpha, beta)
+        max_of_alpha_beta = np.where(alpha_less_than_beta, beta, alpha)
+        t = np.where(alpha_less_than_beta, r + frequency, s + 1)
         abs_alpha_beta = max_of_alpha_beta - min_of_alpha_beta
 
         rsf = r + s + frequency
@@ -190,22 +324,45 @@ class ParetoNBDFitter(BaseFitter):
         p_2, q_2 = special.hyp2f1(rsf, t, rsf + 1., abs_alpha_beta / (max_of_alpha_beta + age)), (
             max_of_alpha_beta + age)
 
-        try:
-            size = len(frequency)
-            sign = np.ones(size)
-        except TypeError:
-            sign = 1
+        # A_0 is the difference of the two terms below, the first one is never the smaller
+        log_term_1 = log(p_1) + rsf * log(q_2)
+        log_term_2 = log(p_2) + rsf * log(q_1)
+        with np.errstate(divide='ignore'):
+            return log_term_1 + log(-np.expm1(log_term_2 - log_term_1)) - rsf * log(q_1 * q_2)
 
-        return misc.logsumexp([log(p_1) + rsf * log(q_2), log(p_2) + rsf * log(q_1)], axis=0, b=[sign, -sign]) \
-               - rsf * log(q_1 * q_2)
+    @staticmethod
+    def _d_log_A_0(params, frequency, recency, age):
+        """
+        Gradient of _log_A_0 with respect to the parameters (r, alpha, s, beta).
+
+        The derivatives of the hypergeometric function with respect to its parameters have no closed form,
+        so they are computed with central differences.
+
+        Returns:
+            an array of shape (4,) + shape of frequency
+        """
+        params = asarray(params, dtype=float)
+        d_log_A_0 = []
+        for i in range(len(params)):
+            h = 1e-5 * max(params[i], 1.)
+            h = min(h, params[i] / 2.)
+            step = np.zeros(len(params))
+            step[i] = h
+            log_A_0_up = ParetoNBDFitter._log_A_0(params + step, frequency, recency, age)
+            log_A_0_down = ParetoNBDFitter._log_A_0(params - step, frequency, recency, age)
+            d_log_A_0.append((log_A_0_up - log_A_0_down) / (2 * h))
+        return np.array(d_log_A_0)
 
     @staticmethod
-    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef):
+    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef, N=None, jac=False):
 
         if npany(asarray(params) <= 0.):
+            if jac:
+                return np.inf, np.zeros(4)
             return np.inf
 
         r, alpha, s, beta = params
+        frequency, recency, T = [asarray(v, dtype=float) for v in (frequency, recency, T)]
         x = frequency
 
         r_s_x = r + s + x
@@ -213,10 +370,44 @@ class ParetoNBDFitter(BaseFitter):
         A_1 = special.gammaln(r + x) - special.gammaln(r) + r * log(alpha) + s * log(beta)
         log_A_0 = ParetoNBDFitter._log_A_0(params, frequency, recency, T)
 
-        A_2 = logaddexp(-(r + x) * log(alpha + T) - s * log(beta + T), log(s) + log_A_0 - log(r_s_x))
+        B_1 = -(r + x) * log(alpha + T) - s * log(beta + T)
+        B_2 = log(s) + log_A_0 - log(r_s_x)
+        A_2 = logaddexp(B_1, B_2)
 
+        weights = 1. if N is None else asarray(N)
         penalizer_term = penalizer_coef * log(params).sum()
-        return -(A_1 + A_2).sum() + penalizer_term
+        ll = -(weights * (A_1 + A_2)).sum() + penalizer_term
+
+        if jac is False:
+            return ll
+
+        # A_2 = log(exp(B_1) + exp(B_2)), so its derivatives are the ones of B_1 and B_2 weighted by their shares
+        w_1 = exp(B_1 - A_2)
+        w_2 = exp(B_2 - A_2)
+        # A_0 vanishes when recency == T, its (undefined) derivatives are then weighted by w_2 = 0
+        d_log_A_0 = np.where(isinf(log_A_0), 0., ParetoNBDFitter._d_log_A_0(params, frequency, recency, T))
+
+        dll_dr = special.psi(r + x) - special.psi(r) + log(alpha) - w_1 * log(alpha + T) + \
+            w_2 * (d_log_A_0[0] - 1. / r_s_x)
+        dll_dalpha = r / alpha - w_1 * (r + x) / (alpha + T) + w_2 * d_log_A_0[1]
+        dll_ds = log(beta) - w_1 * log(beta + T) + w_2 * (1. / s + d_log_A_0[2] - 1. / r_s_x)
+        dll_dbeta = s / beta - w_1 * s / (beta + T) + w_2 * d_log_A_0[3]
+
+        d_penalizer_term = penalizer_coef / asarray(params, dtype=float)
+        d_ll = -np.array([np.sum(weights * dll_dr), np.sum(weights * dll_dalpha), np.sum(weights * dll_ds),
+                          np.sum(weights * dll_dbeta)]) + d_penalizer_term
+
+        return ll, d_ll
+
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, penalizer_coef=0, N=None):
+        r, alpha, s, beta = params.T
+        x, t_x, T = [asarray(v, dtype=float)[..., None] for v in (frequency, recency, T)]
+
+        A_1 = special.gammaln(r + x) - special.gammaln(r) + r * log(alpha) + s * log(beta)
+        log_A_0 = ParetoNBDFitter._log_A_0((r, alpha, s, beta), x, t_x, T)
+        A_2 = logaddexp(-(r + x) * log(alpha + T) - s * log(beta + T), log(s) + log_A_0 - log(r + s + x))
+        return ParetoNBDFitter._batch_penalized_sum(A_1 + A_2, params, penalizer_coef, N)
 
     def conditional_probability_alive(self, frequency, recency, T):
         """
@@ -224,11 +415,11 @@ class ParetoNBDFitter(BaseFitter):
         alive. From http://brucehardie.com/notes/009/pareto_nbd_derivations_2005-11-05.pdf
 
         Parameters:
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
 
-        Returns: a scalar value representing a probability
+        Returns: a scalar value representing a probability, or an array broadcast over the customers
         """
         x, t_x = frequency, recency
         r, alpha, s, beta = self._unload_params('r', 'alpha', 's', 'beta')
@@ -236,28 +427,6 @@ class ParetoNBDFitter(BaseFitter):
         A_0 = np.exp(self._log_A_0([r, alpha, s, beta], x, t_x, T))
         return 1. / (1. + (s / (r + s + x)) * (alpha + T) ** (r + x) * (beta + T) ** s * A_0)
 
-    def conditional_probability_alive_matrix(self, max_frequency=None, max_recency=None):
-        """
-        Compute the probability alive matrix
-        Parameters:
-            max_frequency: the maximum frequency to plot. Default is max observed frequency.
-            max_recency: the maximum recency to plot. This also determines the age of the customer.
-                Default to max observed age.
-
-        Returns a matrix of the form [t_x: historical recency, x: historical frequency]
-
-        """
-
-        max_frequency = max_frequency or int(self.data['frequency'].max())
-        max_recency = max_recency or int(self.data['T'].max())
-
-        Z = np.zeros((max_recency + 1, max_frequency + 1))
-        for i, recency in enumerate(np.arange(max_recency + 1)):
-            for j, frequency in enumerate(np.arange(max_frequency + 1)):
-                Z[i, j] = self.conditional_probability_alive(frequency, recency, max_recency)
-
-        return Z
-
     def conditional_expected_number_of_purchases_up_to_time(self, t, frequency, recency, T):
         """
         Calculate the expected number of repeat purchases up to time t for a randomly choose individual from
@@ -265,22 +434,19 @@ class ParetoNBDFitter(BaseFitter):
 
         Parameters:
             t: a scalar or array of times.
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
 
-        Returns: a scalar or array
+        Returns: a scalar or array, broadcast over the times and the customers
         """
         x, t_x = frequency, recency
-        params = self._unload_params('r', 'alpha', 's', 'beta')
-        r, alpha, s, beta = params
+        r, alpha, s, beta = self._unload_params('r', 'alpha', 's', 'beta')
 
-        likelihood = exp(-self._negative_log_likelihood(params, x, t_x, T, 0))
-        first_term = (special.gamma(r + x) / special.gamma(r)) * (alpha ** r * beta ** s) / (alpha + T) ** (r + x) / (
-                                                                                                                         beta + T) ** s
+        # the first term of the likelihood, divided by the likelihood of every customer, is the probability alive
         second_term = (r + x) * (beta + T) / (alpha + T) / (s - 1)
         third_term = 1 - ((beta + T) / (beta + T + t)) ** (s - 1)
-        return first_term * second_term * third_term / likelihood
+        return second_term * third_term * self.conditional_probability_alive(x, t_x, T)
 
     def expected_number_of_purchases_up_to_time(self, t):
         """
@@ -311,27 +477,27 @@ class ParetoNBDFitter(BaseFitter):
             t: a scalar or array of times.
             C: covariance matrix of parameters 'r', 'alpha', 's', 'beta'
 
-        Returns: a scalar
+        Returns: a scalar or array
         """
-        if len(C) != 4 or len(C[0]) != 4:
-            raise ValueError("Covariance matrix: wrong dimensions. Must be 4x4 symmetric.")
-
         r, alpha, s, beta = self._unload_params('r', 'alpha', 's', 'beta')
-        E = self.expected_number_of_purchases_up_to_time(t)
+        return ParetoNBDFitter.static_expected_number_of_purchases_up_to_time_error(r, alpha, s, beta, t, C)
+
+    @staticmethod
+    def static_expected_number_of_purchases_up_to_time_error(r, a, s, b, t, C):
+        alpha, beta = a, b
+        t = asarray(t, dtype=float)
+        E = ParetoNBDFitter.static_expected_number_of_purchases_up_to_time(r, alpha, s, beta, t)
+        ratio = beta / (beta + t)
+
         dEdr = E / r
         dEdalpha = E * (-1.0 / alpha)
-        dEds = -E / (s - 1) + (r * beta) / (alpha * (s - 1)) * (
-            -math.log(beta / (beta + t)) * (beta / (beta + t)) ** (s - 1))
-        dEdbeta = E / beta + (r * beta) / (alpha * (s - 1)) * (
-            (1 - s) * (beta / (beta + t)) ** (s - 2) * t / (beta + t) ** 2)
-
-        Cov = np.matrix(C)
-        dE = np.array([[dEdr], [dEdalpha], [dEds], [dEdbeta]])
+        dEds = -E / (s - 1) + (r * beta) / (alpha * (s - 1)) * (-log(ratio) * ratio ** (s - 1))
+        dEdbeta = E / beta + (r * beta) / (alpha * (s - 1)) * ((1 - s) * ratio ** (s - 2) * t / (beta + t) ** 2)
 
-        return math.sqrt(float(dE.transpose() * Cov * dE))
+        return delta_method_errors([dEdr, dEdalpha, dEds, dEdbeta], C)
 
 
-class BetaGeoFitter(BaseFitter):
+class BetaGeoFitter(_ContinuousTimeFitter):
     """
 
     Also known as the BG/NBD model. Based on [1], this model has the following assumptions:
@@ -350,7 +516,8 @@ class BetaGeoFitter(BaseFitter):
     def __init__(self, penalizer_coef=0.):
         self.penalizer_coef = penalizer_coef
 
-    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None):
+    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None,
+            jac=False, **fit_options):
         """
         This methods fits the data to the BG/NBD model.
 
@@ -363,6 +530,9 @@ class BetaGeoFitter(BaseFitter):
                 hurt estimates.
             initial_params: set the initial parameters for the fitter.
             verbose: set to true to print out convergence diagnostics.
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency, T
+            jac: if true, the analytic gradient of the likelihood is used with a gradient based minimizer.
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
 
 
         Returns:
@@ -378,27 +548,26 @@ class BetaGeoFitter(BaseFitter):
         scaled_recency = recency * self._scale
         scaled_T = T * self._scale
 
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, scaled_recency, scaled_T, self.penalizer_coef],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      4,
-                                                      verbose)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood, [frequency, scaled_recency, scaled_T, self.penalizer_coef, N, jac],
+            iterative_fitting, initial_params, 4, verbose, jac, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['r', 'alpha', 'a', 'b'], params))
         self.params_['alpha'] /= self._scale
 
         self.data = DataFrame(vconcat[frequency, recency, T], columns=['frequency', 'recency', 'T'])
-        self.generate_new_data = lambda size=1: beta_geometric_nbd_model(T,
-                                                                         *self._unload_params('r', 'alpha', 'a', 'b'),
-                                                                         size=size)
+        gen_t = _expand_ages(T, N)  # compressed data are expanded to one age per customer
+        self.generate_new_data = lambda size=1, ts=gen_t, random_state=None: beta_geometric_nbd_model(
+            ts, *self._unload_params('r', 'alpha', 'a', 'b'), size=size, random_state=random_state)
 
         self.predict = self.conditional_expected_number_of_purchases_up_to_time
         return self
 
     @staticmethod
-    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef):
+    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef, N=None, jac=False):
         if npany(asarray(params) <= 0):
+            if jac:
+                return np.inf, np.zeros(4)
             return np.inf
 
         r, alpha, a, b = params
@@ -410,8 +579,42 @@ class BetaGeoFitter(BaseFitter):
         d = vconcat[ones_like(frequency), (frequency > 0)]
         A_4 = log(a) - log(b + frequency - 1) - (r + frequency) * log(recency + alpha)
         A_4[isnan(A_4) | isinf(A_4)] = 0
+        A_34 = logsumexp(vconcat[A_3, A_4], axis=1, b=d)
         penalizer_term = penalizer_coef * log(params).sum()
-        return -(A_1 + A_2 + misc.logsumexp(vconcat[A_3, A_4], axis=1, b=d)).sum() + penalizer_term
+        weights = 1. if N is None else asarray(N)
+        ll = -(weights * (A_1 + A_2 + A_34)).sum() + penalizer_term
+
+        if jac is False:
+            return ll
+
+        # shares of the two terms of the logsumexp, the second one only exists for customers with repeat purchases
+        x = frequency
+        w_3 = exp(A_3 - A_34)
+        w_4 = (x > 0) * exp(A_4 - A_34)
+        b_x_1 = np.where(x > 0, b + x - 1, 1.)
+
+        dll_dr = special.psi(r + x) - special.psi(r) + log(alpha) - w_3 * log(alpha + T) - w_4 * log(recency + alpha)
+        dll_dalpha = r / alpha - w_3 * (r + x) / (alpha + T) - w_4 * (r + x) / (recency + alpha)
+        dll_da = special.psi(a + b) - special.psi(a + b + x) + w_4 / a
+        dll_db = special.psi(a + b) + special.psi(b + x) - special.psi(b) - special.psi(a + b + x) - w_4 / b_x_1
+
+        d_penalizer_term = penalizer_coef / asarray(params, dtype=float)
+        d_ll = -np.array([np.sum(weights * dll_dr), np.sum(weights * dll_dalpha), np.sum(weights * dll_da),
+                          np.sum(weights * dll_db)]) + d_penalizer_term
+
+        return ll, d_ll
+
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, penalizer_coef=0, N=None):
+        r, alpha, a, b = params.T
+        x, t_x, T = [asarray(v, dtype=float)[..., None] for v in (frequency, recency, T)]
+
+        A_1 = special.gammaln(r + x) - special.gammaln(r) + r * log(alpha)
+        A_2 = special.gammaln(a + b) + special.gammaln(b + x) - special.gammaln(b) - special.gammaln(a + b + x)
+        A_3 = -(r + x) * log(alpha + T)
+        # the second term only exists for customers with repeat purchases
+        A_4 = np.where(x > 0, log(a) - log(b + x - 1) - (r + x) * log(t_x + alpha), -np.inf)
+        return BetaGeoFitter._batch_penalized_sum(A_1 + A_2 + logaddexp(A_3, A_4), params, penalizer_coef, N)
 
     def expected_number_of_purchases_up_to_time(self, t):
         """
@@ -434,9 +637,9 @@ class BetaGeoFitter(BaseFitter):
 
         Parameters:
             t: a scalar or array of times.
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
 
         Returns: a scalar or array
         """
@@ -458,39 +661,17 @@ class BetaGeoFitter(BaseFitter):
         alive. From http://www.brucehardie.com/notes/021/palive_for_BGNBD.pdf
 
         Parameters:
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
 
-        Returns: a scalar
+        Returns: a scalar or array
 
         """
         r, alpha, a, b = self._unload_params('r', 'alpha', 'a', 'b')
         return 1. / (
             1 + (frequency > 0) * (a / (b + frequency - 1)) * ((alpha + T) / (alpha + recency)) ** (r + frequency))
 
-    def conditional_probability_alive_matrix(self, max_frequency=None, max_recency=None):
-        """
-        Compute the probability alive matrix
-        Parameters:
-            max_frequency: the maximum frequency to plot. Default is max observed frequency.
-            max_recency: the maximum recency to plot. This also determines the age of the customer.
-                Default to max observed age.
-
-        Returns a matrix of the form [t_x: historical recency, x: historical frequency]
-
-        """
-
-        max_frequency = max_frequency or int(self.data['frequency'].max())
-        max_recency = max_recency or int(self.data['T'].max())
-
-        Z = np.zeros((max_recency + 1, max_frequency + 1))
-        for i, t_x in enumerate(np.arange(max_recency + 1)):
-            for j, x in enumerate(np.arange(max_frequency + 1)):
-                Z[i, j] = self.conditional_probability_alive(x, t_x, max_recency)
-
-        return Z
-
     def probability_of_n_purchases_up_to_time(self, t, n):
         """
         Compute the probability of
@@ -533,7 +714,8 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
     def __init__(self, penalizer_coef=0.):
         super(self.__class__, self).__init__(penalizer_coef)
 
-    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None):
+    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None,
+            jac=False, **fit_options):
         """
         This methods fits the data to the MBG/NBD model.
         Parameters:
@@ -545,19 +727,25 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
                 hurt estimates.
             initial_params: set the initial parameters for the fitter.
             verbose: set to true to print out convergence diagnostics.
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency, T
+            jac: if true, the analytic gradient of the likelihood is used with a gradient based minimizer.
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
         Returns:
             self, with additional properties and methods like params_ and predict
         """
         super(self.__class__, self).fit(frequency, recency, T, iterative_fitting, initial_params,
-                                        verbose)  # although the partent method is called, this class's _negative_log_likelihood is referenced
-        self.generate_new_data = lambda size=1: modified_beta_geometric_nbd_model(T, *self._unload_params('r', 'alpha',
-                                                                                                          'a', 'b'),
-                                                                                  size=size)  # this needs to be reassigned from the parent method
+                                        verbose, N=N, jac=jac, **fit_options)  # although the partent method is called, this class's _negative_log_likelihood is referenced
+        gen_t = _expand_ages(T, N)
+        self.generate_new_data = lambda size=1, ts=gen_t, random_state=None: modified_beta_geometric_nbd_model(
+            ts, *self._unload_params('r', 'alpha', 'a', 'b'), size=size,
+            random_state=random_state)  # this needs to be reassigned from the parent method
         return self
 
     @staticmethod
-    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef):
+    def _negative_log_likelihood(params, frequency, recency, T, penalizer_coef, N=None, jac=False):
         if npany(asarray(params) <= 0):
+            if jac:
+                return np.inf, np.zeros(4)
             return np.inf
 
         r, alpha, a, b = params
@@ -569,7 +757,41 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
         A_4 = log(a) - log(b + frequency) + (r + frequency) * (log(alpha + T) - log(alpha + recency))
 
         penalizer_term = penalizer_coef * log(params).sum()
-        return -(A_1 + A_2 + A_3 + log(exp(A_4) + 1.)).sum() + penalizer_term
+        weights = 1. if N is None else asarray(N)
+        ll = -(weights * (A_1 + A_2 + A_3 + log(exp(A_4) + 1.))).sum() + penalizer_term
+
+        if jac is False:
+            return ll
+
+        # derivative of log(exp(A_4) + 1) with respect to A_4
+        x = frequency
+        w_4 = special.expit(A_4)
+
+        dll_dr = special.psi(r + x) - special.psi(r) + log(alpha) - log(alpha + T) + \
+            w_4 * (log(alpha + T) - log(alpha + recency))
+        dll_dalpha = r / alpha - (r + x) / (alpha + T) + w_4 * (r + x) * (1. / (alpha + T) - 1. / (alpha + recency))
+        dll_da = special.psi(a + b) - special.psi(a + b + x + 1) + w_4 / a
+        dll_db = special.psi(a + b) + special.psi(b + x + 1) - special.psi(b) - special.psi(a + b + x + 1) - \
+            w_4 / (b + x)
+
+        d_penalizer_term = penalizer_coef / asarray(params, dtype=float)
+        d_ll = -np.array([np.sum(weights * dll_dr), np.sum(weights * dll_dalpha), np.sum(weights * dll_da),
+                          np.sum(weights * dll_db)]) + d_penalizer_term
+
+        return ll, d_ll
+
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, penalizer_coef=0, N=None):
+        r, alpha, a, b = params.T
+        x, t_x, T = [asarray(v, dtype=float)[..., None] for v in (frequency, recency, T)]
+
+        A_1 = special.gammaln(r + x) - special.gammaln(r) + r * log(alpha)
+        A_2 = special.gammaln(a + b) + special.gammaln(b + x + 1) - special.gammaln(b) - special.gammaln(
+            a + b + x + 1)
+        A_3 = -(r + x) * log(alpha + T)
+        A_4 = log(a) - log(b + x) + (r + x) * (log(alpha + T) - log(alpha + t_x))
+        return ModifiedBetaGeoFitter._batch_penalized_sum(A_1 + A_2 + A_3 + log(exp(A_4) + 1.), params,
+                                                          penalizer_coef, N)
 
     def expected_number_of_purchases_up_to_time(self, t):
         """
@@ -590,9 +812,9 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
         See Wagner, U. and Hoppe D. (2008).
         Parameters:
             t: a scalar or array of times.
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
         Returns: a scalar or array
         """
         x = frequency
@@ -612,10 +834,10 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
         Compute the probability that a customer with history (frequency, recency, T) is currently
         alive. From http://www.brucehardie.com/notes/021/palive_for_BGNBD.pdf
         Parameters:
-            frequency: a scalar: historical frequency of customer.
-            recency: a scalar: historical recency of customer.
-            T: a scalar: age of the customer.
-        Returns: a scalar
+            frequency: a scalar or array: historical frequency of customer.
+            recency: a scalar or array: historical recency of customer.
+            T: a scalar or array: age of the customer.
+        Returns: a scalar or array
         """
         r, alpha, a, b = self._unload_params('r', 'alpha', 'a', 'b')
         return 1. / (1 + (a / (b + frequency)) * ((alpha + T) / (alpha + recency)) ** (r + frequency))
@@ -650,6 +872,73 @@ class ModifiedBetaGeoFitter(BetaGeoFitter):
         return first_term + second_term
 
 
+def _bgbb_log_tail_sums(log_table, x_index, recency, T):
+    """
+    Evaluates, in log space, the sums over m = t_x..T-1 of a table f(x, m) for every customer.
+
+    The reverse cumulative sums of the table along m are computed once with np.logaddexp, so each customer's
+    sum is the difference of two of them: sum_{m=t_x}^{T-1} f(x, m) = R(x, t_x) - R(x, T).
+
+    Parameters:
+        log_table: array of shape (number of distinct x, max(T) + 1) containing log f(x, m).
+        x_index: for every customer, the row of the table corresponding to the customer's frequency.
+        recency: integer array of customers' recencies (t_x).
+        T: integer array of customers' ages.
+
+    Returns:
+        an array with the log of the sum for every customer (-inf for empty sums)
+    """
+    log_reverse_cumsum = np.logaddexp.accumulate(log_table[:, ::-1], axis=1)[:, ::-1]
+    log_R_tx = log_reverse_cumsum[x_index, recency]
+    log_R_T = log_reverse_cumsum[x_index, T]
+    with np.errstate(divide='ignore'):
+        return log_R_tx + np.log1p(-exp(log_R_T - log_R_tx))
+
+
+def _bgbb_log_likelihood_terms(a, b, g, d, x, tx, T):
+    """
+    Evaluates the terms of the BG/BB likelihood in log space.
+
+    The parameters are scalars, or vectors of K values (one per parameter vector of a batch): in that case all
+    the returned arrays but x_index have an additional last axis of length K.
+
+    Parameters:
+        a, b, g, d: the parameters of the model.
+        x: integer array of customers' frequencies.
+        tx: integer array of customers' recencies.
+        T: integer array of customers' ages.
+
+    Returns:
+        a tuple with
+        the log of the numerator of every customer's likelihood,
+        the log of the denominator log(B(a, b) B(g, d)),
+        log(B(a + x, b + T - x) B(g, d + T)) for every customer,
+        the table of log(B(a + x, b + m - x) B(g + 1, d + m)) for every distinct x (rows) and every m <= max(T)
+        (columns), -inf for m < x,
+        the row of the table corresponding to every customer
+    """
+    # all the Beta functions are evaluated at the parameters shifted by at most max(T) + 1 periods
+    log_B_ab = LogBetaTable(a, b, T.max() + 2)
+    log_B_gd = LogBetaTable(g, d, T.max() + 2)
+
+    log_denominator = log_B_ab(0, 0) + log_B_gd(0, 0)
+
+    # the terms B(a + x, b + tx - x + i) * B(g + 1, d + tx + i) of the inner sums only depend on x and
+    # m = tx + i, so they are tabulated once for every distinct x and every m <= max(T)
+    xs, x_index = np.unique(x, return_inverse=True)
+    xm = xs[:, None]
+    m = np.arange(T.max() + 1)[None, :]
+    valid = m >= xm
+    log_BmBm = log_B_ab(xm, np.where(valid, m - xm, 0)) + log_B_gd(1, m)
+    log_BmBm[~valid] = -np.inf
+
+    # everything is kept in log space: for long horizons the Beta products underflow
+    log_BjBj = log_B_ab(x, T - x) + log_B_gd(0, T)
+    log_numerator = np.logaddexp(log_BjBj, _bgbb_log_tail_sums(log_BmBm, x_index, tx, T))
+
+    return log_numerator, log_denominator, log_BjBj, log_BmBm, x_index
+
+
 class BGBBFitter(BaseFitter):
     """
     BG/BB discrete time model.
@@ -687,33 +976,13 @@ class BGBBFitter(BaseFitter):
             return np.inf
 
         a, b, g, d = params
-        x = frequency
-        tx = recency
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+        tx = np.atleast_1d(asarray(recency)).astype(int)
+        T = np.atleast_1d(asarray(T)).astype(int)
 
-        denominator = special.beta(a, b) * special.beta(g, d)
-
-        if isinstance(x, float) or isinstance(x, int):
-            # x is a single number
-            numerator = special.beta(a + x, b + T - x) * special.beta(g, d + T)
-            numerator += np.sum(
-                [special.beta(a + x, b + tx - x + i) * special.beta(g + 1, d + tx + i) for i in
-                 range(int(T - tx - 1 + 1))])
-        else:
-            # x is a vector
-            x = np.array(x)
-            tx = np.array(tx)
-            T = np.array(T)
-            numerator = special.beta(a + x, b + T - x) * special.beta(g, d + T)
-
-            max_i = (T - tx - 1).astype(int)
-            for j in range(len(max_i)):
-                xj = x[j]
-                txj = tx[j]
-                i = np.arange(max_i[j] + 1)  # all indexes
-                numerator[j] += np.sum(special.beta(a + xj, b + txj - xj + i) * special.beta(g + 1, d + txj + i))
-
-        Lj = numerator / denominator
-        llj = np.log(Lj)  # this converts the terms in a no object on which you can call sum()
+        log_numerator, log_denominator, log_BjBj, log_BmBm, x_index = _bgbb_log_likelihood_terms(a, b, g, d,
+                                                                                                 x, tx, T)
+        llj = log_numerator - log_denominator
         penalizer_term = penalizer_coef * log(params).sum()
 
         if N is not None:
@@ -724,7 +993,7 @@ class BGBBFitter(BaseFitter):
         if jac is False:
             return ll + penalizer_term
         else:
-            # calculate the gradient
+            # calculate the gradient of log(Lj) = log(numerator) - log(denominator)
 
             first_terms_j = np.array([special.psi(a + b) - special.psi(a),
                                       special.psi(a + b) - special.psi(b),
@@ -732,52 +1001,50 @@ class BGBBFitter(BaseFitter):
                                       special.psi(g + d) - special.psi(d)
                                       ])
 
-            BjBj = special.beta(a + x, b + T - x) * special.beta(g, d + T)
-
-            if isinstance(x, float) or isinstance(x, int):
-                # x is a single number
-                i = np.arange(int(T - tx - 1) + 1)
-                BiBi = special.beta(a + x, b + tx - x + i) * special.beta(g + 1, d + tx + i)
-                sum_term_a = np.sum(BiBi * (special.psi(a + x) - special.psi(a + b + tx + i)))
-                sum_term_b = np.sum(BiBi * (special.psi(b + tx - x + i) - special.psi(a + b + tx + i)))
-                sum_term_g = np.sum(BiBi * (special.psi(g + 1) - special.psi(g + d + tx + i + 1)))
-                sum_term_d = np.sum(BiBi * (special.psi(d + tx + i) - special.psi(g + d + tx + i + 1)))
-            else:
-                sum_term_a = np.array([0.0] * len(x))
-                sum_term_b = np.array([0.0] * len(x))
-                sum_term_g = np.array([0.0] * len(x))
-                sum_term_d = np.array([0.0] * len(x))
-
-                max_i = (T - tx - 1).astype(int)
-                for j in range(len(max_i)):
-                    xj = x[j]
-                    txj = tx[j]
-                    i = np.arange(max_i[j] + 1)  # all indexes
-                    BjiBji = special.beta(a + xj, b + txj - xj + i) * special.beta(g + 1, d + txj + i)
-                    sum_term_a[j] += np.sum(BjiBji * (special.psi(a + xj) - special.psi(a + b + txj + i)))
-                    sum_term_b[j] += np.sum(BjiBji * (special.psi(b + txj - xj + i) - special.psi(a + b + txj + i)))
-                    sum_term_g[j] += np.sum(BjiBji * (special.psi(g + 1) - special.psi(g + d + txj + i + 1)))
-                    sum_term_d[j] += np.sum(BjiBji * (special.psi(d + txj + i) - special.psi(g + d + txj + i + 1)))
-
-            dLjda = first_terms_j[0] * Lj + 1.0 / denominator * (
-                BjBj * (special.psi(a + x) - special.psi(a + b + T)) + sum_term_a)
-            dLjdb = first_terms_j[1] * Lj + 1.0 / denominator * (
-                BjBj * (special.psi(b + T - x) - special.psi(a + b + T)) + sum_term_b)
-            dLjdg = first_terms_j[2] * Lj + 1.0 / denominator * (
-                BjBj * (special.psi(g) - special.psi(g + d + T)) + sum_term_g)
-            dLjdd = first_terms_j[3] * Lj + 1.0 / denominator * (
-                BjBj * (special.psi(d + T) - special.psi(g + d + T)) + sum_term_d)
+            BjBj_share = exp(log_BjBj - log_numerator)
+
+            def tail_share(psi_difference):
+                # all the digamma differences weighting the inner sums are negative, so the weighted sums are
+                # evaluated in log space on their absolute values
+                with np.errstate(divide='ignore'):
+                    log_table = log_BmBm + log(np.abs(psi_difference))
+                return -exp(_bgbb_log_tail_sums(log_table, x_index, tx, T) - log_numerator)
+
+            xm = np.unique(x)[:, None]
+            m = np.arange(T.max() + 1)[None, :]
+            m_minus_x = np.maximum(m - xm, 0)
+            psi_ab_m = special.psi(a + b + m)
+            psi_gd_m = special.psi(g + d + m + 1)
+
+            dllj_da = first_terms_j[0] + BjBj_share * (special.psi(a + x) - special.psi(a + b + T)) + \
+                tail_share(special.psi(a + xm) - psi_ab_m)
+            dllj_db = first_terms_j[1] + BjBj_share * (special.psi(b + T - x) - special.psi(a + b + T)) + \
+                tail_share(special.psi(b + m_minus_x) - psi_ab_m)
+            dllj_dg = first_terms_j[2] + BjBj_share * (special.psi(g) - special.psi(g + d + T)) + \
+                tail_share(special.psi(g + 1) - psi_gd_m)
+            dllj_dd = first_terms_j[3] + BjBj_share * (special.psi(d + T) - special.psi(g + d + T)) + \
+                tail_share(special.psi(d + m) - psi_gd_m)
 
             if N is not None:
-                d_ll = np.array([-(dLjda / Lj * N).sum(), -(dLjdb / Lj * N).sum(), -(dLjdg / Lj * N).sum(),
-                                 -(dLjdd / Lj * N).sum()])
+                d_ll = np.array([-(dllj_da * N).sum(), -(dllj_db * N).sum(), -(dllj_dg * N).sum(),
+                                 -(dllj_dd * N).sum()])
             else:
-                d_ll = np.array([-(dLjda / Lj).sum(), -(dLjdb / Lj).sum(), -(dLjdg / Lj).sum(),
-                                 -(dLjdd / Lj).sum()])
+                d_ll = np.array([-dllj_da.sum(), -dllj_db.sum(), -dllj_dg.sum(), -dllj_dd.sum()])
 
             return ll, d_ll
 
-    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None, jac=False):
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, penalizer_coef=0, N=None):
+        a, b, g, d = params.T
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+        tx = np.atleast_1d(asarray(recency)).astype(int)
+        T = np.atleast_1d(asarray(T)).astype(int)
+
+        log_numerator, log_denominator = _bgbb_log_likelihood_terms(a, b, g, d, x, tx, T)[:2]
+        return BGBBFitter._batch_penalized_sum(log_numerator - log_denominator, params, penalizer_coef, N)
+
+    def fit(self, frequency, recency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None, jac=False,
+            **fit_options):
         """
         This methods fits the data to the BG/BB discrete-time model.
 
@@ -790,7 +1057,8 @@ class BGBBFitter(BaseFitter):
                 hurt estimates.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
-            N: in case of compressed data this parameter is a vector of the number of users with same recency, frequency, T
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency, T
 
         Returns:
             self, with additional properties and methods like params_ and plot
@@ -802,20 +1070,15 @@ class BGBBFitter(BaseFitter):
 
         if N is not None:  # in this case it means you're handling compressed data
             N = asarray(N)
-            gen_t = reduce(lambda res, el: res + el, [[t] * n for t, n in zip(T, N)], [])
-        else:
-            gen_t = T
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, recency, T, self.penalizer_coef, N, jac],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      4,
-                                                      verbose,
-                                                      jac)
+        gen_t = _expand_ages(T, N)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood, [frequency, recency, T, self.penalizer_coef, N, jac],
+            iterative_fitting, initial_params, 4, verbose, jac, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['alpha', 'beta', 'gamma', 'delta'], params))
         self.data = DataFrame(vconcat[frequency, recency, T], columns=['frequency', 'recency', 'T'])
-        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t: bgbb_model(ts, *params, size=size, compressed=compressed)
+        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t, random_state=None: bgbb_model(
+            ts, *params, size=size, compressed=compressed, random_state=random_state)
 
         # self.predict = self.conditional_expected_number_of_purchases_up_to_time   # TODO add these methods
         return self
@@ -857,17 +1120,14 @@ class BGBBFitter(BaseFitter):
             t: a scalar or array of times.
             C: covariance matrix of parameters 'alpha', 'beta', 'gamma', 'delta'
 
-        Returns: a scalar
+        Returns: a scalar or array
         """
         a, b, g, d = self._unload_params('alpha', 'beta', 'gamma', 'delta')
         return BGBBFitter.static_expected_number_of_purchases_up_to_time_error(a, b, g, d, t, C)
 
     @staticmethod
     def static_expected_number_of_purchases_up_to_time_error(a, b, g, d, t, C):
-
-        if len(C) != 4 or len(C[0]) != 4:
-            raise ValueError("Covariance matrix: wrong dimensions. Must be 4x4 symmetric.")
-
+        t = asarray(t, dtype=float)
         E = BGBBFitter.static_expected_number_of_purchases_up_to_time(a, b, g, d, t)
 
         R = a / (a + b) * d / (g - 1) * (
@@ -879,10 +1139,7 @@ class BGBBFitter(BaseFitter):
         dEdg = - E / (g - 1) + R * (special.psi(g + d) - special.psi(g + d + t))
         dEdd = E / d + R * (special.psi(g + d) - special.psi(g + d + t) - special.psi(1 + d) + special.psi(1 + d + t))
 
-        Cov = np.matrix(C)
-        dE = np.array([[dEda], [dEdb], [dEdg], [dEdd]])
-
-        return math.sqrt(float(dE.transpose() * Cov * dE))
+        return delta_method_errors([dEda, dEdb, dEdg, dEdd], C)
 
     def probability_of_n_purchases_up_to_time(self, t, n):
         """
@@ -901,14 +1158,55 @@ class BGBBFitter(BaseFitter):
         if not (isinstance(n, int) and isinstance(t, int)):
             raise TypeError("t and n must be integers")
 
-        common_factor = 1.0 / special.beta(a, b) * 1.0 / special.beta(g, d)
+        if n > t:
+            return 0.0
+
+        log_B_ab = LogBetaTable(a, b, t + 2)
+        log_B_gd = LogBetaTable(g, d, t + 2)
+        log_factorial = special.gammaln(np.arange(t + 1) + 1)
+
+        log_common_factor = - log_B_ab(0, 0) - log_B_gd(0, 0)
+
+        i = np.arange(n, t)
+        log_binomial = log_factorial[t] - log_factorial[n] - log_factorial[t - n]
+        first_term = exp(log_binomial + log_B_ab(n, t - n) + log_B_gd(0, t) + log_common_factor)
+        log_binomials = log_factorial[i] - log_factorial[n] - log_factorial[i - n]
+        second_term = np.sum(exp(log_binomials + log_B_ab(n, i - n) + log_B_gd(1, i) + log_common_factor))
+
+        return first_term + second_term
+
+    @staticmethod
+    def static_probabilities_of_purchases_up_to_time(a, b, g, d, t):
+        """
+        Compute P( N(t) = n | model ) for all the n = 0..t at once.
+        The parameters can be arrays (e.g. bootstrap samples of them): the result has trailing axes running over them.
+
+        Returns: an array of shape (t + 1,) + shape of the parameters
+        """
+        if not isinstance(t, int):
+            raise TypeError("t must be an integer")
+
+        a, b, g, d = np.broadcast_arrays(*[asarray(par, dtype=float) for par in (a, b, g, d)])
+        over_params = (Ellipsis,) + (None,) * a.ndim
+        log_B_ab = LogBetaTable(a, b, t + 2)
+        log_B_gd = LogBetaTable(g, d, t + 2)
+        log_factorial = special.gammaln(np.arange(t + 1) + 1)
+
+        log_common_factor = - log_B_ab(0, 0) - log_B_gd(0, 0)
 
-        first_term = special.binom(t, n) * special.beta(a + n, b + t - n) * special.beta(g, d + t)
-        second_term = np.sum(
-            [special.binom(i, n) * special.beta(a + n, b + i - n) * special.beta(g + 1, d + i) for i in
-             range(n, int(t - 1 + 1))])
+        n = np.arange(t + 1)
+        log_binomial = (log_factorial[t] - log_factorial[n] - log_factorial[t - n])[over_params]
+        first_term = exp(log_binomial + log_B_ab(n, t - n) + log_B_gd(0, t) + log_common_factor)
 
-        return common_factor * (first_term + second_term)
+        # the second term sums over the time of the last purchase, i = n..t-1
+        n, i = np.meshgrid(n, np.arange(t), indexing='ij')
+        last_after_n = i >= n
+        i_minus_n = np.where(last_after_n, i - n, 0)
+        log_binomials = (log_factorial[i] - log_factorial[n] - log_factorial[i_minus_n])[over_params]
+        second_terms = exp(log_binomials + log_B_ab(n, i_minus_n) + log_B_gd(1, i) + log_common_factor)
+        second_term = np.sum(np.where(last_after_n[over_params], second_terms, 0.), axis=1)
+
+        return first_term + second_term
 
     @staticmethod
     def static_probability_alive_next_step(a, b, g, d, x, t_x, n):
@@ -942,20 +1240,13 @@ class BGBBBGFitter(BaseFitter):
             return np.inf
 
         a, b, g, d, e, z = params
-        xc = frequency_before_conversion
-        x = frequency
+        xc = np.atleast_1d(asarray(frequency_before_conversion)).astype(int)
+        x = np.atleast_1d(asarray(frequency)).astype(int)
 
-        if isinstance(xc, float) or isinstance(xc, int):
-            pass
-        else:
-            # xp is a vector
-            x = np.array(x)
-            xc = np.array(xc)
-
-        mask = x >= xc
-        purchase_term = special.beta(e + mask, z + xc) / special.beta(e, z)
+        log_B_ez = LogBetaTable(e, z, xc.max() + 2)
 
-        ll_vector = np.log(purchase_term)  # this converts the terms in a no object on which you can call sum()
+        mask = (x >= xc).astype(int)
+        ll_vector = log_B_ez(mask, xc) - log_B_ez(0, 0)
 
         if N is not None:
             ll_purchases = -(ll_vector * N).sum()
@@ -965,9 +1256,23 @@ class BGBBBGFitter(BaseFitter):
         sub_params = a, b, g, d
         return ll_purchases + BGBBFitter._negative_log_likelihood(sub_params, frequency, recency, T, penalizer_coef, N)
 
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, frequency_before_conversion,
+                                              penalizer_coef=0, N=None):
+        e, z = params[:, 4], params[:, 5]
+        xc = np.atleast_1d(asarray(frequency_before_conversion)).astype(int)
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+
+        log_B_ez = LogBetaTable(e, z, xc.max() + 2)
+        mask = (x >= xc).astype(int)
+        # the penalizer only applies to the parameters of the sessions, as in _negative_log_likelihood
+        ll_purchases = BGBBBGFitter._batch_penalized_sum(log_B_ez(mask, xc) - log_B_ez(0, 0), params, 0, N)
+        return ll_purchases + BGBBFitter._batch_negative_log_likelihood_values(params[:, :4], frequency, recency, T,
+                                                                               penalizer_coef, N)
+
     def fit(self, frequency, recency, T, frequency_before_conversion, iterative_fitting=0, initial_params=None,
             verbose=False,
-            N=None):
+            N=None, **fit_options):
         """
         This methods fits the data to the BG/BB/BG discrete-time model.
 
@@ -981,7 +1286,8 @@ class BGBBBGFitter(BaseFitter):
                 hurt estimates.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
-            N: in case of compressed data this parameter is a vector of the number of users with same recency, frequency,T
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency,T
 
         Returns:
             self, with additional properties and methods like params_ and plot
@@ -994,21 +1300,17 @@ class BGBBBGFitter(BaseFitter):
         _check_inputs(frequency, recency, T, N=N, frequency_before_conversion=frequency_before_conversion)
         if N is not None:  # in this case it means you're handling compressed data
             N = asarray(N)
-            gen_t = reduce(lambda res, el: res + el, [[t] * n for t, n in zip(T, N)], [])
-        else:
-            gen_t = T
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, recency, T, frequency_before_conversion,
-                                                       self.penalizer_coef, N],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      6,
-                                                      verbose)
+        gen_t = _expand_ages(T, N)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood,
+            [frequency, recency, T, frequency_before_conversion, self.penalizer_coef, N],
+            iterative_fitting, initial_params, 6, verbose, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta'], params))
         self.data = DataFrame(vconcat[frequency, recency, T, frequency_before_conversion],
                               columns=['frequency', 'recency', 'T', 'frequency_purchases'])
-        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t: bgbbbg_model(ts, *params, size=size, compressed=compressed)
+        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t, random_state=None: bgbbbg_model(
+            ts, *params, size=size, compressed=compressed, random_state=random_state)
 
         return self
 
@@ -1076,22 +1378,15 @@ class BGBBBGExtFitter(BaseFitter):
         a, b, g, d, e, z, c0 = params
         if c0 >= 1:
             return np.inf
-        xc = frequency_before_conversion
-        x = frequency
+        xc = np.atleast_1d(asarray(frequency_before_conversion)).astype(int)
+        x = np.atleast_1d(asarray(frequency)).astype(int)
 
-        if isinstance(xc, float) or isinstance(xc, int):
-            pass
-        else:
-            # xp is a vector
-            x = np.array(x)
-            xc = np.array(xc)
+        log_B_ez = LogBetaTable(e, z, xc.max() + 2)
 
-        mask = x >= xc
+        mask = (x >= xc).astype(int)
         mask2 = xc == 0
-        mask3 = xc != 0
-        purchase_term = c0 * mask2 + (1 - c0) * (special.beta(e + mask, z + xc - 1) / special.beta(e, z)) * mask3
-
-        ll_vector = np.log(purchase_term)  # this converts the terms in a no object on which you can call sum()
+        log_beta_ratio = log_B_ez(mask, np.maximum(xc - 1, 0)) - log_B_ez(0, 0)
+        ll_vector = np.where(mask2, log(c0), log(1 - c0) + log_beta_ratio)
 
         if N is not None:
             ll_purchases = -(ll_vector * N).sum()
@@ -1101,9 +1396,29 @@ class BGBBBGExtFitter(BaseFitter):
         sub_params = a, b, g, d
         return ll_purchases + BGBBFitter._negative_log_likelihood(sub_params, frequency, recency, T, penalizer_coef, N)
 
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, recency, T, frequency_before_conversion,
+                                              penalizer_coef=0, N=None):
+        e, z, c0 = params[:, 4], params[:, 5], params[:, 6]
+        xc = np.atleast_1d(asarray(frequency_before_conversion)).astype(int)
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+
+        log_B_ez = LogBetaTable(e, z, xc.max() + 2)
+        mask = (x >= xc).astype(int)
+        log_beta_ratio = log_B_ez(mask, np.maximum(xc - 1, 0)) - log_B_ez(0, 0)
+        ll_vector = np.where((xc == 0)[:, None], log(c0), log(1 - c0) + log_beta_ratio)
+        # the penalizer only applies to the parameters of the sessions, as in _negative_log_likelihood
+        ll_purchases = BGBBBGExtFitter._batch_penalized_sum(ll_vector, params, 0, N)
+        return ll_purchases + BGBBFitter._batch_negative_log_likelihood_values(params[:, :4], frequency, recency, T,
+                                                                               penalizer_coef, N)
+
+    @staticmethod
+    def _batch_in_domain(params):
+        return npall(params > 0., axis=1) & (params[:, 6] < 1)
+
     def fit(self, frequency, recency, T, frequency_before_conversion, iterative_fitting=0, initial_params=None,
             verbose=False,
-            N=None):
+            N=None, **fit_options):
         """
         This methods fits the data to the BG/BB/BG discrete-time model.
 
@@ -1117,7 +1432,8 @@ class BGBBBGExtFitter(BaseFitter):
                 hurt estimates.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
-            N: in case of compressed data this parameter is a vector of the number of users with same recency, frequency,T
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency,T
 
         Returns:
             self, with additional properties and methods like params_ and plot
@@ -1130,21 +1446,17 @@ class BGBBBGExtFitter(BaseFitter):
         _check_inputs(frequency, recency, T, N=N, frequency_before_conversion=frequency_before_conversion)
         if N is not None:  # in this case it means you're handling compressed data
             N = asarray(N)
-            gen_t = reduce(lambda res, el: res + el, [[t] * n for t, n in zip(T, N)], [])
-        else:
-            gen_t = T
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, recency, T, frequency_before_conversion,
-                                                       self.penalizer_coef, N],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      7,
-                                                      verbose)
+        gen_t = _expand_ages(T, N)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood,
+            [frequency, recency, T, frequency_before_conversion, self.penalizer_coef, N],
+            iterative_fitting, initial_params, 7, verbose, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'c0'], params))
         self.data = DataFrame(vconcat[frequency, recency, T, frequency_before_conversion],
                               columns=['frequency', 'recency', 'T', 'frequency_before_conversion'])
-        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t: bgbbbgext_model(ts, *params, size=size, compressed=compressed)
+        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t, random_state=None: bgbbbgext_model(
+            ts, *params, size=size, compressed=compressed, random_state=random_state)
         return self
 
     def expected_probability_of_converting_at_time(self, t):
@@ -1274,31 +1586,17 @@ class BGFitter(BaseFitter):
         if npany(asarray([a, b]) <= 0.):
             return np.inf
 
-        x = frequency
-        if isinstance(x, float) or isinstance(x, int):
-            Ntot = 1
-        else:
-            Ntot = len(x)
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+        T = np.atleast_1d(asarray(T)).astype(int)
+        Ntot = len(x)
         if N is not None:
             Ntot = np.array(N).sum()
 
-        if isinstance(x, float) or isinstance(x, int):
-            # x is a single number
-            numerator = 0
-            if x < T:
-                numerator += special.beta(a + 1, b + x)
-            elif x == T:
-                numerator += special.beta(a, b + x)
+        log_B = LogBetaTable(a, b, x.max() + 2)
 
-        else:
-            # x is a vector
-            x = np.array(x)
-            T = np.array(T)
-            dead_ones_to_add = (x < T).astype(int)
-            numerator = special.beta(a + dead_ones_to_add, b + x)
-
-        Lj = numerator
-        llj = np.log(Lj)  # this converts the terms in a np object on which you can call sum()
+        dead_ones_to_add = (x < T).astype(int)
+        llj = log_B(dead_ones_to_add, x)
+        llj[x > T] = -np.inf
         penalizer_term = penalizer_coef * log(params).sum()
 
         if N is not None:
@@ -1306,9 +1604,21 @@ class BGFitter(BaseFitter):
         else:
             ll = -llj.sum()
 
-        return ll + Ntot * log(special.beta(a, b)) + penalizer_term
+        return ll + Ntot * log_B(0, 0) + penalizer_term
+
+    @staticmethod
+    def _batch_negative_log_likelihood_values(params, frequency, T, penalizer_coef=0, N=None):
+        a, b = params.T
+        x = np.atleast_1d(asarray(frequency)).astype(int)
+        T = np.atleast_1d(asarray(T)).astype(int)
 
-    def fit(self, frequency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None):
+        log_B = LogBetaTable(a, b, x.max() + 2)
+        dead_ones_to_add = (x < T).astype(int)
+        llj = log_B(dead_ones_to_add, x) - log_B(0, 0)
+        llj[x > T] = -np.inf
+        return BGFitter._batch_penalized_sum(llj, params, penalizer_coef, N)
+
+    def fit(self, frequency, T, iterative_fitting=0, initial_params=None, verbose=False, N=None, **fit_options):
         """
         This methods fits the data to the BG discrete-time model.
 
@@ -1320,7 +1630,8 @@ class BGFitter(BaseFitter):
                 hurt estimates.
             initial_params: set initial params for the iterative fitter.
             verbose: set to true to print out convergence diagnostics.
-            N: in case of compressed data this parameter is a vector of the number of users with same recency, frequency, T
+            fit_options: options of the multi-start minimizer, like n_jobs, max_time or n_consensus (see utils._fit).
+            N: in case of compressed data this parameter is a vector of the number (or weight) of users with same recency, frequency, T
 
         Returns:
             self, with additional properties and methods like params_ and plot
@@ -1338,20 +1649,16 @@ class BGFitter(BaseFitter):
 
         if N is not None:  # in this case it means you're handling compressed data
             N = asarray(N)
-            gen_t = reduce(lambda res, el: res + el, [[t] * n for t, n in zip(T, N)], [])
-        else:
-            gen_t = T
-        params, self._negative_log_likelihood_ = _fit(self._negative_log_likelihood,
-                                                      [frequency, T, self.penalizer_coef, N],
-                                                      iterative_fitting,
-                                                      initial_params,
-                                                      2,
-                                                      verbose)
+        gen_t = _expand_ages(T, N)
+        params, self._negative_log_likelihood_, self.fit_summary_ = _fit(
+            self._negative_log_likelihood, [frequency, T, self.penalizer_coef, N],
+            iterative_fitting, initial_params, 2, verbose, full_output=True, **fit_options)
 
         self.params_ = OrderedDict(zip(['alpha', 'beta'], params))
         self.data = DataFrame(vconcat[frequency, T], columns=['frequency', 'T'])
 
-        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t: bgext_model(ts, *params, size=size, compressed=compressed)
+        self.generate_new_data = lambda size=1, compressed=False, ts=gen_t, random_state=None: bgext_model(
+            ts, *params, size=size, compressed=compressed, random_state=random_state)
 
         return self
 
@@ -1370,14 +1677,11 @@ class BGFitter(BaseFitter):
 
     @staticmethod
     def static_expected_number_of_purchases_up_to_time(a, b, t):
-        if t == 0:
-            return 0
-        elif t == 1:
-            return special.beta(a, b + 1) / special.beta(a, b)
+        t = asarray(t)
         den = special.beta(a, b)
         num = t * special.beta(a, b + t) + special.beta(a - 1, b + 1) - special.beta(a - 1, b + t) \
               - (t - 1) * special.beta(a, b + t)
-        return num / den
+        return np.select([t == 0, t == 1], [0., special.beta(a, b + 1) / den], num / den)[()]
 
     def expected_number_of_purchases_up_to_time_error(self, t, C):
         """
@@ -1386,21 +1690,16 @@ class BGFitter(BaseFitter):
 
         Parameters:
             t: a scalar or array of times.
-            C: covariance matrix of parameters 'alpha', 'beta', 'gamma', 'delta'
+            C: covariance matrix of parameters 'alpha', 'beta'
 
-        Returns: a scalar
+        Returns: a scalar or array
         """
         a, b = self._unload_params('alpha', 'beta')
         return BGFitter.static_expected_number_of_purchases_up_to_time_error(a, b, t, C)
 
     @staticmethod
     def static_expected_number_of_purchases_up_to_time_error(a, b, t, C):
-
-        if t == 0:
-            return 0
-
-        if len(C) != 2 or len(C[0]) != 2:
-            raise ValueError("Covariance matrix: wrong dimensions. Must be 2x2 symmetric.")
+        t = asarray(t)
 
         def dx(x, y):
             return special.beta(x, y) * (special.psi(x) - special.psi(x + y))
@@ -1416,10 +1715,8 @@ class BGFitter(BaseFitter):
         dEdb = (t * dy(a, b + t) + dy(a - 1, b + 1) - dy(a - 1, b + t) - (t - 1) * dy(a, b + t)) / B - E / (
             B ** 2) * dy(a, b)
 
-        Cov = np.matrix(C)
-        dE = np.array([[dEda], [dEdb]])
-
-        return math.sqrt(float(dE.transpose() * Cov * dE))
+        # nothing is purchased at t = 0, whatever the parameters
+        return delta_method_errors([np.where(t == 0, 0., dEda), np.where(t == 0, 0., dEdb)], C)
 
     def probability_of_n_purchases_up_to_time(self, t, n):
         """
@@ -1449,3 +1746,21 @@ class BGFitter(BaseFitter):
             num = special.beta(a, b + n)
 
         return num / den
+
+    @staticmethod
+    def static_probabilities_of_purchases_up_to_time(a, b, t):
+        """
+        Compute P( N(t) = n | model ) for all the n = 0..t at once.
+        The parameters can be arrays (e.g. bootstrap samples of them): the result has trailing axes running over them.
+
+        Returns: an array of shape (t + 1,) + shape of the parameters
+        """
+        if not isinstance(t, int):
+            raise TypeError("t must be an integer")
+
+        a, b = np.broadcast_arrays(asarray(a, dtype=float), asarray(b, dtype=float))
+        n = np.arange(t + 1)[(Ellipsis,) + (None,) * a.ndim]
+        log_den = special.betaln(a, b)
+        return np.select([n == 0, n < t],
+                         [exp(special.betaln(a + 1, b) - log_den), exp(special.betaln(a + 1, b + n) - log_den)],
+                         exp(special.betaln(a, b + n) - log_den))
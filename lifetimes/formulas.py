@@ -9,13 +9,47 @@ def gamma_ratio(x, a):
         x:  point zero
         a:  delta
     """
-    if np.isinf(special.gamma(x + a)) or np.isinf(special.gamma(x)):
-        return gamma_body(x + a) / gamma_body(x) * np.exp(-a) * np.exp((x + a) * np.log(x + a) - x * np.log(x))
-    else:
-        return special.gamma(x + a) / special.gamma(x)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        gamma_x_a, gamma_x = special.gamma(x + a), special.gamma(x)
+        overflow = np.isinf(gamma_x_a) | np.isinf(gamma_x)
+        if not np.any(overflow):
+            return gamma_x_a / gamma_x
+        # x can be an array, where only some of the gamma functions overflow
+        return np.where(overflow,
+                        gamma_body(x + a) / gamma_body(x) * np.exp(-a) * np.exp((x + a) * np.log(x + a) - x * np.log(x)),
+                        gamma_x_a / gamma_x)[()]
 
 
 def gamma_body(x):
     return np.sqrt(2 * np.pi / x) + 1.0 / 6 * np.sqrt(np.pi / 2) * (1.0 / x) ** (3.0 / 2) + 1.0 / 144 * np.sqrt(
         np.pi / 2) * (1.0 / x) ** (5.0 / 2) - 139.0 / 25920 * np.sqrt(np.pi / 2) * (1.0 / x) ** (
     7.0 / 2) - 571.0 / 1244160 * np.sqrt(np.pi / 2) * (1.0 / x) ** (9.0 / 2)
+
+
+class LogBetaTable(object):
+    """
+    Lookup tables of log B(p + j, q + k) for non negative integers j, k with j + k < size.
+
+    In the discrete-time models the Beta function is always evaluated at its parameters shifted by an integer
+    number of periods: gammaln(p + k), gammaln(q + k) and gammaln(p + q + k) are computed once for
+    k = 0..size-1, so that every log-Beta term becomes an array gather.
+
+    p and q can also be arrays (e.g. one value per parameter vector of a batch): the results then have
+    additional trailing axes running over them.
+    """
+
+    def __init__(self, p, q, size):
+        k = np.arange(size).reshape((size,) + (1,) * len(np.broadcast(p, q).shape))
+        self.gammaln_p = special.gammaln(p + k)
+        self.gammaln_q = special.gammaln(q + k)
+        self.gammaln_pq = special.gammaln(p + q + k)
+
+    def __call__(self, j, k):
+        """
+        Args:
+            j:  integer or integer array, shift of p
+            k:  integer or integer array, shift of q
+
+        Returns: log B(p + j, q + k), with shape broadcast(j, k).shape + broadcast(p, q).shape
+        """
+        return self.gammaln_p[j] + self.gammaln_q[k] - self.gammaln_pq[j + k]
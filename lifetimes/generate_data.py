@@ -1,12 +1,11 @@
 from __future__ import print_function
 from __future__ import absolute_import
 import numpy as np
-from scipy import stats
+from scipy import stats, special
 import pandas as pd
-import random
 import csv
 import os
-from .utils import normalize_positive_vector
+from .utils import normalize_positive_vector, check_random_state
 from . import data_compression as comp
 
 
@@ -14,7 +13,7 @@ def hello():
     print("hello from MM! :)")
 
 
-def beta_geometric_nbd_model(T, r, alpha, a, b, size=1):
+def beta_geometric_nbd_model(T, r, alpha, a, b, size=1, random_state=None):
     """
     Generate artificial data according to the BG/NBD model. See [1] for model details
 
@@ -22,7 +21,9 @@ def beta_geometric_nbd_model(T, r, alpha, a, b, size=1):
     Parameters:
         T: scalar or array, the length of time observing new customers.
         r, alpha, a, b: scalars, represening parameters in the model. See [1]
-        size: the number of customers to generate
+        size: the number of customers to generate, equal to size of T if T is
+           an array.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:
         DataFrame, with index as customer_ids and the following columns:
@@ -32,37 +33,21 @@ def beta_geometric_nbd_model(T, r, alpha, a, b, size=1):
     (http://brucehardie.com/papers/bgnbd_2004-04-20.pdf)
 
     """
-    if type(T) in [float, int]:
-        T = T * np.ones(size)
-    else:
-        T = np.asarray(T)
+    random_state = check_random_state(random_state)
+    T, size = _customer_ages(T, size)
 
-    probability_of_post_purchase_death = stats.beta.rvs(a, b, size=size)
-    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size)
+    probability_of_post_purchase_death = stats.beta.rvs(a, b, size=size, random_state=random_state)
+    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size, random_state=random_state)
 
-    columns = ['frequency', 'recency', 'T', 'lambda', 'p', 'alive', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
+    # a customer dies right after a geometric number of purchases
+    purchases_to_death = _geometric(probability_of_post_purchase_death, random_state)
+    frequency, recency, purchases = _poisson_purchases(lambda_, T, random_state, purchases_to_death)
 
-    for i in range(size):
-        p = probability_of_post_purchase_death[i]
-        l = lambda_[i]
-
-        # hacky until I can find something better
-        times = []
-        next_purchase_in = stats.expon.rvs(scale=1. / l)
-        alive = True
-        while (np.sum(times) + next_purchase_in < T[i]) and alive:
-            times.append(next_purchase_in)
-            next_purchase_in = stats.expon.rvs(scale=1. / l)
-            alive = np.random.random() > p
-
-        times = np.array(times).cumsum()
-        df.ix[i] = len(times), np.max(times if times.shape[0] > 0 else 0), T[i], l, p, alive, i
-
-    return df.set_index('customer_id')
+    return _continuous_time_data(frequency, recency, T, lambda_, 'p', probability_of_post_purchase_death,
+                                 purchases_to_death > purchases)
 
 
-def beta_geometric_nbd_model_with_transactions(T, r, alpha, a, b, size=1):
+def beta_geometric_nbd_model_with_transactions(T, r, alpha, a, b, size=1, random_state=None):
     """
     Generate artificial data according to the BG/NBD model. See [1] for model details
 
@@ -70,7 +55,9 @@ def beta_geometric_nbd_model_with_transactions(T, r, alpha, a, b, size=1):
     Parameters:
         T: scalar or array, the length of time observing new customers.
         r, alpha, a, b: scalars, represening parameters in the model. See [1]
-        size: the number of customers to generate
+        size: the number of customers to generate, equal to size of T if T is
+           an array.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:
         DataFrame, with index as customer_ids and the following columns:
@@ -81,39 +68,12 @@ def beta_geometric_nbd_model_with_transactions(T, r, alpha, a, b, size=1):
     (http://brucehardie.com/papers/bgnbd_2004-04-20.pdf)
 
     """
-    if type(T) in [float, int]:
-        T = T * np.ones(size)
-    else:
-        T = np.asarray(T)
-
-    probability_of_post_purchase_death = stats.beta.rvs(a, b, size=size)
-    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size)
-
-    columns = ['frequency', 'recency', 'T', 'lambda', 'p', 'alive', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
-    transaction_times = {}  # dictionary containing the single transaction times
-
-    for i in range(size):
-        p = probability_of_post_purchase_death[i]
-        l = lambda_[i]
-
-        # hacky until I can find something better
-        times = []
-        next_purchase_in = stats.expon.rvs(scale=1. / l)
-        alive = True
-        while (np.sum(times) + next_purchase_in < T[i]) and alive:
-            times.append(next_purchase_in)
-            next_purchase_in = stats.expon.rvs(scale=1. / l)
-            alive = np.random.random() > p
+    random_state = check_random_state(random_state)
+    df = beta_geometric_nbd_model(T, r, alpha, a, b, size=size, random_state=random_state)
+    return df, dict(enumerate(_poisson_purchase_times(df['frequency'].values, df['recency'].values, random_state)))
 
-        times = np.array(times).cumsum()
-        df.ix[i] = len(times), np.max(times if times.shape[0] > 0 else 0), T[i], l, p, alive, i
-        transaction_times[i] = times
 
-    return df.set_index('customer_id'), transaction_times
-
-
-def pareto_nbd_model(T, r, alpha, s, beta, size=1):
+def pareto_nbd_model(T, r, alpha, s, beta, size=1, random_state=None):
     """
     Generate artificial data according to the Pareto/NBD model. See [2] for model details
 
@@ -123,6 +83,7 @@ def pareto_nbd_model(T, r, alpha, s, beta, size=1):
         r, alpha, s, beta: scalars, representing parameters in the model. See [2]
         size: the number of customers to generate, equal to size of T if T is
            an array.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:
         DataFrame, with index as customer_ids and the following columns:
@@ -132,42 +93,25 @@ def pareto_nbd_model(T, r, alpha, s, beta, size=1):
     and Related Expressions," <http://brucehardie.com/notes/009/>.
 
     """
-    if type(T) in [float, int]:
-        T = T * np.ones(size)
-    else:
-        T = np.asarray(T)
+    random_state = check_random_state(random_state)
+    T, size = _customer_ages(T, size)
 
-    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size)
-    mus = stats.gamma.rvs(s, scale=1. / beta, size=size)
+    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size, random_state=random_state)
+    mus = stats.gamma.rvs(s, scale=1. / beta, size=size, random_state=random_state)
+    time_of_death = stats.expon.rvs(scale=1. / mus, size=size, random_state=random_state)
 
-    columns = ['frequency', 'recency', 'T', 'lambda', 'mu', 'alive', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
+    frequency, recency, _ = _poisson_purchases(lambda_, np.minimum(time_of_death, T), random_state)
+    return _continuous_time_data(frequency, recency, T, lambda_, 'mu', mus, time_of_death > T)
 
-    for i in range(size):
-        l = lambda_[i]
-        mu = mus[i]
-        time_of_death = stats.expon.rvs(scale=1. / mu)
-
-        # hacky until I can find something better
-        times = []
-        next_purchase_in = stats.expon.rvs(scale=1. / l)
-        while np.sum(times) + next_purchase_in < min(time_of_death, T[i]):
-            times.append(next_purchase_in)
-            next_purchase_in = stats.expon.rvs(scale=1. / l)
-
-        times = np.array(times).cumsum()
-        df.ix[i] = len(times), np.max(times if times.shape[0] > 0 else 0), T[i], l, mu, time_of_death > T[i], i
-
-    return df.set_index('customer_id')
 
-
-def modified_beta_geometric_nbd_model(T, r, alpha, a, b, size=1):
+def modified_beta_geometric_nbd_model(T, r, alpha, a, b, size=1, random_state=None):
     """
     Generate artificial data according to the MBG/NBD model. See [1,2] for model details
     Parameters:
         T: scalar or array, the length of time observing new customers.
         r, alpha, a, b: scalars, represening parameters in the model. See [1,2]
-        size: the number of customers to generate
+        size: the number of customers to generate, equal to size of T if T is an array.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
     Returns:
         DataFrame, with index as customer_ids and the following columns:
         'frequency', 'recency', 'T', 'lambda', 'p', 'alive', 'customer_id'
@@ -177,37 +121,182 @@ def modified_beta_geometric_nbd_model(T, r, alpha, a, b, size=1):
         "Empirical validation and comparison of models for customer base analysis,"
         International Journal of Research in Marketing, 24 (3), 201-209.
     """
-    if type(T) in [float, int]:
-        T = T * np.ones(size)
-    else:
-        T = np.asarray(T)
+    random_state = check_random_state(random_state)
+    T, size = _customer_ages(T, size)
 
-    probability_of_post_purchase_death = stats.beta.rvs(a, b, size=size)
-    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size)
+    probability_of_post_purchase_death = stats.beta.rvs(a, b, size=size, random_state=random_state)
+    lambda_ = stats.gamma.rvs(r, scale=1. / alpha, size=size, random_state=random_state)
 
-    columns = ['frequency', 'recency', 'T', 'lambda', 'p', 'alive', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
+    # unlike BG/NBD, a customer can die before the first purchase too
+    purchases_to_death = _geometric(probability_of_post_purchase_death, random_state) - 1.
+    frequency, recency, purchases = _poisson_purchases(lambda_, T, random_state, purchases_to_death)
 
-    for i in range(size):
-        p = probability_of_post_purchase_death[i]
-        l = lambda_[i]
+    return _continuous_time_data(frequency, recency, T, lambda_, 'p', probability_of_post_purchase_death,
+                                 purchases_to_death > purchases)
 
-        # hacky until I can find something better
-        times = []
-        next_purchase_in = stats.expon.rvs(scale=1. / l)
-        alive = np.random.random() > p  # essentially the difference between this model and BG/NBD
-        while (np.sum(times) + next_purchase_in < T[i]) and alive:
-            times.append(next_purchase_in)
-            next_purchase_in = stats.expon.rvs(scale=1. / l)
-            alive = np.random.random > p
 
-        times = np.array(times).cumsum()
-        df.ix[i] = len(times), np.max(times if times.shape[0] > 0 else 0), T[i], l, p, alive, i
+def _customer_ages(T, size):
+    """
+    Returns T as a float array, one entry per customer, and the number of customers.
+    """
+    if np.ndim(T) == 0:
+        return float(T) * np.ones(size), size
+    T = np.asarray(T, dtype=float)
+    return T, len(T)
+
 
+def _continuous_time_data(frequency, recency, T, lambda_, death_name, death_parameters, alive):
+    """
+    Collects the simulated customers of the continuous-time models in a DataFrame indexed by customer_id.
+    """
+    columns = ['frequency', 'recency', 'T', 'lambda', death_name, 'alive', 'customer_id']
+    df = pd.DataFrame({'frequency': frequency, 'recency': recency, 'T': T, 'lambda': lambda_,
+                       death_name: death_parameters, 'alive': alive, 'customer_id': np.arange(len(T))},
+                      columns=columns).astype(float)
     return df.set_index('customer_id')
 
 
-def bgbb_model(T, alpha, beta, gamma, delta, size=1, transactional=False, compressed=False):
+def _poisson_purchases(lambdas, durations, random_state, max_purchases=np.inf):
+    """
+    Simulates customers purchasing as Poisson processes of rate lambda over (0, duration), up to max_purchases times.
+    Given the number n of purchases over the duration their times are n sorted uniform draws, so that the k-th one
+    is at duration * Beta(k, n - k + 1).
+
+    Returns:
+        the number of purchases, the time of the last one (0 without purchases) and the number of purchases n the
+        customers would make over the whole duration
+    """
+    purchases = random_state.poisson(lambdas * durations).astype(float)
+    frequency = np.minimum(purchases, max_purchases)
+    k = np.maximum(frequency, 1.)
+    recency = np.where(frequency > 0, durations * random_state.beta(k, np.maximum(purchases - k + 1., 1.)), 0.)
+    return frequency, recency, purchases
+
+
+def _poisson_purchase_times(frequency, recency, random_state):
+    """
+    Same as _poisson_purchases, but returns the array of purchase times of every customer: given the last one, the
+    earlier purchases are sorted uniform draws before it.
+    """
+    earlier_purchases = np.maximum(frequency - 1, 0).astype(np.int64)
+    customers = np.repeat(np.arange(len(frequency)), earlier_purchases)
+    times = random_state.random_sample(len(customers)) * recency[customers]
+    times = times[np.lexsort((times, customers))]
+    splits = np.cumsum(earlier_purchases)[:-1]
+    return [np.append(ts, last) if n > 0 else np.array([]) for ts, last, n in zip(np.split(times, splits), recency,
+                                                                                 frequency)]
+
+
+def _geometric(probabilities, random_state):
+    """
+    Draws the number of Bernoulli trials up to (and including) the first success, for every success probability.
+    Values are floats, so that vanishing probabilities give large (or infinite) values instead of overflowing.
+    """
+    u = 1. - random_state.random_sample(np.shape(probabilities))  # in (0, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.fmax(np.ceil(np.log(u) / np.log1p(-np.asarray(probabilities, dtype=float))), 1.)
+
+
+def _geometric_lifetimes(T, thetas, random_state):
+    """
+    Simulates customers dying at the beginning of every time bin with probability theta.
+
+    Returns:
+        the number of time bins out of 1..T every customer is alive in, and whether it is still alive after T
+    """
+    death = _geometric(thetas, random_state)
+    return np.minimum(death - 1., T), death > T
+
+
+def _bernoulli_purchases(lifetimes, ps, random_state):
+    """
+    Simulates customers purchasing with probability p in every one of their first `lifetimes` time bins.
+    The last purchase is a geometric number of bins back from the end of the lifetime, the earlier purchases are
+    binomial over the bins before it.
+
+    Returns:
+        the number of purchases and the time bin of the last one (0 without purchases)
+    """
+    recency = lifetimes + 1. - _geometric(ps, random_state)
+    recency[recency < 1.] = 0.
+    earlier_bins = np.maximum(recency - 1., 0.).astype(np.int64)
+    frequency = np.where(recency > 0., 1. + random_state.binomial(earlier_bins, ps), 0.)
+    return frequency, recency
+
+
+def _bernoulli_purchase_times(lifetimes, ps, random_state):
+    """
+    Same as _bernoulli_purchases, but returns the list of purchase times of every customer.
+    """
+    t = np.arange(1, int(np.max(lifetimes)) + 1)
+    ps = np.reshape(ps, (-1, 1))
+    lifetimes = np.reshape(lifetimes, (-1, 1))
+    # bounds the size of the (customers, time bins) matrices
+    chunk_size = max(1, 2 ** 22 // max(len(t), 1))
+
+    purchase_times = []
+    for start in range(0, len(ps), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        purchases = (random_state.random_sample((len(ps[chunk]), len(t))) <= ps[chunk]) & (t <= lifetimes[chunk])
+        customers, bins = np.nonzero(purchases)
+        splits = np.searchsorted(customers, np.arange(1, len(ps[chunk])))
+        purchase_times.extend(times.tolist() for times in np.split(t[bins], splits))
+    return purchase_times
+
+
+def _bernoulli_conversions(lifetimes, ps, cs, c0s, random_state):
+    """
+    Simulates customers having a session at 0 and then with probability p in every one of their first `lifetimes`
+    time bins, every session before the first conversion converting with probability c (c0 for the session at 0).
+    Past 0, the first converting session is in a geometric(p * c) time bin: the bins before it have a non-converting
+    session with probability p * (1 - c) / (1 - p * c), the bins after it a session with probability p.
+
+    Returns:
+        the number of sessions past 0, the time bin of the last one (0 without sessions), the number of sessions
+        before the conversion and the time bin of the conversion (nan without conversion)
+    """
+    converted_at_0 = random_state.random_sample(np.shape(ps)) <= c0s
+    tau = _geometric(ps * cs, random_state)
+    converted_later = ~converted_at_0 & (tau <= lifetimes)
+    conversion_time = np.where(converted_at_0, 0., np.where(converted_later, tau, np.nan))
+
+    before = np.where(converted_at_0, 0., np.where(converted_later, tau - 1., lifetimes))
+    frequency_before, recency_before = _bernoulli_purchases(before, ps * (1. - cs) / (1. - ps * cs), random_state)
+    after = np.where(np.isnan(conversion_time), 0., lifetimes - np.nan_to_num(conversion_time))
+    frequency_after, recency_after = _bernoulli_purchases(after, ps, random_state)
+
+    frequency = frequency_before + converted_later + frequency_after
+    recency = np.where(frequency_after > 0, np.nan_to_num(conversion_time) + recency_after,
+                       np.where(converted_later, tau, recency_before))
+    frequency_before_conversion = np.where(converted_at_0, 0., 1. + frequency_before)
+    return frequency, recency, frequency_before_conversion, conversion_time
+
+
+def _bgbbbg_data(T, ps, thetas, cs, c0s, time_first_purchase, death_time, compressed, random_state):
+    """
+    Simulates the BG/BB/BG customers with the given hidden parameters, see bgbbbg_model.
+    """
+    lifetimes, alive = _geometric_lifetimes(T, thetas, random_state)
+    frequency, recency, frequency_before_conversion, tfp = _bernoulli_conversions(lifetimes, ps, cs, c0s, random_state)
+
+    columns = ['frequency', 'recency', 'T', 'frequency_before_conversion', 'p', 'theta', 'c', 'alive', 'customer_id']
+    data = {'frequency': frequency, 'recency': recency, 'T': T, 'frequency_before_conversion': frequency_before_conversion,
+            'p': ps, 'theta': thetas, 'c': cs, 'alive': alive, 'customer_id': np.arange(len(T))}
+    if time_first_purchase:
+        columns.append('time_first_purchase')
+        data['time_first_purchase'] = tfp
+    elif death_time:
+        columns.append('death_time')
+        data['death_time'] = np.where(alive, np.nan, lifetimes + 1.)
+
+    df = pd.DataFrame(data, columns=columns).astype(float)
+    if compressed:
+        return comp.compress_session_session_before_conversion_data(df)
+    else:
+        return df.set_index('customer_id')
+
+
+def bgbb_model(T, alpha, beta, gamma, delta, size=1, transactional=False, compressed=False, random_state=None):
     """
     Generate artificial data according to the discrete BG/BB model.
 
@@ -216,11 +305,13 @@ def bgbb_model(T, alpha, beta, gamma, delta, size=1, transactional=False, compre
         alpha, beta, gamma, delta: scalars, representing parameters in the model. See [2]
         size: the number of customers to generate, equal to size of T if T is
            an array.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:
         DataFrame, with index as customer_ids and the following columns:
         'frequency', 'recency', 'T', 'p', 'theta', 'alive', 'customer_id'
     """
+    random_state = check_random_state(random_state)
     if size < 1:
         raise ValueError("size must be positive")
 
@@ -234,51 +325,27 @@ def bgbb_model(T, alpha, beta, gamma, delta, size=1, transactional=False, compre
         size = len(T)
 
     # Generate hidden parameters fo all costumers
-    ps = stats.beta.rvs(alpha, beta, size=size)  # probability of purchasing while alive
-    thetas = stats.beta.rvs(gamma, delta, size=size)  # probability of dying at the beginning of a time bin
-    users = []
-    columns = ['frequency', 'recency', 'T', 'p', 'theta', 'alive', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
-
-    for i in range(size):
-        p = ps[i]  # probability of purchasing, if alive
-        theta = thetas[i]  # probability of dying
-
-        # initial conditions (buys at 0)
-        x = 0
-        tx = 0
-        alive = True
-
-        # start testing from t = 1
-        t = 1
-        ts = []
-        while t <= T[i]:
-            alive = np.random.random() > theta
-            if alive:
-                purchases = np.random.random() <= p
-                if purchases:
-                    ts.append(t)
-                t += 1
-            else:
-                break
-        if transactional:
-            users.append((T[i], ts))
-        else:
-            if len(ts) > 0:
-                tx = max(ts)
-            else:
-                tx = 0
-            df.ix[i] = len(ts), tx, T[i], p, theta, alive, i
+    ps = stats.beta.rvs(alpha, beta, size=size, random_state=random_state)  # probability of purchasing while alive
+    thetas = stats.beta.rvs(gamma, delta, size=size, random_state=random_state)  # probability of dying at the beginning of a time bin
+
+    # number of time bins a customer is alive in, out of 1..T
+    lifetimes, alive = _geometric_lifetimes(T, thetas, random_state)
+
     if transactional:
-        return users
+        return [(T[i], ts) for i, ts in enumerate(_bernoulli_purchase_times(lifetimes, ps, random_state))]
+
+    frequency, recency = _bernoulli_purchases(lifetimes, ps, random_state)
+    df = pd.DataFrame({'frequency': frequency, 'recency': recency, 'T': T, 'p': ps, 'theta': thetas, 'alive': alive,
+                       'customer_id': np.arange(size)},
+                      columns=['frequency', 'recency', 'T', 'p', 'theta', 'alive', 'customer_id']).astype(float)
+    if compressed:
+        return comp.compress_data(df)
     else:
-        if compressed:
-            return comp.compress_data(df)
-        else:
-            return df.set_index('customer_id')
+        return df.set_index('customer_id')
 
 
-def bgbbbg_model(T, alpha, beta, gamma, delta, epsilon, zeta, size=1, time_first_purchase=False, death_time=False, compressed=False):
+def bgbbbg_model(T, alpha, beta, gamma, delta, epsilon, zeta, size=1, time_first_purchase=False, death_time=False,
+                 compressed=False, random_state=None):
     """
         Generate artificial data according to the discrete BG/BB/BG model (modeling conversion as BG).
 
@@ -289,10 +356,12 @@ def bgbbbg_model(T, alpha, beta, gamma, delta, epsilon, zeta, size=1, time_first
                an array.
             time_first_purchase: if true, adds the time of the first purchase of a user (useful for conversion)
             death_time: if true, adds death time
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
         Returns:
             DataFrame, with index as customer_ids and the following columns:
             'frequency', 'recency', 'T', 'frequency_before_conversion', 'p', 'theta', 'c', 'alive', 'customer_id'
         """
+    random_state = check_random_state(random_state)
     if size < 1:
         raise ValueError("size must be positive")
 
@@ -305,78 +374,15 @@ def bgbbbg_model(T, alpha, beta, gamma, delta, epsilon, zeta, size=1, time_first
         T = np.array(T)
         size = len(T)
     # Generate hidden parameters fo all costumers
-    ps = stats.beta.rvs(alpha, beta, size=size)  # probability of making a session while alive
-    thetas = stats.beta.rvs(gamma, delta, size=size)  # probability of dying at the beginning of a time bin
-    cs = stats.beta.rvs(epsilon, zeta, size=size)  # probability of converting while alive and making a session
+    ps = stats.beta.rvs(alpha, beta, size=size, random_state=random_state)  # probability of making a session while alive
+    thetas = stats.beta.rvs(gamma, delta, size=size, random_state=random_state)  # probability of dying at the beginning of a time bin
+    cs = stats.beta.rvs(epsilon, zeta, size=size, random_state=random_state)  # probability of converting while alive and making a session
 
-    columns = ['frequency', 'recency', 'T', 'frequency_before_conversion', 'p', 'theta', 'c', 'alive', 'customer_id']
-    if time_first_purchase:
-        columns.append('time_first_purchase')
-    elif death_time:
-        columns.append('death_time')
-
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
-
-    for i in range(size):
-        p = ps[i]  # probability of making a session, if alive
-        theta = thetas[i]  # probability of dying
-        c = cs[i]  # probability of purchasing, if alive and making a session
-
-        # initial conditions (has a session at 0)
-        x = 0
-        tx = 0
-        alive = True
-        s = 0
-        has_converted = False
-        tfp = np.nan  # time_first_purchase
-        dt = np.nan  # death_time
-
-        # first possibility of purchasing (the first day)
-        converts = np.random.random() <= c
-        if converts:
-            if not has_converted:
-                tfp = 0
-            has_converted = True
-        else:
-            s += 1
-
-        # start testing from t = 1
-        t = 1
-        while t <= T[i]:
-            alive = np.random.random() > theta
-            if alive:
-                has_session = np.random.random() <= p
-                if has_session:
-                    x += 1
-                    tx = t
-                    if not has_converted:
-                        converts = np.random.random() <= c  # see whether this monazza buys too
-                        if converts:
-                            if not has_converted:
-                                tfp = t
-                            has_converted = True
-                        else:
-                            s += 1
-
-                t += 1
-            else:
-                dt = t
-                break
-
-        if time_first_purchase:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i, tfp
-        elif death_time:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i, dt
-        else:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i
-    if compressed:
-        return comp.compress_session_session_before_conversion_data(df)
-    else:
-        return df.set_index('customer_id')
+    return _bgbbbg_data(T, ps, thetas, cs, cs, time_first_purchase, death_time, compressed, random_state)
 
 
 def bgbbbgext_model(T, alpha, beta, gamma, delta, epsilon, zeta, c0, size=1, time_first_purchase=False,
-                    death_time=False, compressed=False):
+                    death_time=False, compressed=False, random_state=None):
     """
         Generate artificial data according to the discrete BG/BB/BG model (modeling conversion as BG).
 
@@ -387,10 +393,12 @@ def bgbbbgext_model(T, alpha, beta, gamma, delta, epsilon, zeta, c0, size=1, tim
                an array.
             time_first_purchase: if true, adds the time of the first purchase of a user (useful for conversion)
             death_time: if true, adds death time
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
         Returns:
             DataFrame, with index as customer_ids and the following columns:
             'frequency', 'recency', 'T', 'frequency_before_conversion', 'p', 'theta', 'c', 'alive', 'customer_id'
         """
+    random_state = check_random_state(random_state)
     if size < 1:
         raise ValueError("size must be positive")
 
@@ -404,77 +412,15 @@ def bgbbbgext_model(T, alpha, beta, gamma, delta, epsilon, zeta, c0, size=1, tim
         size = len(T)
 
     # Generate hidden parameters fo all costumers
-    ps = stats.beta.rvs(alpha, beta, size=size)  # probability of making a session while alive
-    thetas = stats.beta.rvs(gamma, delta, size=size)  # probability of dying at the beginning of a time bin
-    cs = stats.beta.rvs(epsilon, zeta, size=size)  # probability of converting while alive and making a session
+    ps = stats.beta.rvs(alpha, beta, size=size, random_state=random_state)  # probability of making a session while alive
+    thetas = stats.beta.rvs(gamma, delta, size=size, random_state=random_state)  # probability of dying at the beginning of a time bin
+    cs = stats.beta.rvs(epsilon, zeta, size=size, random_state=random_state)  # probability of converting while alive and making a session
 
-    columns = ['frequency', 'recency', 'T', 'frequency_before_conversion', 'p', 'theta', 'c', 'alive', 'customer_id']
-    if time_first_purchase:
-        columns.append('time_first_purchase')
-    elif death_time:
-        columns.append('death_time')
+    return _bgbbbg_data(T, ps, thetas, cs, c0 * np.ones(size), time_first_purchase, death_time, compressed,
+                        random_state)
 
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
-
-    for i in range(size):
-        p = ps[i]  # probability of making a session, if alive
-        theta = thetas[i]  # probability of dying
-        c = cs[i]  # probability of purchasing, if alive and making a session
-
-        # initial conditions (has a session at 0)
-        x = 0
-        tx = 0
-        alive = True
-        s = 0
-        has_converted = False
-        tfp = np.nan  # time_first_purchase
-        dt = np.nan  # death_time
-
-        # first possibility of purchasing (the first day)
-        converts = np.random.random() <= c0
-        if converts:
-            if not has_converted:
-                tfp = 0
-            has_converted = True
-        else:
-            s += 1
-
-        # start testing from t = 1
-        t = 1
-        while t <= T[i]:
-            alive = np.random.random() > theta
-            if alive:
-                has_session = np.random.random() <= p
-                if has_session:
-                    x += 1
-                    tx = t
-                    if not has_converted:
-                        converts = np.random.random() <= c  # see whether this monazza buys too
-                        if converts:
-                            if not has_converted:
-                                tfp = t
-                            has_converted = True
-                        else:
-                            s += 1
-
-                t += 1
-            else:
-                dt = t
-                break
-
-        if time_first_purchase:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i, tfp
-        elif death_time:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i, dt
-        else:
-            df.ix[i] = x, tx, T[i], s, p, theta, c, alive, i
-
-    if compressed:
-        return comp.compress_session_session_before_conversion_data(df)
-    else:
-        return df.set_index('customer_id')
 
-def bgext_model(T, alpha, beta, size=1, compressed=False):
+def bgext_model(T, alpha, beta, size=1, compressed=False, random_state=None):
     """
     Generate artificial data according to the discrete BG extended model.
     This models subscription-like data where a user renews subcription for a series of contiguous times
@@ -487,11 +433,15 @@ def bgext_model(T, alpha, beta, size=1, compressed=False):
         probs: tuple normlized to unity representing the probabilities of ending up in a state different from
         the subscription one. Its length defines the number of alternative states too.
         size: the number of customers to generate, equal to size of T if T is an array.
+        compressed: if true, the compressed data (frequency, T, N) are sampled directly, without generating
+        the customers one by one.
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:
         DataFrame, with index as customer_ids and the following columns:
         'customer_id', 'frequency', 'T', 'p', 'theta'
     """
+    random_state = check_random_state(random_state)
     if size < 1:
         raise ValueError("size must be positive")
 
@@ -504,50 +454,71 @@ def bgext_model(T, alpha, beta, size=1, compressed=False):
         T = np.array(T)
         size = len(T)
 
-    # Generate hidden parameters fo all costumers
-    thetas = stats.beta.rvs(alpha, beta, size=size)  # probability of churning
-    columns = ['frequency', 'T', 'theta', 'customer_id']
-    df = pd.DataFrame(np.zeros((size, len(columns))), columns=columns)
-
-    for i in range(size):
-
-        theta = thetas[i]  # probability of dying
-
-        # start testing from t = 1
-        t = 1
-        ts = []
-        while t <= T[i]:
-            alive = np.random.random() > theta
-            if alive:
-                ts.append(t)
-                t += 1
-            else:
-                break
-
-        df.ix[i] = len(ts), T[i], theta, i
     if compressed:
-        return comp.compress_bgext_data(df)
-    else:
-        return df.set_index('customer_id')
+        return _bgext_compressed_model(T, alpha, beta, random_state)
+
+    # Generate hidden parameters fo all costumers
+    thetas = stats.beta.rvs(alpha, beta, size=size, random_state=random_state)  # probability of churning
 
+    # a customer renews in every time bin it is alive in
+    frequency, _ = _geometric_lifetimes(T, thetas, random_state)
 
-def generate_monetary_values(values, probs, size=1):
+    df = pd.DataFrame({'frequency': frequency, 'T': T, 'theta': thetas, 'customer_id': np.arange(size)},
+                      columns=['frequency', 'T', 'theta', 'customer_id']).astype(float)
+    return df.set_index('customer_id')
+
+
+def _bgext_compressed_model(T, alpha, beta, random_state):
+    """
+    Samples the compressed BG data of customers with ages T.
+    The frequencies of a cohort of n customers with the same T are multinomial over 0..T, with the beta-geometric
+    probabilities B(alpha + 1, beta + f) / B(alpha, beta) of churning after f renewals (f < T) and
+    B(alpha, beta + T) / B(alpha, beta) of being still alive (f = T).
+
+    Returns:
+        DataFrame with columns 'frequency', 'T', 'N', cohorts in order of first appearance in T
+    """
+    T_values, T_codes = np.unique(T, return_inverse=True)
+    cohort_sizes = np.bincount(T_codes)
+    first_appearance = np.argsort(np.unique(T_codes, return_index=True)[1])
+
+    frequencies, ages, Ns = [], [], []
+    for cohort_T, cohort_size in zip(T_values[first_appearance], cohort_sizes[first_appearance]):
+        f = np.arange(int(cohort_T) + 1)
+        log_probs = np.where(f < cohort_T, special.betaln(alpha + 1, beta + f), special.betaln(alpha, beta + cohort_T))
+        probs = np.exp(log_probs - special.betaln(alpha, beta))
+        N = random_state.multinomial(cohort_size, probs / probs.sum())
+        observed = N > 0
+        frequencies.append(f[observed])
+        ages.append(np.repeat(cohort_T, observed.sum()))
+        Ns.append(N[observed])
+
+    return pd.DataFrame({'frequency': np.concatenate(frequencies).astype(float),
+                         'T': np.concatenate(ages).astype(float),
+                         'N': np.concatenate(Ns).astype(np.int64)},
+                        columns=['frequency', 'T', 'N'])
+
+
+def generate_monetary_values(values, probs, size=1, random_state=None):
     """
     Generate monetary value data, ideally one per user, according to the multinomial distribution given as input.
     Args:
         values: values of distribution
         probs:  probabilities associated at the values
         size:   number of samples
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:            generated data
     """
+    random_state = check_random_state(random_state)
+
     # normalize probs first
     tot_prob = sum(probs)
     probs = [float(p) / tot_prob for p in probs]
 
     # you've gotta sample a multinomial distribution
 
-    sampled_frequencies = np.random.multinomial(size, probs)
+    sampled_frequencies = random_state.multinomial(size, probs)
     sampled_values = []
     j = 0
     for frequency in sampled_frequencies:
@@ -555,16 +526,17 @@ def generate_monetary_values(values, probs, size=1):
             sampled_values.append(values[j])
         j += 1
 
-    random.shuffle(sampled_values)
+    random_state.shuffle(sampled_values)
     return sampled_values
 
 
-def sample_monetary_values(size=1, filename="datasets/weekly_monetary_values_sample.csv"):
+def sample_monetary_values(size=1, filename="datasets/weekly_monetary_values_sample.csv", random_state=None):
     """
     Generate monetary value data, sampled from an input csv.
     Args:
         size:   number of samples
         filename: file from where to sample
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
 
     Returns:            generated data
     """
@@ -575,23 +547,25 @@ def sample_monetary_values(size=1, filename="datasets/weekly_monetary_values_sam
         reader = csv.reader(csvfile)
         for row in reader:
             values.append(float(row[0]))
-    return np.random.choice(values, size)
+    return check_random_state(random_state).choice(values, size)
 
 
-def generate_pareto_data_for_T_N(T, N, params):
+def generate_pareto_data_for_T_N(T, N, params, random_state=None):
     """
     Quick data generator over time
     :param T:       Max T to generate
     :param N:       How many users per T
     :param params:  The pareto params
     :type params:   dict
+    :param random_state:  None (the global numpy random state), a seed or a numpy.random.RandomState
     :return:        Generated data
     """
     from lifetimes import models
+    random_state = check_random_state(random_state)
     pareto = models.ParetoNBDModel()
     data = pd.DataFrame()
     for t in range(T + 1):
-        new_data = pareto.generateData(t, params, N)
+        new_data = pareto.generateData(t, params, N, random_state=random_state)
         data = pd.concat([data, new_data])
     return data
 
@@ -1,15 +1,18 @@
 from __future__ import print_function
 from __future__ import absolute_import
 import math
+import copy
+from collections import OrderedDict
 from .estimation import BetaGeoFitter, ModifiedBetaGeoFitter, ParetoNBDFitter, BGBBFitter, BGBBBGExtFitter, BGFitter
 import numpy as np
 import pandas as pd
 from . import generate_data as gen
-import random
-import copy
+from multiprocessing import Pool, cpu_count
+from multiprocessing.sharedctypes import RawArray
 from abc import abstractmethod
 import uncertainties
-from lifetimes.utils import multinomial_sample
+from lifetimes.utils import check_random_state, spawn_random_states, numerical_jacobian, delta_method_errors
+from lifetimes.data_compression import compress
 
 
 class Model(object):
@@ -22,7 +25,9 @@ class Model(object):
         self.param_names = None
         self.params, self.params_C = None, None
         self.sampled_parameters = None  # result of a bootstrap
-        self.uparams = None
+        self._uparams = None  # built on first use, see uparams
+        self.data_columns = ['frequency', 'recency', 'T']  # the columns the fitter is fitted on
+        self.fitter_has_gradient = False  # if the likelihood of the fitter can return its gradient (jac)
 
     def is_ready(self):
         return self.params is not None and  self.params_C is not None
@@ -42,7 +47,8 @@ class Model(object):
             return False
         return True
 
-    def fit(self, frequency, recency, T, bootstrap_size=10, N=None, initial_params=None, iterative_fitting=0):
+    def fit(self, frequency, recency, T, bootstrap_size=10, N=None, initial_params=None, iterative_fitting=0,
+            random_state=None, n_jobs=1, covariance='bootstrap', **bootstrap_options):
         """
         Fit the model to data, finding parameters and their errors, and assigning them to internal variables
         Args:
@@ -51,59 +57,98 @@ class Model(object):
             T: the vector of customers' age (time since first purchase)
             bootstrap_size: number of data-samplings used to address parameter uncertainty
             N:  count of users matching FRT (compressed data), if absent data are assumed to be non-compressed
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
+            n_jobs: number of bootstrap re-samplings fitted in parallel worker processes. -1 uses all the available cores.
+            covariance: 'bootstrap' estimates the covariance of the parameters by refitting bootstrap_size
+                re-samplings of the data, 'hessian' by the inverse Hessian of the likelihood (see
+                _estimate_uncertainties_with_hessian), at the cost of about one more fit.
+            bootstrap_options: options of the bootstrap, like warm_start, jitter, max_nfev or resampling
+                (see _estimate_uncertainties_with_bootstrap).
+        """
+        self._fit_with_uncertainties({'frequency': frequency, 'recency': recency, 'T': T, 'N': N}, bootstrap_size,
+                                     initial_params, iterative_fitting, random_state, n_jobs, covariance,
+                                     bootstrap_options)
+
+    def _fit_with_uncertainties(self, columns, bootstrap_size, initial_params, iterative_fitting, random_state,
+                                n_jobs, covariance, bootstrap_options):
+        """
+        Fits the fitter to the columns, a dictionary of the data arguments of fitter.fit, and estimates the
+        covariance of the parameters, as described in fit. The data are compressed if columns['N'] is not None.
         """
-        self.fitter.fit(frequency=frequency, recency=recency, T=T, N=N, initial_params=initial_params,
-                        iterative_fitting=iterative_fitting)
+        random_state = check_random_state(random_state)
+        self.fitter.fit(initial_params=initial_params, iterative_fitting=iterative_fitting, random_state=random_state,
+                        **dict(columns, **self._fitter_options(covariance)))
 
         self.params = self.fitter.params_
+        if covariance == 'hessian':
+            self._estimate_uncertainties_with_hessian()
+            return
 
-        if N is None:
-            data = pd.DataFrame({'frequency': frequency, 'recency': recency, 'T': T})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size)
-        else:
-            data = pd.DataFrame({'frequency': frequency, 'recency': recency, 'T': T, 'N': N})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size, compressed_data=True)
+        compressed_data = columns['N'] is not None
+        data = pd.DataFrame(dict((name, values) for name, values in columns.items() if values is not None))
+        self._estimate_uncertainties_with_bootstrap(data, bootstrap_size, compressed_data=compressed_data,
+                                                    random_state=random_state, n_jobs=n_jobs, **bootstrap_options)
 
     @abstractmethod
-    def generateData(self, t, parameters, size):
+    def generateData(self, t, parameters, size, random_state=None):
         """
         Generate a dataset with from the current model
         Args:
             t: purchase time horizon
             parameters: dictionary with keys r,alpha,a,b and parameter values
             size: number of samples to generate
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
         Returns:    dataframe with keys 'recency','frequency','T'
         """
         pass
 
-    def _estimate_uncertainties_with_bootstrap(self, data, size=10, compressed_data=False):
+    def _estimate_uncertainties_with_bootstrap(self, data, size=10, compressed_data=False, random_state=None,
+                                               n_jobs=1, warm_start=True, jitter=0., max_nfev=None,
+                                               resampling='multinomial'):
         """
         Calculate parameter covariance Matrix by bootstrapping trainig data.
+        Id-level data are compressed first: every re-sampling only draws the number of customers of each unique
+        row, and is fitted as compressed data, without copying the rows.
 
         Args:
-            data:   pandas data farme containing 3 columns labelled 'frequency' 'recency' 'T'
+            data:   pandas data farme containing the data_columns of the model ('frequency' 'recency' 'T' by default)
             size:   number of re-samplings
+            compressed_data: if true, data contain the 'N' column too, with the number (or weight) of customers
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState.
+                Every re-sampling runs on its own stream spawned from it (see utils.spawn_random_states), so the
+                result does not depend on n_jobs.
+            n_jobs: number of re-samplings fitted in parallel worker processes. -1 uses all the available cores.
+            warm_start: if true, the re-samplings are fitted starting from the optimum of the full data, that they
+                barely move, instead of from random points.
+            jitter: standard deviation of the log-normal noise multiplying the warm start of every re-sampling.
+            max_nfev: maximum number of likelihood evaluations of every re-sampling fit. By default, the warm started
+                fits get 3 times the evaluations of the full fit, and the cold started ones no budget.
+            resampling: 'multinomial' draws as many customers as the data, like re-sampling the rows with
+                replacement; 'poisson' draws the customers of every row independently, as Poisson(N).
         """
 
-        if not all(column in data.columns for column in ['frequency', 'recency', 'T']):
-            raise ValueError("given data do not contain the 3 magic columns.")
+        if not all(column in data.columns for column in self.data_columns):
+            raise ValueError("given data do not contain the %d magic columns." % len(self.data_columns))
         if size < 2:
             raise ValueError("Run at least 2 samplings to get a covariance.")
+        if resampling not in ('multinomial', 'poisson'):
+            raise ValueError("Unknown resampling %s: must be 'multinomial' or 'poisson'." % resampling)
 
-        par_estimates = []
-
-        tmp_fitter = copy.deepcopy(self.fitter)
-        for i in range(size):
-            N = len(data)
-            if compressed_data is False:
-                sampled_data = data.sample(N, replace=True)
-                tmp_fitter.fit(sampled_data['frequency'], sampled_data['recency'], sampled_data['T'])
-            else:
-                # in case of compressed data you've gotta sample a multinomial distribution
-                N = data['N']
-                sampled_N = multinomial_sample(N)
-                tmp_fitter.fit(frequency=data['frequency'], recency=data['recency'], T=data['T'], N=sampled_N)
-            par_estimates.append(tmp_fitter.params_)
+        if compressed_data:
+            data = data[self.data_columns + ['N']]
+        else:
+            data = compress(data, self.data_columns)
+
+        # a fresh fitter, as the fitted one holds closures over its data that can't be sent to worker processes
+        fitter = self.fitter.__class__(penalizer_coef=self.fitter.penalizer_coef)
+        initial_params = self._fitted_optimum() if warm_start else None
+        if max_nfev is None and initial_params is not None:
+            # a re-sampling starts next to its own optimum, so it never needs more evaluations than the full fit,
+            # that started from random points: the budget only stops the fits that wander off
+            max_nfev = 3 * self.fitter.fit_summary_['nfev']
+        fit_options = {} if max_nfev is None else {'max_nfev': max_nfev}
+        par_estimates = _bootstrap(fitter, data, spawn_random_states(random_state, size), n_jobs, resampling,
+                                   initial_params, jitter, fit_options)
 
         par_lists = []
         for par_name in self.param_names:
@@ -117,6 +162,56 @@ class Model(object):
         self.sampled_parameters = par_estimates
         self.set_parameters(self.params, cov)
 
+    def _fitter_options(self, covariance):
+        """
+        Returns the options of fitter.fit needed by the covariance estimate: the Hessian of the likelihood, computed
+        from its gradient when the fitter has one.
+        """
+        if covariance not in ('bootstrap', 'hessian'):
+            raise ValueError("Unknown covariance %s: must be 'bootstrap' or 'hessian'." % covariance)
+        if covariance == 'bootstrap':
+            return {}
+        if self.fitter_has_gradient:
+            return {'hessian': True, 'jac': True}
+        return {'hessian': True}
+
+    def _estimate_uncertainties_with_hessian(self):
+        """
+        Calculate parameter covariance Matrix as the inverse of the observed information, i.e. of the Hessian of the
+        negative log-likelihood at its minimum, computed by the fitter (fitted with hessian=True).
+        It relies on the asymptotic normality of the maximum likelihood estimates, as the bootstrap does, and needs
+        no refit. With a penalizer, the Hessian is the one of the penalized likelihood.
+        """
+        hessian = self.fitter.fit_summary_.get('hessian')
+        if hessian is None:
+            raise ValueError("The fitter has not computed the Hessian: fit it with hessian=True.")
+        try:
+            np.linalg.cholesky(hessian)
+        except np.linalg.LinAlgError:
+            raise ValueError("The Hessian of the likelihood is not positive definite: the fit did not reach a minimum.")
+        cov = np.linalg.inv(hessian)
+
+        # the Hessian is in the units of the minimizer (the BG/NBD fitters rescale time), that differ from the ones of
+        # the parameters by a factor per parameter
+        scale = np.array([self.params[par_name] for par_name in self.param_names]) / self._fitted_optimum()
+        cov = cov * np.outer(scale, scale)
+
+        self.sampled_parameters = None
+        self.set_parameters(self.params, cov)
+
+    def _fitted_optimum(self):
+        """
+        Returns the optimum of the last fit of the fitter, in the units of the minimizer (the BG/NBD fitters rescale
+        time), or None if the fitter has not been fitted.
+        """
+        summary = getattr(self.fitter, 'fit_summary_', None)
+        if summary is None:
+            return None
+        ll = [start['fun'] for start in summary['starts']]
+        if np.all(np.isnan(ll)):
+            return None
+        return np.asarray(summary['starts'][int(np.nanargmin(ll))]['params'], dtype=float)
+
     def set_parameters(self, pars, cov):
         """
         Sets patameters and their covariance matrix
@@ -132,56 +227,139 @@ class Model(object):
         self.params = {}
         for par_name in self.param_names:
             self.params[par_name] = pars[par_name]
+        self._uparams = None
 
-        # set uparams once for all
-        if self.param_names is None or self.params is None or self.params_C is None:
-            return None
-        par_values = uncertainties.correlated_values([self.params[par_name] for par_name in self.param_names],
-                                                     self.params_C)
-        self.uparams = {}
-        for i in range(len(self.param_names)):
-            self.uparams[self.param_names[i]] = par_values[i]
+    @property
+    def uparams(self):
+        """
+        Dictionary of the parameters as correlated uncertainties objects, or None if the model is not ready.
+        They are only needed by the predictions asked with uncertain=True, so they are built on first use.
+        """
+        if self._uparams is None and self.is_ready():
+            par_values = uncertainties.correlated_values([self.params[par_name] for par_name in self.param_names],
+                                                         self.params_C)
+            self._uparams = dict(zip(self.param_names, par_values))
+        return self._uparams
+
+    def _uncertain(self, function, n_params, *args):
+        """
+        Evaluates a static function of the fitter on the first n_params parameters of uparams, scalar arguments
+        only. The result is an uncertainties object, that keeps the correlations with the parameters and with the
+        other predictions, at the cost of a propagation per call.
+        """
+        uparams = [self.uparams[par_name] for par_name in self.param_names[:n_params]]
+        return uncertainties.wrap(function)(*(uparams + list(args)))
 
-    def evaluate_metrics_with_simulation(self, N, t, N_sim=10, max_x=10, tag='frequency'):
+    def predict_with_errors(self, method, *args):
         """
+        Evaluates a prediction method of the fitter with the parameters of the model, and its errors by the delta
+        method. The method is vectorized over its arguments (horizons, customers' histories), and the Jacobian in
+        the parameters is computed for all of them at once, with two evaluations of the method per parameter.
+        Args:
+            method: name of the method of the fitter, e.g. 'conditional_expected_number_of_purchases_up_to_time'
+            args:   arguments of the method
+
+        Returns:
+            a tuple of two elements: the values and their errors (scalars or arrays)
+        """
+        if not self.is_ready():
+            raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+
+        def evaluate(par_values):
+            fitter = copy.copy(self.fitter)
+            fitter.params_ = OrderedDict(zip(self.param_names, par_values))
+            return getattr(fitter, method)(*args)
+
+        par_values = np.array([self.params[par_name] for par_name in self.param_names], dtype=float)
+        jacobian = numerical_jacobian(evaluate, par_values)
+        return evaluate(par_values), delta_method_errors(jacobian, self.params_C)
+
+    def evaluate_metrics(self, N, t, N_sim=10, max_x=10, tag='frequency', random_state=None):
+        """
+        Computes the probabilities of x transactions up to time t, and their errors, without simulating data when the
+        model has a closed form for them (see _probabilities_of_purchases_up_to_time): the probabilities are
+        evaluated for every sampled parameter vector at once, and their errors combine the spread over the parameters
+        with the multinomial fluctuation of N users. The other models fall back to evaluate_metrics_with_simulation.
         Args:
             N:      number of users you're referring to
             t:      time horizon you're looking at
-            N_sim:        Number of simulations
+            N_sim:        Number of parameter samples drawn if the model has no bootstrap samples (or of
+                simulations, in the fall back)
             max_x:         Maximum number of transactions you want to consider
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
         Returns:    The numerical metrics
         """
+        random_state = check_random_state(random_state)
+        if tag != 'frequency':
+            return self.evaluate_metrics_with_simulation(N, t, N_sim, max_x, tag, random_state)
 
-        if self.params is None or self.params_C is None or self.sampled_parameters is None:
-            raise ValueError("Model has not been fit yet. Please call the '.fit' method first.")
+        par_values = self._parameter_samples(N_sim, random_state)
+        p = self._probabilities_of_purchases_up_to_time(t, [par_values[:, i] for i in range(len(self.param_names))])
+        if p is None:
+            return self.evaluate_metrics_with_simulation(N, t, N_sim, max_x, tag, random_state)
 
-        xs = range(max_x)
+        p_x = np.zeros((max_x, len(par_values)))
+        n_bins = min(max_x - 1, len(p))
+        p_x[:n_bins] = p[:n_bins]
+        p_x[max_x - 1] = p[max_x - 1:].sum(axis=0)  # the last bin is cumulative
 
-        frequencies = {}
-        for x in xs:
-            frequencies[x] = []
-        p_x = [None] * max_x
-        p_x_err = [None] * max_x
+        p_x_err = np.sqrt(p_x.var(axis=1) + (p_x * (1 - p_x)).mean(axis=1) / N)
+        return NumericalMetrics(list(p_x.mean(axis=1)), list(p_x_err))
 
-        for sim_i in range(N_sim):
-            par_s = self.sampled_parameters[
-                random.randint(0, len(self.sampled_parameters) - 1)]  # pick up a random outcome of the fit
-            data = self.generateData(t, par_s, N)
+    def _probabilities_of_purchases_up_to_time(self, t, parameters):
+        """
+        Args:
+            t:  time horizon
+            parameters: list with the array of values of every parameter
+
+        Returns:
+            the probabilities of 0..t transactions up to time t, with shape (t + 1, number of parameter values),
+            or None if the model has no closed form for them
+        """
+        return None
+
+    def _parameter_samples(self, size, random_state=None):
+        """
+        Returns the bootstrap samples of the parameters, as an array with a column per parameter, or, if the
+        covariance does not come from a bootstrap, size draws from the normal distribution of the parameters
+        (the draws out of the domain, with non positive values, are discarded).
+        """
+        if self.params is None or self.params_C is None:
+            raise ValueError("Model has not been fit yet. Please call the '.fit' method first.")
+        if self.sampled_parameters is not None:
+            return np.array([[par[par_name] for par_name in self.param_names] for par in self.sampled_parameters])
+
+        random_state = check_random_state(random_state)
+        par_values = random_state.multivariate_normal([self.params[par_name] for par_name in self.param_names],
+                                                      self.params_C, size)
+        return par_values[np.all(par_values > 0, axis=1)]
+
+    def evaluate_metrics_with_simulation(self, N, t, N_sim=10, max_x=10, tag='frequency', random_state=None):
+        """
+        Args:
+            N:      number of users you're referring to
+            t:      time horizon you're looking at
+            N_sim:        Number of simulations
+            max_x:         Maximum number of transactions you want to consider
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
+        Returns:    The numerical metrics
+        """
+        random_state = check_random_state(random_state)
+        par_values = self._parameter_samples(N_sim, random_state)
+
+        frequencies = []
+        for simulation_state in spawn_random_states(random_state, N_sim):
+            par_s = self.parameters_dictionary_from_list(
+                par_values[simulation_state.randint(len(par_values))])  # pick up a random outcome of the fit
+            data = self.generateData(t, par_s, N, random_state=simulation_state)
             if tag not in data:
                 raise ValueError("Unreconized column: " + tag)
-            n = len(data)
-            for x in xs:
-                if x == max_x - 1:
-                    n_success = len(data[data[tag] >= x])  # the last bin is cumulative
-                else:
-                    n_success = len(data[data[tag] == x])
-                frequencies[x].append(float(n_success) / n)
+            values = np.asarray(data[tag]).astype(int)
+            counts = np.bincount(np.minimum(values, max_x - 1), minlength=max_x)  # the last bin is cumulative
+            frequencies.append(counts / float(len(values)))
 
-        for x in xs:
-            p_x_err[x] = np.std(frequencies[x])  # contain statistic + systematic errors, entangled
-            p_x[x] = np.mean(frequencies[x])
-
-        return NumericalMetrics(p_x, p_x_err)
+        # contain statistic + systematic errors, entangled
+        return NumericalMetrics(list(np.mean(frequencies, axis=0)), list(np.std(frequencies, axis=0)))
 
     def parameters_dictionary_from_list(self, parameters):
         """
@@ -210,10 +388,11 @@ class BetaGeoModel(Model):
         super(BetaGeoModel, self).__init__()
         self.fitter = BetaGeoFitter(penalizer_coef)
         self.param_names = ['r', 'alpha', 'a', 'b']
+        self.fitter_has_gradient = True
 
-    def generateData(self, t, parameters, size):
+    def generateData(self, t, parameters, size, random_state=None):
         return gen.beta_geometric_nbd_model(t, parameters['r'], parameters['alpha'], parameters['a'], parameters['b'],
-                                            size)
+                                            size, random_state=random_state)
 
 
 class ModifiedBetaGeoModel(Model):
@@ -225,11 +404,12 @@ class ModifiedBetaGeoModel(Model):
         super(ModifiedBetaGeoModel, self).__init__()
         self.fitter = ModifiedBetaGeoFitter(penalizer_coef)
         self.param_names = ['r', 'alpha', 'a', 'b']
+        self.fitter_has_gradient = True
 
-    def generateData(self, t, parameters, size):
+    def generateData(self, t, parameters, size, random_state=None):
         return gen.modified_beta_geometric_nbd_model(t, parameters['r'], parameters['alpha'], parameters['a'],
                                                      parameters['b'],
-                                                     size)
+                                                     size, random_state=random_state)
 
 
 class ParetoNBDModel(Model):
@@ -241,30 +421,32 @@ class ParetoNBDModel(Model):
         super(ParetoNBDModel, self).__init__()
         self.fitter = ParetoNBDFitter(penalizer_coef)
         self.param_names = ['r', 'alpha', 's', 'beta']
-        self.wrapped_static_expected_number_of_purchases_up_to_time = \
-            uncertainties.wrap(ParetoNBDFitter.static_expected_number_of_purchases_up_to_time)
-
+        self.fitter_has_gradient = True
 
-    def generateData(self, t, parameters, size):
+    def generateData(self, t, parameters, size, random_state=None):
         return gen.pareto_nbd_model(t, parameters['r'], parameters['alpha'], parameters['s'],
                                     parameters['beta'],
-                                    size)
+                                    size, random_state=random_state)
 
-    def expected_number_of_purchases_up_to_time(self, t):
+    def expected_number_of_purchases_up_to_time(self, t, uncertain=False):
         """
         Args:
             t: a scalar or array of times
+            uncertain: if true, returns an uncertainties object correlated with uparams instead (scalar t only)
 
         Returns:
-            a tuple of two elements: the first is the expected value (or an array of them) and the second is the error
-            associated to it (or an array of them)
+            a tuple of two elements: the expected values and their errors, propagated with the analytic derivatives
+            for all the times at once
         """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(ParetoNBDFitter.static_expected_number_of_purchases_up_to_time, 4, t)
 
-        uparams = self.uparams
-        r, a, s, b = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_expected_number_of_purchases_up_to_time(r, a, s, b, t)
+        t = np.asarray(t)
+        r, a, s, b = [self.params[par_name] for par_name in self.param_names]
+        return ParetoNBDFitter.static_expected_number_of_purchases_up_to_time(r, a, s, b, t), \
+            ParetoNBDFitter.static_expected_number_of_purchases_up_to_time_error(r, a, s, b, t, self.params_C)
 
 
 class BGBBModel(Model):
@@ -276,33 +458,50 @@ class BGBBModel(Model):
         super(BGBBModel, self).__init__()
         self.fitter = BGBBFitter(penalizer_coef)
         self.param_names = ['alpha', 'beta', 'gamma', 'delta']
-        self.wrapped_static_expected_number_of_purchases_up_to_time = \
-            uncertainties.wrap(BGBBFitter.static_expected_number_of_purchases_up_to_time)
-        self.wrapped_static_probability_of_n_purchases_up_to_time = \
-            uncertainties.wrap(BGBBFitter.static_probability_of_n_purchases_up_to_time)
+        self.fitter_has_gradient = True
 
-    def generateData(self, t, parameters, size):
+    def _probabilities_of_purchases_up_to_time(self, t, parameters):
+        return BGBBFitter.static_probabilities_of_purchases_up_to_time(*(parameters + [t]))
+
+    def generateData(self, t, parameters, size, random_state=None):
         return gen.bgbb_model(t, parameters['alpha'],
                               parameters['beta'],
                               parameters['gamma'],
                               parameters['delta'],
-                              size)
+                              size, random_state=random_state)
+
+    def expected_number_of_purchases_up_to_time(self, t, uncertain=False):
+        """
+        Args:
+            t: a scalar or array of times
+            uncertain: if true, returns an uncertainties object correlated with uparams instead (scalar t only)
 
-    def expected_number_of_purchases_up_to_time(self, t):
+        Returns:
+            a tuple of two elements: the expected values and their errors, propagated with the analytic derivatives
+            for all the times at once
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGBBFitter.static_expected_number_of_purchases_up_to_time, 4, t)
 
-        uparams = self.uparams
-        a, b, g, d = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_expected_number_of_purchases_up_to_time(a, b, g, d, t)
+        t = np.asarray(t)
+        a, b, g, d = [self.params[par_name] for par_name in self.param_names]
+        return BGBBFitter.static_expected_number_of_purchases_up_to_time(a, b, g, d, t), \
+            BGBBFitter.static_expected_number_of_purchases_up_to_time_error(a, b, g, d, t, self.params_C)
 
-    def probability_of_n_purchases_up_to_time(self, t, n):
+    def probability_of_n_purchases_up_to_time(self, t, n, uncertain=False):
+        """
+        Returns:
+            a tuple with the probability of n purchases up to time t and its error (see predict_with_errors), or an
+            uncertainties object correlated with uparams if uncertain
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGBBFitter.static_probability_of_n_purchases_up_to_time, 4, t, n)
 
-        uparams = self.uparams
-        a, b, g, d = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_probability_of_n_purchases_up_to_time(a, b, g, d, t, n)
+        return self.predict_with_errors('probability_of_n_purchases_up_to_time', t, n)
 
 
 class BGBBBGExtModel(Model):
@@ -314,22 +513,32 @@ class BGBBBGExtModel(Model):
         super(BGBBBGExtModel, self).__init__()
         self.fitter = BGBBBGExtFitter(penalizer_coef)
         self.param_names = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'c0']
-        self.wrapped_static_expected_number_of_sessions_up_to_time = \
-            uncertainties.wrap(BGBBBGExtFitter.static_expected_number_of_sessions_up_to_time)
-        self.wrapped_static_probability_of_n_sessions_up_to_time = \
-            uncertainties.wrap(BGBBBGExtFitter.static_probability_of_n_sessions_up_to_time)
-        self.wrapped_static_expected_probability_of_converting_at_time = \
-            uncertainties.wrap(BGBBBGExtFitter.static_regularized_expected_probability_of_converting_at_time)
-
-    def corrected_wrapped_static_expected_probability_of_converting_at_time(self, a, b, g, d, e, z, c0, t):
-        uvalue = self.wrapped_static_expected_probability_of_converting_at_time(a, b, g, d, e, z, c0, t)
-        if math.isnan(uvalue.n) or uvalue.n > 1.0 or uvalue.n < 0.0:
-            uvalue = uncertainties.ufloat(0.0, 0.0)
-        if math.isnan(uvalue.s) or uvalue.s > 1.0:
-            uvalue = uncertainties.ufloat(uvalue.n, 0.0)
+        self.data_columns = ['frequency', 'recency', 'T', 'frequency_before_conversion']
+
+    @staticmethod
+    def _corrected_probability(value, error):
+        """
+        Replaces the probabilities outside of [0, 1] (and their errors) with 0, and the undefined or larger than one
+        errors with 0.
+        """
+        if math.isnan(value) or value > 1.0 or value < 0.0:
+            return 0.0, 0.0
+        if math.isnan(error) or error > 1.0:
+            return value, 0.0
+        return value, error
+
+    def _uncertain_probability_of_converting_at_time(self, t):
+        uvalue = self._uncertain(BGBBBGExtFitter.static_regularized_expected_probability_of_converting_at_time, 7, t)
+        value, error = self._corrected_probability(uvalue.n, uvalue.s)
+        if (value, error) != (uvalue.n, uvalue.s):
+            uvalue = uncertainties.ufloat(value, error)
         return uvalue
 
-    def generateData(self, t, parameters, size):
+    def _probabilities_of_purchases_up_to_time(self, t, parameters):
+        # the frequency counts the sessions, that follow the BG/BB model of the first four parameters
+        return BGBBFitter.static_probabilities_of_purchases_up_to_time(*(parameters[:4] + [t]))
+
+    def generateData(self, t, parameters, size, random_state=None):
         return gen.bgbbbgext_model(t, parameters['alpha'],
                                    parameters['beta'],
                                    parameters['gamma'],
@@ -337,10 +546,11 @@ class BGBBBGExtModel(Model):
                                    parameters['epsilon'],
                                    parameters['zeta'],
                                    parameters['c0'],
-                                   size)
+                                   size, random_state=random_state)
 
     def fit(self, frequency, recency, T, bootstrap_size=10, N=None, initial_params=None,
-            iterative_fitting=0, frequency_before_conversion=None):
+            iterative_fitting=0, frequency_before_conversion=None, random_state=None, n_jobs=1,
+            covariance='bootstrap', **bootstrap_options):
         """
         Fit the model to data, finding parameters and their errors, and assigning them to internal variables
         Args:
@@ -350,98 +560,80 @@ class BGBBBGExtModel(Model):
             bootstrap_size: number of data-samplings used to address parameter uncertainty
             N:  count of users matching FRT (compressed data), if absent data are assumed to be non-compressed
             frequency_before_conversion:  the frequency vector of customers' sessions before first purchase--> Must be a valid array
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
+            n_jobs: number of bootstrap re-samplings fitted in parallel worker processes. -1 uses all the available cores.
+            covariance, bootstrap_options: see Model.fit.
         """
 
         if frequency_before_conversion is None:
             raise ValueError("You must provide a valid vector of frequency_before_purchase")
 
-        self.fitter.fit(frequency=frequency, recency=recency, T=T,
-                        frequency_before_conversion=frequency_before_conversion, N=N,
-                        initial_params=initial_params,
-                        iterative_fitting=iterative_fitting)
-
-        self.params = self.fitter.params_
-
-        if N is None:
-            data = pd.DataFrame(
-                {'frequency': frequency, 'recency': recency, 'T': T,
-                 'frequency_before_conversion': frequency_before_conversion})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size)
-        else:
-            data = pd.DataFrame(
-                {'frequency': frequency, 'recency': recency, 'T': T,
-                 'frequency_before_conversion': frequency_before_conversion, 'N': N})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size, compressed_data=True)
+        columns = {'frequency': frequency, 'recency': recency, 'T': T,
+                   'frequency_before_conversion': frequency_before_conversion, 'N': N}
+        self._fit_with_uncertainties(columns, bootstrap_size, initial_params, iterative_fitting, random_state, n_jobs,
+                                     covariance, bootstrap_options)
 
-    def _estimate_uncertainties_with_bootstrap(self, data, size=10, compressed_data=False):
-
-        if not all(column in data.columns for column in ['frequency', 'recency', 'T', 'frequency_before_conversion']):
-            raise ValueError("given data do not contain the 4 magic columns.")
-        if size < 2:
-            raise ValueError("Run at least 2 samplings to get a covariance.")
-
-        par_estimates = []
-
-        tmp_fitter = copy.deepcopy(self.fitter)
-        for i in range(size):
-            N = len(data)
-            if compressed_data is False:
-                sampled_data = data.sample(N, replace=True)
-                tmp_fitter.fit(sampled_data['frequency'], sampled_data['recency'], sampled_data['T'],
-                               sampled_data['frequency_before_conversion'])
-            else:
-                # in case of compressed data you've gotta sample a multinomial distribution
-                N = data['N']
-                N_sum = sum(N)
-                prob = [float(n) / N_sum for n in N]
-                sampled_N = np.random.multinomial(N_sum, prob, size=1)
-                tmp_fitter.fit(frequency=data['frequency'], recency=data['recency'], T=data['T'],
-                               frequency_before_conversion=data['frequency_before_conversion'], N=sampled_N[0])
-            par_estimates.append(tmp_fitter.params_)
-
-        par_lists = []
-        for par_name in self.param_names:
-            par_lists.append([par[par_name] for par in par_estimates])
-
-        par_lists = remove_outliers_from_fitted_params(par_lists)
-        x = np.vstack(par_lists)
-        cov = np.cov(x)
-
-        self.sampled_parameters = par_estimates
-        self.set_parameters(self.params, cov)
+    def expected_number_of_sessions_up_to_time(self, t, uncertain=False):
+        """
+        Args:
+            t: a scalar or array of times
+            uncertain: if true, returns an uncertainties object correlated with uparams instead (scalar t only)
 
-    def expected_number_of_sessions_up_to_time(self, t):
+        Returns:
+            a tuple of two elements: the expected values and their errors, propagated with the analytic derivatives
+            for all the times at once
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGBBBGExtFitter.static_expected_number_of_sessions_up_to_time, 4, t)
 
-        uparams = self.uparams
-        a, b, g, d, e, z, c0 = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_expected_number_of_sessions_up_to_time(a, b, g, d, t)
+        t = np.asarray(t)
+        a, b, g, d = [self.params[par_name] for par_name in self.param_names[:4]]
+        # the sessions only depend on alpha, beta, gamma and delta
+        C = np.asarray(self.params_C)[:4, :4]
+        return BGBBBGExtFitter.static_expected_number_of_sessions_up_to_time(a, b, g, d, t), \
+            BGBBFitter.static_expected_number_of_purchases_up_to_time_error(a, b, g, d, t, C)
 
-    def probability_of_n_sessions_up_to_time(self, t, n):
+    def probability_of_n_sessions_up_to_time(self, t, n, uncertain=False):
+        """
+        Returns:
+            a tuple with the probability of n sessions up to time t and its error (see predict_with_errors), or an
+            uncertainties object correlated with uparams if uncertain
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGBBBGExtFitter.static_probability_of_n_sessions_up_to_time, 4, t, n)
 
-        uparams = self.uparams
-        a, b, g, d, e, z, c0 = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_probability_of_n_sessions_up_to_time(a, b, g, d, t, n)
+        return self.predict_with_errors('probability_of_n_sessions_up_to_time', t, n)
 
-    def expected_probability_of_converting_at_time(self, t):
+    def expected_probability_of_converting_at_time(self, t, uncertain=False):
+        """
+        Returns:
+            a tuple with the probability of converting at time t and its error (see predict_with_errors), or an
+            uncertainties object correlated with uparams if uncertain. Values out of [0, 1] are replaced with 0.
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain_probability_of_converting_at_time(t)
 
-        uparams = self.uparams
-        a, b, g, d, e, z, c0 = [uparams[par_name] for par_name in self.param_names]
-        return self.corrected_wrapped_static_expected_probability_of_converting_at_time(a, b, g, d, e, z, c0, t)
+        return self._corrected_probability(*self.predict_with_errors('expected_probability_of_converting_at_time', t))
 
-    def expected_probability_of_converting_within_time(self, t):  #TODO: unstable.. fix it
+    def expected_probability_of_converting_within_time(self, t, uncertain=False):  #TODO: unstable.. fix it
+        """
+        Returns:
+            a tuple with the probability of converting up to time t and its error, or an uncertainties object
+            correlated with uparams if uncertain
+        """
         if not self.is_ready():
             raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return sum(self._uncertain_probability_of_converting_at_time(ti) for ti in range(t + 1))
 
-        res = 0.0
-        for ti in range(t + 1):
-            res += self.expected_probability_of_converting_at_time(ti)
-        return res
+        return self._corrected_probability(
+            *self.predict_with_errors('expected_probability_of_converting_within_time', t))
 
 
 class BGModel(Model):
@@ -453,20 +645,20 @@ class BGModel(Model):
         super(BGModel, self).__init__()
         self.fitter = BGFitter(penalizer_coef)
         self.param_names = ['alpha', 'beta']
+        self.data_columns = ['frequency', 'T']
         self.params, self.params_C = None, None
         self.sampled_parameters = None  # result of a bootstrap
-        self.uparams = None
-        self.wrapped_static_expected_number_of_purchases_up_to_time = \
-            uncertainties.wrap(BGFitter.static_expected_number_of_purchases_up_to_time)
-        self.wrapped_static_probability_of_n_purchases_up_to_time = \
-            uncertainties.wrap(BGFitter.static_probability_of_n_purchases_up_to_time)
 
-    def generate_data(self, t, parameters, size):
+    def _probabilities_of_purchases_up_to_time(self, t, parameters):
+        return BGFitter.static_probabilities_of_purchases_up_to_time(*(parameters + [t]))
+
+    def generate_data(self, t, parameters, size, random_state=None):
         return gen.bgext_model(t, parameters['alpha'],
                                parameters['beta'],
-                               size=size)
+                               size=size, random_state=random_state)
 
-    def fit(self, frequency, T, recency=None,  bootstrap_size=10, N=None, initial_params=None, iterative_fitting=0):
+    def fit(self, frequency, T, recency=None,  bootstrap_size=10, N=None, initial_params=None, iterative_fitting=0,
+            random_state=None, n_jobs=1, covariance='bootstrap', **bootstrap_options):
         """
         Fit the model to data, finding parameters and their errors, and assigning them to internal variables
         Args:
@@ -475,65 +667,45 @@ class BGModel(Model):
             recency:    None and useless, inserted just the keep the inheritance from Model
             bootstrap_size: number of data-samplings used to address parameter uncertainty
             N:  count of users matching FRT (compressed data), if absent data are assumed to be non-compressed
+            random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
+            n_jobs: number of bootstrap re-samplings fitted in parallel worker processes. -1 uses all the available cores.
+            covariance, bootstrap_options: see Model.fit.
         """
+        self._fit_with_uncertainties({'frequency': frequency, 'T': T, 'N': N}, bootstrap_size, initial_params,
+                                     iterative_fitting, random_state, n_jobs, covariance, bootstrap_options)
 
-        self.fitter.fit(frequency=frequency, T=T, N=N,
-                        initial_params=initial_params,
-                        iterative_fitting=iterative_fitting)
-
-        self.params = self.fitter.params_
-
-        if N is None:
-            data = pd.DataFrame({'frequency': frequency, 'T': T})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size)
-        else:
-            data = pd.DataFrame({'frequency': frequency, 'T': T, 'N': N})
-            self._estimate_uncertainties_with_bootstrap(data, bootstrap_size, compressed_data=True)
-
-    def _estimate_uncertainties_with_bootstrap(self, data, size=10, compressed_data=False):
-
-        if not all(column in data.columns for column in ['frequency', 'T']):
-            raise ValueError("given data do not contain the 2 magic columns.")
-        if size < 2:
-            raise ValueError("Run at least 2 samplings to get a covariance.")
-
-        par_estimates = []
-
-        tmp_fitter = copy.deepcopy(self.fitter)
-        for i in range(size):
-            N = len(data)
-            if compressed_data is False:
-                sampled_data = data.sample(N, replace=True)
-                tmp_fitter.fit(sampled_data['frequency'], sampled_data['T'])
-            else:
-                # in case of compressed data you've gotta sample a multinomial distribution
-                N = data['N']
-                N_sum = sum(N)
-                prob = [float(n) / N_sum for n in N]
-                sampled_N = np.random.multinomial(N_sum, prob, size=1)
-                tmp_fitter.fit(frequency=data['frequency'], T=data['T'], N=sampled_N[0])
-            par_estimates.append(tmp_fitter.params_)
-
-        par_lists = []
-        for par_name in self.param_names:
-            par_lists.append([par[par_name] for par in par_estimates])
+    def expected_number_of_purchases_up_to_time(self, t, uncertain=False):
+        """
+        Args:
+            t: a scalar or array of times
+            uncertain: if true, returns an uncertainties object correlated with uparams instead (scalar t only)
 
-        par_lists = remove_outliers_from_fitted_params(par_lists)
-        x = np.vstack(par_lists)
-        cov = np.cov(x)
+        Returns:
+            a tuple of two elements: the expected values and their errors, propagated with the analytic derivatives
+            for all the times at once
+        """
+        if not self.is_ready():
+            raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGFitter.static_expected_number_of_purchases_up_to_time, 2, t)
 
-        self.sampled_parameters = par_estimates
-        self.set_parameters(self.params, cov)
+        t = np.asarray(t)
+        a, b = [self.params[par_name] for par_name in self.param_names]
+        return BGFitter.static_expected_number_of_purchases_up_to_time(a, b, t), \
+            BGFitter.static_expected_number_of_purchases_up_to_time_error(a, b, t, self.params_C)
 
-    def expected_number_of_purchases_up_to_time(self, t):
-        uparams = self.uparams
-        a, b = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_expected_number_of_purchases_up_to_time(a, b, t)
+    def probability_of_n_purchases_up_to_time(self, t, n, uncertain=False):
+        """
+        Returns:
+            a tuple with the probability of n purchases up to time t and its error (see predict_with_errors), or an
+            uncertainties object correlated with uparams if uncertain
+        """
+        if not self.is_ready():
+            raise ValueError("Model is not ready. Please call the '.fit' method first or provide parameters.")
+        if uncertain:
+            return self._uncertain(BGFitter.static_probability_of_n_purchases_up_to_time, 2, t, n)
 
-    def probability_of_n_purchases_up_to_time(self, t, n):
-        uparams = self.uparams
-        a, b = [uparams[par_name] for par_name in self.param_names]
-        return self.wrapped_static_probability_of_n_purchases_up_to_time(a, b, t, n)
+        return self.predict_with_errors('probability_of_n_purchases_up_to_time', t, n)
 
 
 class NumericalMetrics(object):
@@ -601,6 +773,82 @@ def extract_frequencies(data, max_x=10):
     return fx
 
 
+_bootstrap_worker_data = {}
+
+
+def _init_bootstrap_worker(fitter, shared_columns, fit_arguments):
+    # the data live in shared memory, and every worker process reads them with no copies
+    _bootstrap_worker_data['fitter'] = fitter
+    _bootstrap_worker_data['data'] = pd.DataFrame(dict((name, np.frombuffer(values, dtype=dtype))
+                                                       for name, values, dtype in shared_columns),
+                                                  columns=[name for name, _, _ in shared_columns])
+    _bootstrap_worker_data['fit_arguments'] = fit_arguments
+
+
+def _bootstrap_replicate_in_worker(random_state):
+    return _bootstrap_replicate(_bootstrap_worker_data['fitter'], _bootstrap_worker_data['data'], random_state,
+                                *_bootstrap_worker_data['fit_arguments'])
+
+
+def _bootstrap_replicate(fitter, data, random_state, resampling='multinomial', initial_params=None, jitter=0.,
+                         fit_options=None):
+    """
+    Fits the fitter to a re-sampling of the compressed data, whose columns are the arguments of fitter.fit.
+    The fit starts from initial_params, times a log-normal noise of standard deviation jitter, if given.
+
+    Returns:
+        the fitted parameters
+    """
+    N = np.asarray(data['N'], dtype=float)
+    if resampling == 'poisson':
+        sampled_N = random_state.poisson(N)
+    else:
+        sampled_N = random_state.multinomial(int(round(N.sum())), N / N.sum())
+    # the rows nobody was drawn from are left out, as they would be when re-sampling id-level data
+    sampled = sampled_N > 0
+    columns = dict((name, np.asarray(data[name])[sampled]) for name in data.columns)
+    columns['N'] = sampled_N[sampled]
+    if initial_params is not None and jitter > 0:
+        initial_params = initial_params * np.exp(jitter * random_state.standard_normal(len(initial_params)))
+    columns.update(fit_options or {})
+    fitter.fit(initial_params=initial_params, random_state=random_state, **columns)
+    return fitter.params_
+
+
+def _bootstrap(fitter, data, random_states, n_jobs=1, resampling='multinomial', initial_params=None, jitter=0.,
+               fit_options=None):
+    """
+    Fits the fitter to a re-sampling of the compressed data per random state, in parallel worker processes if
+    n_jobs > 1. The data are copied once in shared memory, instead of being sent to the workers with every
+    re-sampling. resampling, initial_params, jitter and fit_options are passed to every _bootstrap_replicate.
+
+    Returns:
+        the list of fitted parameters, in the order of random_states
+    """
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = cpu_count()
+    n_jobs = min(n_jobs, len(random_states))
+    fit_arguments = (resampling, initial_params, jitter, fit_options)
+    if n_jobs <= 1:
+        return [_bootstrap_replicate(fitter, data, random_state, *fit_arguments)
+                for random_state in random_states]
+
+    shared_columns = []
+    for name in data.columns:
+        values = np.ascontiguousarray(data[name])
+        shared_values = RawArray('b', values.nbytes)
+        np.frombuffer(shared_values, dtype=values.dtype)[:] = values
+        shared_columns.append((name, shared_values, values.dtype))
+
+    pool = Pool(n_jobs, initializer=_init_bootstrap_worker,
+                initargs=(fitter, shared_columns, fit_arguments))
+    try:
+        return pool.map(_bootstrap_replicate_in_worker, random_states)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def remove_outliers_from_fitted_params(par_lists, method='Gaussian'):
     is_outlier_lists = []
     for par_list in par_lists:
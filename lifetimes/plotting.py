@@ -100,10 +100,7 @@ def plot_frequency_recency_matrix(model, T=1, max_frequency=None, max_recency=No
     if max_recency is None:
         max_recency = int(model.data['T'].max())
 
-    Z = np.zeros((max_recency + 1, max_frequency + 1))
-    for i, recency in enumerate(np.arange(max_recency + 1)):
-        for j, frequency in enumerate(np.arange(max_frequency + 1)):
-            Z[i, j] = model.conditional_expected_number_of_purchases_up_to_time(T, frequency, recency, max_recency)
+    Z = model.conditional_expected_purchases_matrix(T, max_frequency, max_recency)
 
     interpolation = kwargs.pop('interpolation', 'none')
 
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+from functools import partial
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+from lifetimes.data_compression import compress
+from lifetimes.utils import _customer_lifetime_value
+
+
+def score(transaction_prediction_model, data, t=1, monetary_value_model=None, time=12, discount_rate=1,
+          chunk_size=100000, n_jobs=1, dtype=np.float64, deduplicate=False, reuse_buffer=False):
+    """
+    Scores customers chunk by chunk, so that the temporaries of the predictions never exceed chunk_size customers.
+
+    Parameters:
+        transaction_prediction_model: a fitted model with conditional_probability_alive and
+            conditional_expected_number_of_purchases_up_to_time, e.g. a ParetoNBDFitter or a BetaGeoFitter.
+        data: a DataFrame, or an iterator of DataFrames (e.g. pandas.read_csv(..., chunksize=...)), with the
+            'frequency', 'recency' and 'T' columns, and 'monetary_value' if monetary_value_model is given.
+        t: the time horizon of the expected number of purchases.
+        monetary_value_model: an optional fitted GammaGammaFitter. If given, the customer lifetime value is scored
+            as well, as GammaGammaFitter.customer_lifetime_value does.
+        time: the lifetime of the customer lifetime value, in months.
+        discount_rate: the monthly adjusted discount rate of the customer lifetime value.
+        chunk_size: the maximum number of customers scored at once.
+        n_jobs: number of threads sharing every chunk, as the numpy and scipy kernels release the GIL.
+            -1 uses all the available cores.
+        dtype: dtype of the scores, e.g. np.float32 to halve the memory of the output.
+        deduplicate: if True, every chunk is compressed to its unique cells of frequency, recency, T (and
+            monetary_value), that are scored once and scattered back to the customers. Customers with a missing
+            value get NaN scores.
+        reuse_buffer: if True, the scores of all the chunks are written in a single buffer allocated once, so every
+            chunk is a view that the next chunk overwrites: the chunks must be consumed (or copied) one at a time,
+            e.g. written to disk, and not collected with pandas.concat.
+
+    Yields:
+        a DataFrame per chunk, with the index of the customers and the columns 'probability_alive',
+        'expected_purchases' and, with monetary_value_model, 'clv'. Every chunk owns its scores, unless
+        reuse_buffer.
+    """
+    columns = ['probability_alive', 'expected_purchases']
+    if monetary_value_model is not None:
+        columns.append('clv')
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = cpu_count()
+
+    keys = ['T', 'frequency', 'recency']
+    if monetary_value_model is not None:
+        keys.append('monetary_value')
+    buffer = np.empty((chunk_size, len(columns)), dtype=dtype) if reuse_buffer else None
+    pool = ThreadPool(n_jobs) if n_jobs > 1 else None
+    score_customers = partial(_score_customers, transaction_prediction_model, t, monetary_value_model, time,
+                              discount_rate, pool, n_jobs)
+    try:
+        for chunk in _chunks(data, chunk_size):
+            if reuse_buffer:
+                scores = buffer[:len(chunk)]
+            else:
+                scores = np.empty((len(chunk), len(columns)), dtype=dtype)
+            if deduplicate:
+                cells, inverse = compress(chunk, keys, return_inverse=True)
+                cell_scores = np.empty((len(cells), len(columns)), dtype=dtype)
+                score_customers(cells, cell_scores)
+                valid = inverse >= 0
+                scores[valid] = cell_scores[inverse[valid]]
+                scores[~valid] = np.nan
+            else:
+                score_customers(chunk, scores)
+
+            yield pd.DataFrame(scores, index=chunk.index, columns=columns, copy=False)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def _chunks(data, chunk_size):
+    """
+    Splits a DataFrame, or every DataFrame of an iterator, in chunks of at most chunk_size rows.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = [data]
+    for frame in data:
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+
+
+def _score_customers(transaction_prediction_model, t, monetary_value_model, time, discount_rate, pool, n_jobs, data,
+                     scores):
+    """
+    Writes the scores of the customers of data in scores, sharing the rows among the threads of the pool.
+    """
+    n = len(data)
+    customers = [np.asarray(data[column], dtype=float) for column in ['frequency', 'recency', 'T']]
+    if monetary_value_model is not None:
+        customers.append(np.asarray(data['monetary_value'], dtype=float))
+
+    score_rows = partial(_score_rows, transaction_prediction_model, t, monetary_value_model, time, discount_rate,
+                         customers, scores)
+    if pool is None or n == 0:
+        score_rows(slice(0, n))
+    else:
+        block_size = -(-n // n_jobs)
+        pool.map(score_rows, [slice(start, start + block_size) for start in range(0, n, block_size)])
+
+
+def _score_rows(transaction_prediction_model, t, monetary_value_model, time, discount_rate, customers, scores, rows):
+    """
+    Writes the scores of the given rows of the customers in the same rows of scores.
+    """
+    frequency, recency, T = [values[rows] for values in customers[:3]]
+    scores[rows, 0] = transaction_prediction_model.conditional_probability_alive(frequency, recency, T)
+    scores[rows, 1] = transaction_prediction_model.conditional_expected_number_of_purchases_up_to_time(
+        t, frequency, recency, T)
+    if monetary_value_model is not None:
+        # the Gamma-Gamma estimates of the monetary values, as in GammaGammaFitter.customer_lifetime_value
+        monetary_value = monetary_value_model.conditional_expected_average_profit(frequency, customers[3][rows])
+        scores[rows, 2] = _customer_lifetime_value(transaction_prediction_model, frequency, recency, T,
+                                                   monetary_value, time, discount_rate)
@@ -1,11 +1,15 @@
 from datetime import datetime
+import time
 
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 import operator as op
 import math
-from functools import reduce
+import numbers
+from functools import reduce, partial
+from multiprocessing import Pool, Value, Event, cpu_count
+from multiprocessing.pool import ThreadPool
 
 pd.options.mode.chained_assignment = None
 
@@ -222,34 +226,299 @@ def calculate_alive_path(model, transactions, datetime_col, t, freq='D'):
         lambda row: model.conditional_probability_alive(row['frequency'], row['recency'], row['T']), axis=1)
 
 
-def _fit(minimizing_function, minimizing_function_args, iterative_fitting, initial_params, params_size, disp,
-         jac=False):
-    ll = []
-    sols = []
-    methods = ['Powell', 'Nelder-Mead', 'BFGS']
+class _StopFit(Exception):
+    """ Raised by _BudgetedFunction when a start must stop, the argument is the reason. """
+    pass
+
+
+class _FitBudget(object):
+    """
+    Budget shared by all the starts of a multi-start fit (see _fit): a deadline, a maximum number of function
+    evaluations and a stop flag, raised once enough starts agree on the optimum.
+
+    The counter and the flag are multiprocessing objects, so the budget can be shared with worker processes
+    (through the pool initializer) as well as with threads.
+    """
+
+    def __init__(self, max_time=None, max_nfev=None):
+        self.deadline = None if max_time is None else time.time() + max_time
+        self.max_nfev = max_nfev
+        self.nfev = Value('l', 0)
+        self.stop = Event()
+
+    def check(self):
+        if self.stop.is_set():
+            raise _StopFit('consensus')
+        if self.deadline is not None and time.time() > self.deadline:
+            raise _StopFit('max_time')
+        with self.nfev.get_lock():
+            if self.max_nfev is not None and self.nfev.value >= self.max_nfev:
+                raise _StopFit('max_nfev')
+            self.nfev.value += 1
+
+
+class _BudgetedFunction(object):
+    """
+    Wraps the minimized function of a single start: checks the budget before every evaluation and keeps
+    track of the best point evaluated so far, which is the result of the start if it is stopped.
+    """
+
+    def __init__(self, function, budget, jac):
+        self.function = function
+        self.budget = budget
+        self.jac = jac
+        self.best_params = None
+        self.best_fun = np.inf
+        self.nfev = 0
+
+    def __call__(self, params, *args):
+        self.budget.check()
+        self.nfev += 1
+        value = self.function(params, *args)
+        fun = value[0] if self.jac else value
+        if fun < self.best_fun:
+            self.best_fun = fun
+            self.best_params = np.array(params, dtype=float)
+        return value
+
+
+_fit_worker_data = {}
+
+
+def _init_fit_worker(minimizing_function, minimizing_function_args, budget):
+    # the data is sent to each worker process once, when the pool starts, instead of once per start
+    _fit_worker_data['function'] = minimizing_function
+    _fit_worker_data['args'] = minimizing_function_args
+    _fit_worker_data['budget'] = budget
+
+
+def _fit_start_in_worker(start):
+    return _fit_start(_fit_worker_data['function'], _fit_worker_data['args'], _fit_worker_data['budget'], start)
+
+
+def _fit_start(minimizing_function, minimizing_function_args, budget, start):
+    """
+    Runs a single start of the multi-start minimization performed by _fit.
+
+    Parameters:
+        minimizing_function: the function to minimize.
+        minimizing_function_args: the additional arguments of the function.
+        budget: the _FitBudget shared by all the starts.
+        start: a tuple (index, fit_method, params_init, jac, disp).
+
+    Returns:
+        the index of the start and a dictionary summarizing it: method, initial and final parameters and
+        function values, number of function evaluations and iterations, convergence flag and message, and the
+        reason why the start was stopped (None if it ran to completion).
+    """
+    index, fit_method, params_init, jac, disp = start
 
     def _func_caller(params, func_args, function):
         return function(params, *func_args)
 
+    options = {'disp': disp}
+    bounds = None
+    if fit_method == 'L-BFGS-B':
+        # the default relative reduction criterion stops too early on the flat likelihoods of large samples
+        options['ftol'] = 1e-12
+        bounds = [(1e-10, None)] * len(params_init)
+
+    budgeted_function = _BudgetedFunction(minimizing_function, budget, jac)
+    try:
+        output = minimize(_func_caller, method=fit_method, tol=1e-6,
+                          x0=params_init, args=(minimizing_function_args, budgeted_function),
+                          options=options, jac=jac, bounds=bounds)
+        params, fun, nit, success, message, stopped = output.x, float(output.fun), output.get('nit'), \
+            bool(output.success), output.message, None
+    except _StopFit as stop:
+        stopped = stop.args[0]
+        if budgeted_function.best_params is None:
+            params, fun = np.asarray(params_init, dtype=float), np.nan
+        else:
+            params, fun = budgeted_function.best_params, float(budgeted_function.best_fun)
+        nit, success, message = None, False, "Stopped: %s budget exhausted." % stopped
+
+    if budgeted_function.nfev > 0:
+        initial_fun = _func_caller(params_init, minimizing_function_args, minimizing_function)
+        initial_fun = float(initial_fun[0] if jac else initial_fun)
+    else:
+        # the start was stopped before evaluating the function
+        initial_fun = np.nan
+    return index, {'method': fit_method,
+                   'initial_params': np.asarray(params_init, dtype=float),
+                   'initial_fun': initial_fun,
+                   'params': params,
+                   'fun': fun,
+                   'nfev': budgeted_function.nfev,
+                   'nit': nit,
+                   'success': success,
+                   'message': message,
+                   'stopped': stopped}
+
+
+def _fit(minimizing_function, minimizing_function_args, iterative_fitting, initial_params, params_size, disp,
+         jac=False, n_jobs=1, backend='thread', full_output=False, max_time=None, max_nfev=None,
+         n_consensus=None, consensus_tol=1e-6, random_state=None, hessian=False):
+    """
+    Minimizes the function starting from iterative_fitting + 1 points, and keeps the best solution.
+
+    Parameters:
+        minimizing_function: the function to minimize (usually a negative log-likelihood).
+            If jac is true, it must return its gradient as well.
+        minimizing_function_args: the additional arguments of the function, i.e. the data.
+        iterative_fitting: number of additional starts.
+        initial_params: starting point of every start. Random starting points are drawn if None.
+        params_size: number of parameters.
+        disp: set to true to print out convergence diagnostics.
+        jac: use the gradient returned by the function, with gradient based methods.
+        n_jobs: number of starts run in parallel. -1 uses all the available cores.
+        backend: 'thread' or 'process'. Threads share the data with no copies; each worker process
+            receives a single copy of the data when the pool is created. With the 'process' backend the
+            function and its arguments must be picklable.
+        full_output: if true, a summary of the fit is returned as well.
+        max_time: time budget of the whole fit, in seconds.
+        max_nfev: maximum number of function evaluations of the whole fit.
+        n_consensus: stop as soon as n_consensus starts have reached the best minimum found so far.
+        consensus_tol: relative tolerance on the function value used to decide if two starts agree.
+        random_state: None (the global numpy random state), a seed or a RandomState, used to draw the starting points.
+        hessian: if true, the Hessian of the function at the minimum is computed as well (see _hessian).
+
+    The starts that are stopped by the budget return the best point they evaluated.
+
+    Returns:
+        the best parameters, the minimum of the function and, if full_output, a dictionary with the summaries
+        of every start ('starts', see _fit_start), the reason why the fit stopped ('stop_reason': one of
+        'completed', 'consensus', 'max_time', 'max_nfev'), the total number of function evaluations ('nfev')
+        and the elapsed time in seconds ('time'), and the Hessian at the minimum ('hessian') if requested
+    """
+    if backend not in ('thread', 'process'):
+        raise ValueError("Unknown backend %s: must be 'thread' or 'process'." % backend)
+
+    start_time = time.time()
+    methods = ['Powell', 'Nelder-Mead', 'BFGS']
+    # gradient based methods, used when the minimizing function also returns its gradient.
+    # L-BFGS-B keeps the parameters strictly positive, so the likelihood is never evaluated outside its domain.
+    jac_methods = ['L-BFGS-B', 'BFGS']
+
+    # the starting points are drawn upfront, so they do not depend on n_jobs
+    random_state = check_random_state(random_state)
+    starts = []
+    for i in range(iterative_fitting + 1):
+        fit_method = jac_methods[i % len(jac_methods)] if jac else methods[i % len(methods)]
+        params_init = random_state.exponential(0.5, size=params_size) if initial_params is None else initial_params
+        starts.append((i, fit_method, params_init, jac, disp))
+
+    budget = _FitBudget(max_time, max_nfev)
+
+    def consensus_reached(finished):
+        ll = np.array([summary['fun'] for summary in finished if summary['stopped'] is None])
+        ll = ll[~np.isnan(ll)]
+        if n_consensus is None or len(ll) < n_consensus:
+            return False
+        best_ll = ll.min()
+        return np.sum(ll <= best_ll + consensus_tol * max(1., abs(best_ll))) >= n_consensus
+
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = cpu_count()
+    n_jobs = min(n_jobs, len(starts))
+
+    summaries = [None] * len(starts)
+    if n_jobs <= 1:
+        results = (_fit_start(minimizing_function, minimizing_function_args, budget, start) for start in starts)
+        pool = None
+    elif backend == 'thread':
+        pool = ThreadPool(n_jobs)
+        results = pool.imap_unordered(partial(_fit_start, minimizing_function, minimizing_function_args, budget),
+                                      starts)
+    else:
+        pool = Pool(n_jobs, initializer=_init_fit_worker,
+                    initargs=(minimizing_function, minimizing_function_args, budget))
+        results = pool.imap_unordered(_fit_start_in_worker, starts)
+    try:
+        # the results come in order of completion: once the consensus is reached, the starts still running or
+        # waiting are stopped at their next function evaluation
+        for index, summary in results:
+            summaries[index] = summary
+            if not budget.stop.is_set() and consensus_reached([s for s in summaries if s is not None]):
+                budget.stop.set()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    stopped = set(summary['stopped'] for summary in summaries)
+    stop_reason = 'completed'
+    for reason in ['consensus', 'max_time', 'max_nfev']:
+        if reason in stopped:
+            stop_reason = reason
+            break
+
+    ll = [summary['fun'] for summary in summaries]
+    best = int(np.nanargmin(ll)) if not np.all(np.isnan(ll)) else 0
+    minimizing_params = summaries[best]['params']
+    if full_output:
+        summary = {'starts': summaries,
+                   'stop_reason': stop_reason,
+                   'nfev': budget.nfev.value,
+                   'time': time.time() - start_time}
+        if hessian:
+            summary['hessian'] = _hessian(minimizing_function, minimizing_params, minimizing_function_args, jac)
+        return minimizing_params, ll[best], summary
+    return minimizing_params, ll[best]
+
+
+def _hessian(function, params, function_args, jac=False, relative_step=None):
+    """
+    Computes the Hessian of the function at params by central finite differences: of the gradient if jac (the
+    function returns its value and gradient), with 2 * len(params) evaluations, of the function values otherwise,
+    with 2 * len(params) ** 2 evaluations.
+
+    Parameters:
+        function: the function, e.g. a negative log-likelihood.
+        params: the point where the Hessian is evaluated.
+        function_args: the additional arguments of the function.
+        jac: if true, the function returns its gradient as well.
+        relative_step: step of the differences, relative to every parameter. Defaults to 1e-5 with the gradient
+            and 1e-4 without, close to the optimal steps of first and second differences in double precision.
+
+    Returns:
+        the symmetric len(params) x len(params) Hessian matrix
+    """
+    params = np.asarray(params, dtype=float)
+    n = len(params)
+    if relative_step is None:
+        relative_step = 1e-5 if jac else 1e-4
+    steps = relative_step * np.maximum(np.abs(params), 1e-8)
+    shifts = np.diag(steps)
+
+    hessian = np.empty((n, n))
     if jac:
-        params_init = np.random.exponential(0.5, size=params_size) if initial_params is None else initial_params
-        output = minimize(_func_caller, method='BFGS', tol=1e-6,
-                          x0=params_init, args=(minimizing_function_args, minimizing_function), options={'disp': disp},
-                          jac=jac)
-        ll = output.fun
-        minimizing_params = output.x
-        return minimizing_params, ll
+        for i in range(n):
+            gradient_up = np.asarray(function(params + shifts[i], *function_args)[1], dtype=float)
+            gradient_down = np.asarray(function(params - shifts[i], *function_args)[1], dtype=float)
+            hessian[i] = (gradient_up - gradient_down) / (2 * steps[i])
     else:
-        for i in range(iterative_fitting + 1):
-            fit_method = methods[i % len(methods)]
-            params_init = np.random.exponential(0.5, size=params_size) if initial_params is None else initial_params
-            output = minimize(_func_caller, method=fit_method, tol=1e-6,
-                              x0=params_init, args=(minimizing_function_args, minimizing_function),
-                              options={'disp': disp})
-            ll.append(output.fun)
-            sols.append(output.x)
-        minimizing_params = sols[np.argmin(ll)]
-        return minimizing_params, np.min(ll)
+        def shifted(shift):
+            return function(params + shift, *function_args)
+
+        center = function(params, *function_args)
+        for i in range(n):
+            hessian[i, i] = (shifted(shifts[i]) - 2 * center + shifted(-shifts[i])) / steps[i] ** 2
+            for j in range(i):
+                up, down = shifts[i] + shifts[j], shifts[i] - shifts[j]
+                second_difference = shifted(up) - shifted(down) - shifted(-down) + shifted(-up)
+                hessian[i, j] = second_difference / (4 * steps[i] * steps[j])
+                hessian[j, i] = hessian[i, j]
+    return (hessian + hessian.T) / 2.
+
+
+def _expand_ages(T, N=None):
+    """
+    Expands the ages of compressed data to one age per customer. Non-integer N (per-row weights) are rounded.
+    """
+    if N is None:
+        return np.asarray(T)
+    return np.repeat(T, np.rint(np.asarray(N, dtype=float)).astype(np.int64))
 
 
 def _scale_time(age):
@@ -308,18 +577,29 @@ def customer_lifetime_value(transaction_prediction_model, frequency, recency, T,
     Returns:
         Series object with customer ids as index and the estimated customer lifetime values as values
     """
-    df = pd.DataFrame(index=frequency.index)
-    df['clv'] = 0  # initialize the clv column to zeros
+    index = frequency.index
+    if isinstance(monetary_value, pd.Series):
+        monetary_value = monetary_value.reindex(index)
+    clv = _customer_lifetime_value(transaction_prediction_model, frequency, recency, T, monetary_value, time,
+                                   discount_rate)
+    return pd.Series(clv, index=index, name='clv')
+
 
-    for i in range(30, (time * 30) + 1, 30):
-        # since the prediction of number of transactions is cumulative, we have to subtract off the previous periods
-        expected_number_of_transactions = transaction_prediction_model.predict(i, frequency, recency,
-                                                                               T) - transaction_prediction_model.predict(
-            i - 30, frequency, recency, T)
-        # sum up the CLV estimates of all of the periods
-        df['clv'] += (monetary_value * expected_number_of_transactions) / (1 + discount_rate) ** (i / 30)
+def _customer_lifetime_value(transaction_prediction_model, frequency, recency, T, monetary_value, time=12,
+                             discount_rate=1):
+    """
+    Computes the customer lifetime values of customer_lifetime_value as an array, from arrays of customers.
+    """
+    # the cumulative predictions at all the month boundaries, customers x months, in a single broadcast call
+    months = np.arange(time + 1)
+    frequency, recency, T = [np.asarray(v, dtype=float)[:, None] for v in (frequency, recency, T)]
+    cumulative_transactions = transaction_prediction_model.predict(30. * months, frequency, recency, T)
+    # since the prediction of number of transactions is cumulative, we have to subtract off the previous periods
+    expected_number_of_transactions = np.diff(cumulative_transactions, axis=1)
 
-    return df['clv']  # return as a series
+    # sum up the discounted CLV estimates of all of the periods
+    discount = 1. / (1 + discount_rate) ** months[1:]
+    return np.asarray(monetary_value, dtype=float) * expected_number_of_transactions.dot(discount)
 
 
 def ncr(n, r):
@@ -355,13 +635,94 @@ def is_same_order(v1, v2, tol=10):
         return True
 
 
-def multinomial_sample(data):
+def multinomial_sample(data, random_state=None):
     """
 
     Args:
         data: an array t containing a number of users
+        random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
     """
     total = sum(data)
     prob = [float(n) / total for n in data]
-    return np.random.multinomial(total, prob, size=1)[0]
+    return check_random_state(random_state).multinomial(total, prob, size=1)[0]
+
+
+def numerical_jacobian(function, params, relative_step=1e-6):
+    """
+    Computes the derivatives of a vectorized function of the parameters by central finite differences, with two
+    evaluations per parameter whatever the shape of its output (e.g. one value per horizon and per customer).
+
+    Parameters:
+        function: function of the parameter vector, returning a scalar or an array.
+        params: the point where the derivatives are evaluated.
+        relative_step: step of the differences, relative to every parameter.
+
+    Returns:
+        an array of shape (len(params),) + shape of the output of function
+    """
+    params = np.asarray(params, dtype=float)
+    steps = relative_step * np.maximum(np.abs(params), 1e-8)
+    shifts = np.diag(steps)
+    jacobian = []
+    for i in range(len(params)):
+        up = np.asarray(function(params + shifts[i]), dtype=float)
+        down = np.asarray(function(params - shifts[i]), dtype=float)
+        jacobian.append((up - down) / (2 * steps[i]))
+    return np.array(jacobian)
+
+
+def delta_method_errors(jacobian, C):
+    """
+    Propagates the covariance matrix of the parameters to functions of them, at first order (delta method).
+
+    Parameters:
+        jacobian: array of shape (len(C),) + shape of the values, with the derivatives of every value in the
+            parameters, e.g. from numerical_jacobian.
+        C: covariance matrix of the parameters.
+
+    Returns:
+        the standard errors, with the shape of the values (a scalar for a single value)
+    """
+    jacobian = np.asarray(jacobian, dtype=float)
+    C = np.asarray(C, dtype=float)
+    if C.shape != (len(jacobian), len(jacobian)):
+        raise ValueError("Covariance matrix: wrong dimensions. Must be %dx%d symmetric." % ((len(jacobian),) * 2))
+    variance = np.einsum('i...,ij,j...->...', jacobian, C, jacobian)
+    return np.sqrt(np.maximum(variance, 0.))[()]
+
+
+def check_random_state(random_state):
+    """
+    Turns random_state into a numpy.random.RandomState instance.
+
+    Parameters:
+        random_state: None (the global numpy random state), a seed or a RandomState instance, returned as is.
+
+    Returns:
+        a RandomState instance
+    """
+    if random_state is None or random_state is np.random:
+        return np.random.mtrand._rand
+    if isinstance(random_state, (numbers.Integral, np.integer)):
+        return np.random.RandomState(random_state)
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    raise ValueError("%r cannot be used to seed a numpy.random.RandomState instance" % (random_state,))
+
+
+def spawn_random_states(random_state, n):
+    """
+    Spawns n independent random states, one per task (a bootstrap replicate, a simulation, a chunk of data...).
+    The parent draws a single entropy value, and the i-th child is seeded with (entropy, i): the streams of the tasks
+    do not depend on how the tasks are split among workers, nor on the order in which they run.
+
+    Parameters:
+        random_state: the parent, None (the global numpy random state), a seed or a RandomState instance.
+        n: the number of children.
+
+    Returns:
+        a list of n RandomState instances
+    """
+    entropy = check_random_state(random_state).randint(2 ** 31 - 1)
+    return [np.random.RandomState([entropy, i]) for i in range(n)]
 
@@ -3,34 +3,34 @@ from __future__ import absolute_import
 import lifetimes.generate_data as gen
 import lifetimes.estimation as est
 from lifetimes.data_compression import compress_bgext_data
-from .utils import multinomial_sample
+from .utils import multinomial_sample, check_random_state, spawn_random_states
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from functools import reduce
 
 
 def generate_neg_likelihoods(fitter,
                              test_ts=None,
-                             penalizer_coef=0.1, size=100, simulation_size=100, refit=True):
+                             penalizer_coef=0.1, size=100, simulation_size=100, refit=True, random_state=None):
     """
     Generates <simulation_size> log-likelihoods of BG model.
     To test goodness of model.
     Use refit=True if you're testing on fitted data [dafault].
     Use refit=False if you divided your dataset in training/test, this runs much faster.
+    Every simulation runs on its own stream spawned from random_state (None, a seed or a numpy.random.RandomState).
     """
 
     n_lls = []
     params = fitter.params_
 
-    for i in range(simulation_size):
-        if test_ts:
-            gen_data = fitter.generate_new_data(size=size, compressed=True, ts=test_ts)
+    for simulation_state in spawn_random_states(random_state, simulation_size):
+        if test_ts is not None:
+            gen_data = fitter.generate_new_data(size=size, compressed=True, ts=test_ts, random_state=simulation_state)
         else:
-            gen_data = fitter.generate_new_data(size=size, compressed=True)
+            gen_data = fitter.generate_new_data(size=size, compressed=True, random_state=simulation_state)
         current_fitter = fitter.__class__(penalizer_coef=penalizer_coef)
         if refit:
-            current_fitter.fit(**gen_data)
+            current_fitter.fit(random_state=simulation_state, **gen_data)
             n_lls.append(current_fitter._negative_log_likelihood_)
         else:
             n_ll = current_fitter._negative_log_likelihood(params=params.values(),
@@ -43,20 +43,24 @@ def generate_neg_likelihoods(fitter,
 
 def goodness_of_test(data,
                      fitter_class,
-                     penalizer_coef=0.1, simulation_size=100, confidence_level=0.99, verbose=False, test_data=None):
+                     penalizer_coef=0.1, simulation_size=100, confidence_level=0.99, verbose=False, test_data=None,
+                     random_state=None):
     """
     Returns True if data are compatible with the fitter distribution.
+    random_state: None (the global numpy random state), a seed or a numpy.random.RandomState
     """
 
     # fit them
+    random_state = check_random_state(random_state)
     fitter = fitter_class(penalizer_coef=penalizer_coef)
-    fitter.fit(**data)
+    fitter.fit(random_state=random_state, **data)
     params = fitter.params_
     if test_data is None:
         n_ll = fitter._negative_log_likelihood_
         n_lls = generate_neg_likelihoods(fitter=fitter,
                                          simulation_size=simulation_size,
-                                         refit=True)
+                                         refit=True,
+                                         random_state=random_state)
     else:
         n_ll = fitter._negative_log_likelihood(
             params=params.values(),
@@ -65,9 +69,9 @@ def goodness_of_test(data,
         )
         n_lls = generate_neg_likelihoods(fitter=fitter,
                                          simulation_size=simulation_size,
-                                         test_ts=reduce(lambda res, el: res + el,
-                                                        [[t] * n for t, n in zip(test_data['T'], test_data['N'])], []),
-                                         refit=False)
+                                         test_ts=np.repeat(np.asarray(test_data['T']), np.asarray(test_data['N'])),
+                                         refit=False,
+                                         random_state=random_state)
 
     # perform goodness of fit test
     lwr, upr = np.percentile(n_lls, [(1 - confidence_level) * 100, confidence_level * 100])
@@ -81,17 +85,11 @@ def goodness_of_test(data,
     return False
 
 
-def split_dataset(data, test_size_ratio):
-    test_N = []
-    train_N = []
-    for i, n in enumerate(data['N']):
-        test_N.append(0)
-        train_N.append(0)
-        for _ in range(n):
-            if np.random.uniform() < test_size_ratio:
-                test_N[i] += 1
-            else:
-                train_N[i] += 1
+def split_dataset(data, test_size_ratio, random_state=None):
+    # every user ends up in the test set with probability test_size_ratio
+    N = np.asarray(data['N'])
+    test_N = check_random_state(random_state).binomial(N, test_size_ratio)
+    train_N = N - test_N
     test_data = data.copy(deep=True)
     test_data['N'] = test_N
     test_data = test_data[test_data['N'] > 0]
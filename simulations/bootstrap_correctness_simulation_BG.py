@@ -58,7 +58,7 @@ if __name__ == "__main__":
                 gen_data = gen.bgext_model(Ts, params['alpha'], params['beta'])
                 data = comp.compress_bgext_data(gen_data)
                 current_model.fit(frequency=data["frequency"], T=data["T"], N=data["N"], bootstrap_size=100)
-                ex = current_model.expected_number_of_purchases_up_to_time(52) + 1
+                ex = current_model.expected_number_of_purchases_up_to_time(52, uncertain=True) + 1
                 fitted_e_x.append(ex)
                 percentiles_data = filter(lambda x: not (math.isnan(x) or math.isinf(x)), [BGFitter.static_expected_number_of_purchases_up_to_time(pars['alpha'], pars['beta'], 52) + 1 for pars in current_model.sampled_parameters])
                 if len(percentiles_data) > 0:
@@ -6,6 +6,7 @@ import pandas as pd
 import lifetimes.generate_data as gen
 import lifetimes.data_compression as comp
 from lifetimes.models import BGModel
+from lifetimes.estimation import BGFitter
 import uncertainties
 from functools import reduce
 
@@ -24,7 +25,7 @@ def get_estimates(params, daily_installs, observed_days, conversion_rate, free_t
 
         model.fit(data['frequency'], data['T'], bootstrap_size=30, N=data['N'])
 
-        Ex = model.expected_number_of_purchases_up_to_time(52) + 1
+        Ex = model.expected_number_of_purchases_up_to_time(52, uncertain=True) + 1
         print((i, Ex))
         exs.append(Ex)
     return exs
@@ -45,11 +46,11 @@ def get_estimates_from_bootstrap(params, daily_installs, observed_days, conversi
         b = model.sampled_parameters[i]['beta']
         cov = model.params_C
         [a, b] = uncertainties.correlated_values([a, b], cov)
-        Ex = model.wrapped_static_expected_number_of_purchases_up_to_time(a, b, 52) + 1
+        Ex = uncertainties.wrap(BGFitter.static_expected_number_of_purchases_up_to_time)(a, b, 52) + 1
         if not math.isnan(Ex.n) and not math.isinf(Ex.n):
             print((i, Ex))
             exs.append(Ex)
-    return exs, model.expected_number_of_purchases_up_to_time(52) + 1
+    return exs, model.expected_number_of_purchases_up_to_time(52, uncertain=True) + 1
 
 
 def set_plot_title(true_Ex, N, daily_installs, conversion_rate, free_trial_conversion):
@@ -110,10 +110,10 @@ def test_BGBBBGExt_fitting_on_simulated_quite_real_looking_data():
             print(mv)
 
             ts = range(T0)
-            lifetime = [ufloat_to_tuple(model_conversion.expected_number_of_sessions_up_to_time(t)) for t in ts]
-            conversion_diff = [ufloat_to_tuple(model_conversion.expected_probability_of_converting_at_time(t)) for t in ts]
-            conversion = [ufloat_to_tuple(model_conversion.expected_probability_of_converting_within_time(t)) for t in ts]
-            apppu = [ufloat_to_tuple(model_arppu.expected_number_of_purchases_up_to_time(t)) for t in ts]
+            lifetime = [model_conversion.expected_number_of_sessions_up_to_time(t) for t in ts]
+            conversion_diff = [model_conversion.expected_probability_of_converting_at_time(t) for t in ts]
+            conversion = [model_conversion.expected_probability_of_converting_within_time(t) for t in ts]
+            apppu = [model_arppu.expected_number_of_purchases_up_to_time(t) for t in ts]
             arppu = [ufloat_to_tuple((1.0 + apppu[i][0]) * mv) for i in range(len(apppu))]
             appd = [ufloat_to_tuple(get_arpd_retention(model_conversion, model_arppu, t)) for t in ts]
             arpd = [ufloat_to_tuple(appd[i][0] * mv) for i in range(len(appd))]
@@ -247,8 +247,8 @@ def get_arpd_retention(model_conversion, model_arppu, t):
     v = 0
     e = 0
     for ti in range(t + 1):
-        vc = model_conversion.expected_probability_of_converting_at_time(ti)
-        va = model_arppu.expected_number_of_purchases_up_to_time(t - ti)
+        vc = model_conversion.expected_probability_of_converting_at_time(ti, uncertain=True)
+        va = model_arppu.expected_number_of_purchases_up_to_time(t - ti, uncertain=True)
         if vc == 0:
             break
         v += (va + 1) * vc
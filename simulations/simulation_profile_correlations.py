@@ -35,7 +35,7 @@ def test_BGBB_correlations():
     print(model.params_C)
 
     ts = range(1, 50)
-    cum_profile_points = [model.expected_number_of_purchases_up_to_time(t) for t in [0] + ts]
+    cum_profile_points = [model.expected_number_of_purchases_up_to_time(t, uncertain=True) for t in [0] + ts]
     diff_profile_points = [cum_profile_points[t] - cum_profile_points[t-1] for t in ts]
 
     cor_matrix = correlation_matrix(diff_profile_points)
@@ -91,7 +91,7 @@ def test_BGBBBG_correlations():
     print(model.uparams)
 
     ts = range(0, 50)
-    diff_profile_points = [model.expected_probability_of_converting_at_time(t) for t in ts]
+    diff_profile_points = [model.expected_probability_of_converting_at_time(t, uncertain=True) for t in ts]
 
     cor_matrix = correlation_matrix(diff_profile_points)
 
@@ -42,6 +42,26 @@ def test_BGExt_generation():
     print(gen_data)
 
 
+@pytest.mark.BGExt
+def test_BGExt_compressed_generation_matches_likelyhood():
+    params = {'alpha': 0.32, 'beta': 0.85}
+    T = [2] * 5000 + [6] * 10000 + [3] * 5000
+
+    for compressed in [True, False]:
+        data = gen.bgext_model(T, params['alpha'], params['beta'], compressed=compressed)
+        if not compressed:
+            data = compress_bgext_data(data)
+        assert list(data.columns) == ['frequency', 'T', 'N']
+        assert data['N'].sum() == len(T)
+        assert list(data['T'].unique()) == [2, 6, 3]
+
+        for _, cell in data.iterrows():
+            size = T.count(cell['T'])
+            prob = math.exp(-est.BGFitter._negative_log_likelihood(list(params.values()), cell['frequency'],
+                                                                   cell['T'], penalizer_coef=0))
+            assert math.fabs(cell['N'] / size - prob) < 5 * math.sqrt(prob * (1 - prob) / size) + 1e-4
+
+
 @pytest.mark.BGExt
 def test_generte_BGExt_for_external_studies():
     params = {'alpha': 0.32, 'beta': 0.85}
@@ -194,10 +214,10 @@ def test_BG_integration_in_models():
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 10, 100, 1000, 10000]:
-        Ex = model.expected_number_of_purchases_up_to_time(t)
-        print(t, Ex)
-        assert Ex.n >= 0
-        assert Ex.s >= 0
+        Ex, Ex_err = model.expected_number_of_purchases_up_to_time(t)
+        print(t, Ex, Ex_err)
+        assert Ex >= 0
+        assert Ex_err >= 0
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -239,10 +259,10 @@ def test_BG_on_simil_real_data():
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 10, 100, 1000, 10000]:
-        Ex = model.expected_number_of_purchases_up_to_time(t)
-        print(t, Ex)
-        assert Ex.n >= 0
-        assert Ex.s >= 0
+        Ex, Ex_err = model.expected_number_of_purchases_up_to_time(t)
+        print(t, Ex, Ex_err)
+        assert Ex >= 0
+        assert Ex_err >= 0
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -285,10 +305,10 @@ def test_BG_integration_in_models_with_uncertainties():
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 2, 3, 4, 5, 7, 10, 20, 50, 100, 1000, 10000]:
-        Ex = model.expected_number_of_purchases_up_to_time(t)
-        print(t, Ex)
-        assert Ex.n >= 0
-        assert Ex.s >= 0
+        Ex, Ex_err = model.expected_number_of_purchases_up_to_time(t)
+        print(t, Ex, Ex_err)
+        assert Ex >= 0
+        assert Ex_err >= 0
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -299,9 +319,9 @@ def test_BG_integration_in_models_with_uncertainties():
         tot_prob += prob
         assert 1 >= prob >= 0
 
-        uprob = model.probability_of_n_purchases_up_to_time(t, n)
-        print(uprob)
-        assert is_almost_equal(uprob.n, prob)
+        uprob, uprob_err = model.probability_of_n_purchases_up_to_time(t, n)
+        print(uprob, uprob_err)
+        assert is_almost_equal(uprob, prob)
 
     assert math.fabs(tot_prob - 1.0) < 0.00001
 
@@ -333,20 +353,20 @@ def test_correlations_of_uparams_and_derivatives():
     assert 1.0 > correlation_matrix([model.uparams['alpha'] + ufloat(1, 1), model.uparams['alpha']])[0, 1] > 0.0
 
     # stub of profile
-    p1 = model.expected_number_of_purchases_up_to_time(1)
-    p2 = model.expected_number_of_purchases_up_to_time(2)
+    p1 = model.expected_number_of_purchases_up_to_time(1, uncertain=True)
+    p2 = model.expected_number_of_purchases_up_to_time(2, uncertain=True)
 
     assert 1.0 > correlation_matrix([p1, p2])[0, 1] > 0.0
 
     # stub of profile
-    p1 = model.expected_number_of_purchases_up_to_time(1)
-    p2 = model.expected_number_of_purchases_up_to_time(10)
+    p1 = model.expected_number_of_purchases_up_to_time(1, uncertain=True)
+    p2 = model.expected_number_of_purchases_up_to_time(10, uncertain=True)
 
     assert 1.0 > correlation_matrix([p1, p2])[0, 1] > 0.0
 
     # stub of profile
-    p1 = model.expected_number_of_purchases_up_to_time(1)
-    p2 = model.expected_number_of_purchases_up_to_time(100)
+    p1 = model.expected_number_of_purchases_up_to_time(1, uncertain=True)
+    p2 = model.expected_number_of_purchases_up_to_time(100, uncertain=True)
 
     assert 1.0 > correlation_matrix([p1, p2])[0, 1] > 0.0
 
@@ -380,9 +400,9 @@ def test_address_dispersion_of_fit_with_few_renewals():
         # print model.params
         # print model.params_C
 
-        Ex = model.expected_number_of_purchases_up_to_time(52) + 1
-        print(Ex)
-        estimates.append(Ex.n)
+        Ex, Ex_err = model.expected_number_of_purchases_up_to_time(52)
+        print(Ex + 1, Ex_err)
+        estimates.append(Ex + 1)
 
     plt.hist(estimates, 50, normed=0, facecolor='g', alpha=0.75)
 
@@ -393,3 +413,24 @@ def test_address_dispersion_of_fit_with_few_renewals():
     plt.axvline(x=true_Ex, color="red")
     plt.grid(True)
     plt.show()
+
+
+@pytest.mark.BGExt
+def test_BG_probabilities_of_purchases_in_closed_form():
+    a, b = 0.32, 0.85
+    for t in [0, 1, 10]:
+        probabilities = est.BGFitter.static_probabilities_of_purchases_up_to_time(a, b, t)
+        expected = [est.BGFitter.static_probability_of_n_purchases_up_to_time(a, b, t, n) for n in range(t + 1)]
+        assert np.allclose(probabilities, expected, rtol=1e-10)
+
+    probabilities = est.BGFitter.static_probabilities_of_purchases_up_to_time(np.array([a, 1.5]), np.array([b, 2.]), 10)
+    assert probabilities.shape == (11, 2)
+    assert np.allclose(probabilities.sum(axis=0), 1.0)
+
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': a, 'beta': b}, 2000, random_state=1)
+    model.fit(data['frequency'], data['T'], random_state=2, covariance='hessian')
+    metrics = model.evaluate_metrics(1000, 5, N_sim=20, max_x=10, random_state=3)
+    assert metrics.length() == 10
+    assert math.fabs(sum(metrics.p_x) - 1.0) < 1e-8
+    assert all(p_err > 0 for p_err in metrics.p_x_err[:6])
@@ -30,6 +30,31 @@ def test_BGBB_generation():
     print(gen_data)
 
 
+@pytest.mark.BGBB
+def test_BGBB_generation_matches_likelyhood():
+    params = {'alpha': 1.2, 'beta': 0.7, 'gamma': 0.6, 'delta': 2.7}
+    T = 5
+    size = 20000
+
+    data = gen.bgbb_model(T, params['alpha'], params['beta'], params['gamma'], params['delta'], size=size,
+                          compressed=True)
+    assert data['N'].sum() == size
+
+    # the likelihood is the probability of a single purchase history, a (frequency, recency, T) cell holds
+    # C(recency - 1, frequency - 1) of them
+    for _, cell in data.iterrows():
+        histories = special.comb(cell['recency'] - 1, cell['frequency'] - 1) if cell['frequency'] > 0 else 1
+        prob = histories * np.exp(-est.BGBBFitter._negative_log_likelihood(list(params.values()), cell['frequency'],
+                                                                           cell['recency'], cell['T'],
+                                                                           penalizer_coef=0))
+        assert math.fabs(cell['N'] / size - prob) < 5 * math.sqrt(prob * (1 - prob) / size) + 1e-4
+
+    transactions = gen.bgbb_model(T, params['alpha'], params['beta'], params['gamma'], params['delta'], size=size,
+                                  transactional=True)
+    assert len(transactions) == size
+    assert all(ts == sorted(set(ts)) and all(1 <= t <= T for t in ts) for _, ts in transactions)
+
+
 @pytest.mark.BGBB
 def test_binomial_probs():
     p = 0.6
@@ -101,6 +126,46 @@ def test_BGBB_new_likelyhood():
         assert numerator[ii] == first_term[ii] + second_term[ii]
 
 
+@pytest.mark.BGBB
+def test_likelyhood_matches_explicit_sums():
+    a, b, g, d = 1.2, 0.7, 0.6, 2.7
+
+    T = np.array([1, 2, 5, 5, 5, 8, 8, 8, 8, 30])
+    tx = np.array([0, 2, 0, 3, 5, 1, 4, 8, 7, 12])
+    x = np.array([0, 1, 0, 2, 5, 1, 3, 6, 7, 4])
+    N = np.array([3, 1, 4, 1, 5, 9, 2, 6, 5, 3])
+
+    denominator = special.beta(a, b) * special.beta(g, d)
+    Lj = []
+    dLj = []
+    for xj, txj, Tj in zip(x, tx, T):
+        i = np.arange(Tj - txj)
+        BjBj = special.beta(a + xj, b + Tj - xj) * special.beta(g, d + Tj)
+        BiBi = special.beta(a + xj, b + txj - xj + i) * special.beta(g + 1, d + txj + i)
+        Lj.append((BjBj + np.sum(BiBi)) / denominator)
+        dLj.append(np.array([
+            BjBj * (special.psi(a + xj) - special.psi(a + b + Tj)) +
+            np.sum(BiBi * (special.psi(a + xj) - special.psi(a + b + txj + i))),
+            BjBj * (special.psi(b + Tj - xj) - special.psi(a + b + Tj)) +
+            np.sum(BiBi * (special.psi(b + txj - xj + i) - special.psi(a + b + txj + i))),
+            BjBj * (special.psi(g) - special.psi(g + d + Tj)) +
+            np.sum(BiBi * (special.psi(g + 1) - special.psi(g + d + txj + i + 1))),
+            BjBj * (special.psi(d + Tj) - special.psi(g + d + Tj)) +
+            np.sum(BiBi * (special.psi(d + txj + i) - special.psi(g + d + txj + i + 1)))]) / denominator)
+    Lj = np.array(Lj)
+    first_terms = np.array([special.psi(a + b) - special.psi(a), special.psi(a + b) - special.psi(b),
+                            special.psi(g + d) - special.psi(g), special.psi(g + d) - special.psi(d)])
+    expected_ll = -np.sum(N * np.log(Lj))
+    expected_d_ll = -np.sum([n * (first_terms + dl / l) for n, l, dl in zip(N, Lj, dLj)], axis=0)
+
+    ll = est.BGBBFitter._negative_log_likelihood([a, b, g, d], x, tx, T, penalizer_coef=0, N=N)
+    ll_jac, d_ll = est.BGBBFitter._negative_log_likelihood([a, b, g, d], x, tx, T, penalizer_coef=0, N=N, jac=True)
+
+    assert math.fabs(ll - expected_ll) < 1e-10 * math.fabs(expected_ll)
+    assert ll_jac == ll
+    assert np.all(np.fabs(d_ll - expected_d_ll) < 1e-10 * np.fabs(expected_d_ll))
+
+
 @pytest.mark.BGBB
 def test_likelyhood_with_jacobian():
     params = {'alpha': 1.2, 'beta': 0.7, 'gamma': 0.6, 'delta': 2.7}
@@ -318,10 +383,10 @@ def test_BGBB_integration_in_models():
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 10, 100, 1000, 10000]:
-        Ex = model.expected_number_of_purchases_up_to_time(t)
-        print(t, Ex)
-        assert Ex.n >= 0
-        assert Ex.s >= 0
+        Ex, Ex_err = model.expected_number_of_purchases_up_to_time(t)
+        print(t, Ex, Ex_err)
+        assert Ex >= 0
+        assert Ex_err >= 0
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -334,6 +399,36 @@ def test_BGBB_integration_in_models():
 
     assert math.fabs(tot_prob - 1.0) < 0.00001
 
+@pytest.mark.BGBB
+def test_BGBB_probabilities_of_purchases_in_closed_form():
+    params = [1.2, 0.7, 0.6, 2.7]
+    for t in [0, 1, 10]:
+        probabilities = est.BGBBFitter.static_probabilities_of_purchases_up_to_time(*(params + [t]))
+        expected = [est.BGBBFitter.static_probability_of_n_purchases_up_to_time(*(params + [t, n]))
+                    for n in range(t + 1)]
+        assert np.allclose(probabilities, expected, rtol=1e-10)
+
+    # one column per parameter vector
+    samples = [np.array([1.2, 0.5]), np.array([0.7, 3.0]), np.array([0.6, 1.1]), np.array([2.7, 0.4])]
+    probabilities = est.BGBBFitter.static_probabilities_of_purchases_up_to_time(*(samples + [10]))
+    assert probabilities.shape == (11, 2)
+    assert np.allclose(probabilities[:, 1], est.BGBBFitter.static_probabilities_of_purchases_up_to_time(
+        0.5, 3.0, 1.1, 0.4, 10))
+    assert np.allclose(probabilities.sum(axis=0), 1.0)
+
+    # the metrics in closed form match the simulated ones
+    model = models.BGBBModel()
+    data = compress_data(gen.bgbb_model(10, *params, size=2000, random_state=1))
+    model.fit(data['frequency'], data['recency'], data['T'], bootstrap_size=10, N=data['N'], random_state=2)
+    metrics = model.evaluate_metrics(1000, 10, max_x=5)
+    simulated_metrics = model.evaluate_metrics_with_simulation(1000, 10, N_sim=50, max_x=5, random_state=3)
+    assert math.fabs(sum(metrics.p_x) - 1.0) < 1e-8
+    for p, p_err, simulated_p, simulated_p_err in zip(metrics.p_x, metrics.p_x_err, simulated_metrics.p_x,
+                                                      simulated_metrics.p_x_err):
+        assert math.fabs(p - simulated_p) < 3 * p_err
+        assert 0.5 * simulated_p_err < p_err < 2 * simulated_p_err
+
+
 @pytest.mark.BGBB
 def test_BGBBBB_transaction():
     N = 10
@@ -388,10 +483,10 @@ def test_BGBB_integration_in_models_with_uncertainties():
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 10, 100, 1000, 10000]:
-        uEx = model.expected_number_of_purchases_up_to_time(t)
-        print(t, uEx)
-        assert uEx.n >= -0.0001
-        assert uEx.s >= -0.0001
+        uEx, uEx_err = model.expected_number_of_purchases_up_to_time(t)
+        print(t, uEx, uEx_err)
+        assert uEx >= -0.0001
+        assert uEx_err >= -0.0001
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -402,9 +497,9 @@ def test_BGBB_integration_in_models_with_uncertainties():
         tot_prob += prob
         assert 1 >= prob >= 0
 
-        uprob  = model.probability_of_n_purchases_up_to_time(t, n)
-        print(uprob)
-        assert is_almost_equal(uprob.n, prob)
+        uprob, uprob_err = model.probability_of_n_purchases_up_to_time(t, n)
+        print(uprob, uprob_err)
+        assert is_almost_equal(uprob, prob)
 
     assert math.fabs(tot_prob - 1.0) < 0.00001
 
@@ -438,7 +533,28 @@ def test_BGBB_correlations_preserved():
     assert 1.0 > correlation_matrix([model.uparams['alpha'] + ufloat(1, 1), model.uparams['alpha']])[0, 1] > 0.0
 
     # stub of profile
-    p1 = model.expected_number_of_purchases_up_to_time(1)
-    p2 = model.expected_number_of_purchases_up_to_time(2)
+    p1 = model.expected_number_of_purchases_up_to_time(1, uncertain=True)
+    p2 = model.expected_number_of_purchases_up_to_time(2, uncertain=True)
 
     assert 1.0 > correlation_matrix([p1, p2])[0, 1] > 0.0
+
+
+@pytest.mark.BGBB
+def test_likelyhood_long_horizons():
+    params = [1.2, 0.7, 0.6, 2.7]
+
+    # the Beta products underflow for such horizons, the log-likelihood must stay finite
+    freq = np.array([600, 3])
+    rec = np.array([1200, 900])
+    T = np.array([1500, 1500])
+    ll, d_ll = est.BGBBFitter._negative_log_likelihood(params, freq, rec, T, penalizer_coef=0, N=None, jac=True)
+
+    assert np.isfinite(ll)
+    assert np.all(np.isfinite(d_ll))
+
+    eps = 1e-6
+    for i in range(len(params)):
+        shifted = list(params)
+        shifted[i] += eps
+        ll_eps = est.BGBBFitter._negative_log_likelihood(shifted, freq, rec, T, penalizer_coef=0, N=None)
+        assert math.fabs((ll_eps - ll) / eps - d_ll[i]) < 1e-3 * max(1, math.fabs(d_ll[i]))
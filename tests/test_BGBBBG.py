@@ -1,6 +1,7 @@
 from __future__ import print_function
 import pytest
 import math
+from scipy import special
 import lifetimes.generate_data as gen
 import numpy as np
 import lifetimes.estimation as est
@@ -63,6 +64,35 @@ def test_BGBBBG_generation_with_time_first_purchase():
     conversion_data_frame = pd.DataFrame({'t': ts, 'c': cs, 'c_err': cs_err})
 
 
+@pytest.mark.BGBBBG
+def test_BGBBBG_generation_matches_likelyhood():
+    params = {'alpha': 1.2, 'beta': 0.7, 'gamma': 0.6, 'delta': 2.7, 'epsilon': 1.0, 'zeta': 3.0}
+    T = 4
+    size = 20000
+
+    data = gen.bgbbbg_model(T, *params.values(), size=size, compressed=True)
+    assert data['N'].sum() == size
+
+    # the conversion happens at a given session, so a cell holds C(recency - 1, frequency - 1) histories as in BG/BB
+    for _, cell in data.iterrows():
+        histories = special.comb(cell['recency'] - 1, cell['frequency'] - 1) if cell['frequency'] > 0 else 1
+        prob = histories * np.exp(-est.BGBBBGFitter._negative_log_likelihood(list(params.values()), cell['frequency'],
+                                                                             cell['recency'], cell['T'],
+                                                                             cell['frequency_before_conversion'],
+                                                                             penalizer_coef=0))
+        assert math.fabs(cell['N'] / size - prob) < 5 * math.sqrt(prob * (1 - prob) / size) + 1e-4
+
+    data = gen.bgbbbg_model(T, *params.values(), size=size, time_first_purchase=True)
+    converted = data['frequency_before_conversion'] <= data['frequency']
+    assert (data['time_first_purchase'].notnull() == converted).all()
+    assert (data['time_first_purchase'][converted] <= data['recency'][converted]).all()
+
+    data = gen.bgbbbgext_model(T, *params.values(), c0=1.0, size=size, death_time=True)
+    assert (data['frequency_before_conversion'] == 0).all()
+    assert (data['death_time'].isnull() == (data['alive'] == 1)).all()
+    assert (data['recency'][data['alive'] == 0] < data['death_time'][data['alive'] == 0]).all()
+
+
 @pytest.mark.BGBBBG
 def test_likelyhood():
     params = {'alpha': 1.2, 'beta': 0.7, 'gamma': 0.6, 'delta': 2.7, 'epsilon': 1.0, 'zeta': 10.0}
@@ -183,17 +213,17 @@ def test_BGBBBGExt_integration_in_models_with_uncertainties():
     assert 1.0 > correlation_matrix([model.uparams['alpha'] + ufloat(1, 1), model.uparams['alpha']])[0, 1] > 0.0
 
     # stub of profile
-    p1 = model.expected_number_of_sessions_up_to_time(1)
-    p2 = model.expected_number_of_sessions_up_to_time(2)
+    p1 = model.expected_number_of_sessions_up_to_time(1, uncertain=True)
+    p2 = model.expected_number_of_sessions_up_to_time(2, uncertain=True)
 
     assert 1.0 > correlation_matrix([p1, p2])[0, 1] > 0.0
 
     print("E[X(t)] as a function of t")
     for t in [0, 1, 10, 100, 1000, 10000]:
-        uEx = model.expected_number_of_sessions_up_to_time(t)
-        print(t, uEx)
-        assert uEx.n >= 0
-        assert uEx.s >= 0
+        uEx, uEx_err = model.expected_number_of_sessions_up_to_time(t)
+        print(t, uEx, uEx_err)
+        assert uEx >= 0
+        assert uEx_err >= 0
 
     t = 10
     print("E[X(t) = n] as a function of n, t = " + str(t))
@@ -204,22 +234,22 @@ def test_BGBBBGExt_integration_in_models_with_uncertainties():
         tot_prob += prob
         assert 1 >= prob >= 0
 
-        uprob = model.probability_of_n_sessions_up_to_time(t, n)
-        print(uprob)
-        assert is_almost_equal(uprob.n, prob)
+        uprob, uprob_err = model.probability_of_n_sessions_up_to_time(t, n)
+        print(uprob, uprob_err)
+        assert is_almost_equal(uprob, prob)
 
     assert math.fabs(tot_prob - 1.0) < 0.00001
 
     print("c(t) as a function of t")
     for t in [0, 1, 10, 100, 1000]:
-        uc = model.expected_probability_of_converting_at_time(t)
-        print(t, uc)
-        assert uc.n >= 0.0 and uc.n <= 1.0
-        assert uc.s >= 0.0
+        uc, uc_err = model.expected_probability_of_converting_at_time(t)
+        print(t, uc, uc_err)
+        assert uc >= 0.0 and uc <= 1.0
+        assert uc_err >= 0.0
 
     print("cumulative c(t) as a function of t")
     for t in [0, 1, 2, 3, 4, 5, 7, 10, 20, 50, 100]:
-        uc = model.expected_probability_of_converting_within_time(t)
-        print(t, uc)
-        assert uc.n >= 0.0 and uc.n <= 1.0
-        assert uc.s >= 0.0
+        uc, uc_err = model.expected_probability_of_converting_within_time(t)
+        print(t, uc, uc_err)
+        assert uc >= 0.0 and uc <= 1.0
+        assert uc_err >= 0.0
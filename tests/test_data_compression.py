@@ -0,0 +1,101 @@
+import pytest
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+from lifetimes.data_compression import compress, compress_data, compress_bgext_data, \
+    compress_session_session_before_conversion_data, CompressedTable
+
+
+def _nested_scan_compress(data, keys, columns):
+    """ Reference compression, scanning the keys with nested loops """
+    rows = []
+
+    def scan(data, level, values):
+        if level == len(keys):
+            rows.append([values[column] for column in columns] + [len(data)])
+            return
+        for value in pd.Series.unique(data[keys[level]]):
+            values[keys[level]] = value
+            scan(data[data[keys[level]] == value], level + 1, values)
+
+    scan(data, 0, {})
+    return pd.DataFrame(rows, columns=columns + ['N'])
+
+
+@pytest.mark.data_compression
+def test_compressors_match_nested_scan():
+    size = 2000
+    data = pd.DataFrame({'T': np.random.randint(1, 6, size),
+                         'frequency': np.random.randint(0, 4, size).astype(float),
+                         'recency': np.random.randint(0, 5, size),
+                         'frequency_before_conversion': np.random.randint(0, 3, size)})
+
+    expected = _nested_scan_compress(data, ['T', 'frequency', 'recency'], ['recency', 'frequency', 'T'])
+    actual = compress_data(data)
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.dtypes) == list(expected.dtypes)
+    npt.assert_array_equal(actual.values, expected.values)
+
+    expected = _nested_scan_compress(data, ['T', 'frequency'], ['frequency', 'T'])
+    npt.assert_array_equal(compress_bgext_data(data).values, expected.values)
+
+    expected = _nested_scan_compress(data, ['T', 'frequency', 'recency', 'frequency_before_conversion'],
+                                     ['recency', 'frequency', 'T', 'frequency_before_conversion'])
+    npt.assert_array_equal(compress_session_session_before_conversion_data(data).values, expected.values)
+
+
+@pytest.mark.data_compression
+def test_compress_with_extra_keys_and_missing_values():
+    data = pd.DataFrame({'T': [2, 2, 1, 2, 2, 1],
+                         'frequency': [1, 1, 0, 1, np.nan, 0],
+                         'recency': [1, 1, 0, 1, 1, 0],
+                         'country': ['it', 'fr', 'it', 'it', 'it', 'it']})
+
+    compressed_data = compress_data(data, extra_keys=['country'])
+    assert list(compressed_data.columns) == ['recency', 'frequency', 'T', 'country', 'N']
+    assert list(compressed_data['country']) == ['it', 'fr', 'it']
+    assert list(compressed_data['N']) == [2, 1, 2]
+    assert compressed_data['N'].sum() == len(data) - 1
+
+    compressed_data = compress(data, ['country'])
+    assert list(compressed_data['N']) == [5, 1]
+
+    with pytest.raises(ValueError):
+        compress(data, ['country', 'device'])
+
+
+@pytest.mark.data_compression
+def test_compress_inverse_scatters_back_to_ids():
+    data = pd.DataFrame({'T': [2, 2, 1, 2, 2, 1],
+                         'frequency': [1, 1, 0, 1, np.nan, 0],
+                         'recency': [1, 0, 0, 1, 1, 0]})
+
+    compressed_data, inverse = compress(data, ['T', 'frequency', 'recency'], return_inverse=True)
+    npt.assert_array_equal(inverse, [0, 1, 2, 0, -1, 2])
+    valid = inverse >= 0
+    npt.assert_array_equal(compressed_data[['T', 'frequency', 'recency']].values[inverse[valid]],
+                           data[['T', 'frequency', 'recency']].values[valid])
+    npt.assert_array_equal(np.bincount(inverse[valid]), compressed_data['N'])
+
+
+@pytest.mark.data_compression
+def test_compressed_table_from_chunks():
+    size = 3000
+    data = pd.DataFrame({'T': np.random.randint(1, 6, size),
+                         'frequency': np.random.randint(0, 4, size),
+                         'recency': np.random.randint(0, 5, size)})
+    chunks = [data.iloc[i:i + 700] for i in range(0, size, 700)]
+
+    table = CompressedTable.from_chunks(chunks)
+    assert list(table.keys()) == ['recency', 'frequency', 'T', 'N']
+    npt.assert_array_equal(table.to_frame().values, compress_data(data).values)
+
+    head, tail = CompressedTable().update(chunks[0]), CompressedTable.from_chunks(chunks[1:])
+    npt.assert_array_equal((head + tail).to_frame().values, table.to_frame().values)
+    npt.assert_array_equal((table - tail).to_frame().values, head.to_frame().values)
+    assert len(table) == len(head + tail)
+
+    with pytest.raises(ValueError):
+        head - tail
+    with pytest.raises(ValueError):
+        table.merge(CompressedTable(keys=['T', 'frequency']))
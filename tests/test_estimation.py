@@ -1,15 +1,28 @@
 from __future__ import print_function
+import pytest
 import numpy as np
 import pandas as pd
 import numpy.testing as npt
 import lifetimes.estimation as estimation
 import lifetimes.utils as utils
+from lifetimes.data_compression import CompressedTable
 from lifetimes.datasets import load_cdnow, load_summary_data_with_monetary_value
 
 cdnow_customers = load_cdnow()
 cdnow_customers_with_monetary_value = load_summary_data_with_monetary_value()
 
 
+def numerical_gradient(negative_log_likelihood, params, *args):
+    params = np.array(params, dtype=float)
+    gradient = []
+    for i in range(len(params)):
+        step = np.zeros(len(params))
+        step[i] = 1e-6 * max(params[i], 1.)
+        gradient.append((negative_log_likelihood(params + step, *args) -
+                         negative_log_likelihood(params - step, *args)) / (2 * step[i]))
+    return np.array(gradient)
+
+
 class TestGammaGammaFitter():
     def test_params_out_is_close_to_Hardie_paper(self):
         ggf = estimation.GammaGammaFitter()
@@ -21,6 +34,37 @@ class TestGammaGammaFitter():
         expected = np.array([6.25, 3.74, 15.44])
         npt.assert_array_almost_equal(expected, np.array(ggf._unload_params('p', 'q', 'v')), decimal=2)
 
+    def test_gradient_of_negative_log_likelihood(self):
+        ggf = estimation.GammaGammaFitter()
+        params = [6.25, 3.74, 15.44]
+        args = (cdnow_customers_with_monetary_value['frequency'], cdnow_customers_with_monetary_value['monetary_value'],
+                0.1)
+        ll, d_ll = ggf._negative_log_likelihood(params, *args, jac=True)
+        assert ll == ggf._negative_log_likelihood(params, *args)
+        npt.assert_allclose(d_ll, numerical_gradient(ggf._negative_log_likelihood, params, *args), rtol=1e-5)
+
+    def test_customers_without_repeated_purchases_are_skipped(self):
+        ggf = estimation.GammaGammaFitter()
+        params = [6., 4., 15.]
+        frequency, monetary_value = np.array([0, 2, 3]), np.array([0., 20., 35.])
+        ll, d_ll = ggf._negative_log_likelihood(params, frequency, monetary_value, jac=True)
+        assert np.isfinite(ll) and np.all(np.isfinite(d_ll))
+        assert ll == ggf._negative_log_likelihood(params, frequency[1:], monetary_value[1:])
+        npt.assert_allclose(ggf._batch_negative_log_likelihood([params], frequency, monetary_value), [ll])
+        npt.assert_allclose(d_ll, numerical_gradient(ggf._negative_log_likelihood, params, frequency, monetary_value),
+                            rtol=1e-5)
+
+    def test_params_out_is_close_to_Hardie_paper_with_jacobian(self):
+        ggf = estimation.GammaGammaFitter()
+        ggf.fit(
+            cdnow_customers_with_monetary_value['frequency'],
+            cdnow_customers_with_monetary_value['monetary_value'],
+            iterative_fitting=0,
+            jac=True
+        )
+        expected = np.array([6.25, 3.74, 15.44])
+        npt.assert_array_almost_equal(expected, np.array(ggf._unload_params('p', 'q', 'v')), decimal=2)
+
     def test_conditional_expected_average_profit(self):
         from collections import OrderedDict
 
@@ -90,6 +134,21 @@ class TestParetoNBDFitter():
         expected = np.array([0.553, 10.578, 0.606, 11.669])
         npt.assert_array_almost_equal(expected, np.array(ptf._unload_params('r', 'alpha', 's', 'beta')), decimal=3)
 
+    def test_gradient_of_negative_log_likelihood(self):
+        ptf = estimation.ParetoNBDFitter()
+        params = [0.553, 10.578, 0.606, 11.669]
+        args = (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)
+        ll, d_ll = ptf._negative_log_likelihood(params, *args, jac=True)
+        assert ll == ptf._negative_log_likelihood(params, *args)
+        npt.assert_allclose(d_ll, numerical_gradient(ptf._negative_log_likelihood, params, *args), rtol=1e-5,
+                            atol=1e-5)
+
+    def test_params_out_is_close_to_Hardie_paper_with_jacobian(self):
+        ptf = estimation.ParetoNBDFitter()
+        ptf.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], jac=True)
+        expected = np.array([0.553, 10.578, 0.606, 11.669])
+        npt.assert_array_almost_equal(expected, np.array(ptf._unload_params('r', 'alpha', 's', 'beta')), decimal=3)
+
     def test_expectation_returns_same_value_as_R_BTYD(self):
         """ From https://cran.r-project.org/web/packages/BTYD/BTYD.pdf """
         ptf = estimation.ParetoNBDFitter()
@@ -131,6 +190,20 @@ class TestParetoNBDFitter():
             for x in range(Z.shape[1]):
                 assert Z[t_x][x] == ptf.conditional_probability_alive(x, t_x, max_t)
 
+    def test_conditional_expected_purchases_matrix(self):
+        ptf = estimation.ParetoNBDFitter()
+        ptf.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'])
+        ts = [1, 10, 52]
+        Z = ptf.conditional_expected_purchases_matrix(ts, 20, 30)
+        assert Z.shape == (3, 31, 21)
+        assert np.allclose(Z[1], ptf.conditional_expected_purchases_matrix(10, 20, 30))
+
+        for k, t in enumerate(ts):
+            for t_x in range(0, 31, 5):
+                for x in range(1, 21, 4):
+                    expected = ptf.conditional_expected_number_of_purchases_up_to_time(t, x, t_x, 30)
+                    assert np.isclose(Z[k, t_x, x], expected, rtol=1e-10)
+
     def test_Ex_estimation_and_error(self):
         ptf = estimation.ParetoNBDFitter()
 
@@ -193,6 +266,34 @@ class TestBetaGammaFitter():
         expected = np.array([0.243, 4.414, 0.793, 2.426])
         npt.assert_array_almost_equal(expected, np.array(bfg._unload_params('r', 'alpha', 'a', 'b')), decimal=3)
 
+    def test_gradient_of_negative_log_likelihood(self):
+        bgf = estimation.BetaGeoFitter()
+        params = [0.243, 4.414, 0.793, 2.426]
+        args = (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)
+        ll, d_ll = bgf._negative_log_likelihood(params, *args, jac=True)
+        assert ll == bgf._negative_log_likelihood(params, *args)
+        npt.assert_allclose(d_ll, numerical_gradient(bgf._negative_log_likelihood, params, *args), rtol=1e-5)
+
+    def test_fit_on_compressed_table_is_same_as_on_id_level_data(self):
+        table = CompressedTable().update(cdnow_customers)
+        params = [0.243, 4.414, 0.793, 2.426]
+        for fitter in [estimation.BetaGeoFitter, estimation.ModifiedBetaGeoFitter, estimation.ParetoNBDFitter]:
+            ll, d_ll = fitter._negative_log_likelihood(params, cdnow_customers['frequency'], cdnow_customers['recency'],
+                                                       cdnow_customers['T'], 0.1, jac=True)
+            ll_compressed, d_ll_compressed = fitter._negative_log_likelihood(params, penalizer_coef=0.1, jac=True,
+                                                                             **table)
+            npt.assert_allclose(ll_compressed, ll)
+            npt.assert_allclose(d_ll_compressed, d_ll)
+
+        bgf = estimation.BetaGeoFitter().fit(**table)
+        npt.assert_array_almost_equal(params, np.array(bgf._unload_params('r', 'alpha', 'a', 'b')), decimal=2)
+
+    def test_params_out_is_close_to_Hardie_paper_with_jacobian(self):
+        bgf = estimation.BetaGeoFitter()
+        bgf.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], jac=True)
+        expected = np.array([0.243, 4.414, 0.793, 2.426])
+        npt.assert_array_almost_equal(expected, np.array(bgf._unload_params('r', 'alpha', 'a', 'b')), decimal=3)
+
     def test_conditional_expectation_returns_same_value_as_Hardie_excel_sheet(self):
         bfg = estimation.BetaGeoFitter()
         bfg.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'])
@@ -265,6 +366,20 @@ class TestBetaGammaFitter():
             for x in range(Z.shape[1]):
                 assert Z[t_x][x] == bfg.conditional_probability_alive(x, t_x, max_t)
 
+    def test_conditional_expected_purchases_matrix(self):
+        bfg = estimation.BetaGeoFitter()
+        bfg.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'])
+        ts = np.array([1., 10., 39.])
+        Z = bfg.conditional_expected_purchases_matrix(ts)
+        max_t = int(bfg.data['T'].max())
+        assert Z.shape == (3, max_t + 1, int(bfg.data['frequency'].max()) + 1)
+
+        for k, t in enumerate(ts):
+            for t_x in range(0, max_t + 1, 7):
+                for x in range(0, Z.shape[2], 3):
+                    expected = bfg.conditional_expected_number_of_purchases_up_to_time(t, x, t_x, max_t)
+                    assert np.isclose(Z[k, t_x, x], expected, rtol=1e-10)
+
     def test_probability_of_n_purchases_up_to_time_same_as_R_BTYD(self):
         """ See https://cran.r-project.org/web/packages/BTYD/BTYD.pdf """
         from collections import OrderedDict
@@ -323,6 +438,20 @@ class TestModifiedBetaGammaFitter():
         expected = np.array([0.525, 6.183, 0.891, 1.614])
         npt.assert_array_almost_equal(expected, np.array(mbfg._unload_params('r', 'alpha', 'a', 'b')), decimal=3)
 
+    def test_gradient_of_negative_log_likelihood(self):
+        mbgf = estimation.ModifiedBetaGeoFitter()
+        params = [0.525, 6.183, 0.891, 1.614]
+        args = (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)
+        ll, d_ll = mbgf._negative_log_likelihood(params, *args, jac=True)
+        assert ll == mbgf._negative_log_likelihood(params, *args)
+        npt.assert_allclose(d_ll, numerical_gradient(mbgf._negative_log_likelihood, params, *args), rtol=1e-5)
+
+    def test_params_out_is_close_to_Hardie_paper_with_jacobian(self):
+        mbgf = estimation.ModifiedBetaGeoFitter()
+        mbgf.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], jac=True)
+        expected = np.array([0.525, 6.183, 0.891, 1.614])
+        npt.assert_array_almost_equal(expected, np.array(mbgf._unload_params('r', 'alpha', 'a', 'b')), decimal=3)
+
     def test_conditional_expectation_returns_same_value_as_Hardie_excel_sheet(self):
         mbfg = estimation.ModifiedBetaGeoFitter()
         mbfg.fit(cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'])
@@ -428,3 +557,33 @@ class TestModifiedBetaGammaFitter():
         assert abs(mbgf_with_large_inputs.conditional_probability_alive(1, scale * 2,
                                                                         scale * 10) - mbgf.conditional_probability_alive(
             1, 2, 10)) < 10e-2
+
+
+_frequency, _recency, _T = np.array([1, 0, 3, 2, 5]), np.array([1, 0, 4, 3, 6]), np.array([2, 2, 5, 5, 8])
+
+
+@pytest.mark.parametrize('fitter, params, args', [
+    (estimation.GammaGammaFitter, [[6.25, 3.74, 15.44], [1., 2., 3.], [6.25, -1., 15.44]],
+     (cdnow_customers_with_monetary_value['frequency'], cdnow_customers_with_monetary_value['monetary_value'], 0.1)),
+    (estimation.ParetoNBDFitter, [[0.553, 10.578, 0.606, 11.669], [1., 2., 3., 1.], [0.553, 10.578, 0., 11.669]],
+     (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)),
+    (estimation.BetaGeoFitter, [[0.243, 4.414, 0.793, 2.426], [1., 2., 3., 1.], [0.243, -4.414, 0.793, 2.426]],
+     (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)),
+    (estimation.ModifiedBetaGeoFitter, [[0.525, 6.183, 0.891, 1.614], [1., 2., 3., 1.], [0.525, 6.183, 0.891, 0.]],
+     (cdnow_customers['frequency'], cdnow_customers['recency'], cdnow_customers['T'], 0.1)),
+    (estimation.BGBBFitter, [[1.2, 0.7, 0.6, 2.7], [0.5, 3.0, 1.1, 0.4], [1.2, -0.7, 0.6, 2.7]],
+     (_frequency, _recency, _T, 0.1, np.array([10, 4, 2, 7, 1]))),
+    (estimation.BGBBBGFitter, [[1.2, 0.7, 0.6, 2.7, 1.0, 10.0], [0.5, 3.0, 1.1, 0.4, 2.0, 4.0],
+                               [1.2, 0.7, 0.6, 2.7, 1.0, -10.0]],
+     (_frequency, _recency, _T, np.array([1, 1, 2, 0, 3]), 0.1)),
+    (estimation.BGBBBGExtFitter, [[1.2, 0.7, 0.6, 2.7, 1.0, 10.0, 0.3], [0.5, 3.0, 1.1, 0.4, 2.0, 4.0, 0.6],
+                                  [1.2, 0.7, 0.6, 2.7, 1.0, 10.0, 1.2]],
+     (_frequency, _recency, _T, np.array([1, 1, 2, 0, 3]), 0.1)),
+    (estimation.BGFitter, [[1.2, 0.7], [0.4, 3.0], [-1.2, 0.7]], (_frequency, _T, 0.1)),
+])
+def test_batch_negative_log_likelihood_matches_single_vectors(fitter, params, args):
+    # the last parameter vector is outside of the domain of the fitter
+    expected = [fitter._negative_log_likelihood(p, *args) for p in params[:2]]
+    batch = fitter._batch_negative_log_likelihood(params, *args)
+    npt.assert_allclose(batch[:2], expected)
+    assert np.isinf(batch[2])
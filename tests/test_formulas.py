@@ -1,6 +1,8 @@
 from __future__ import print_function
 import pytest
-from lifetimes.formulas import gamma_ratio
+import numpy as np
+from scipy import special
+from lifetimes.formulas import gamma_ratio, LogBetaTable
 
 
 @pytest.mark.BGBB
@@ -12,4 +14,21 @@ def test_gamma_ratio():
     for x in xs:
         gr.append(gamma_ratio(x, 1))
 
-    print(gr)
\ No newline at end of file
+    print(gr)
+
+
+@pytest.mark.BGBB
+def test_log_beta_table():
+    p, q = 0.6, 2.7
+    log_B = LogBetaTable(p, q, 12)
+
+    j = np.array([0, 1, 0, 3, 5])
+    k = np.array([0, 0, 7, 2, 6])
+
+    assert np.allclose(log_B(j, k), special.betaln(p + j, q + k), rtol=1e-12)
+    assert np.isclose(log_B(1, 10), special.betaln(p + 1, q + 10), rtol=1e-12)
+
+    p, q = np.array([0.6, 1.3, 4.0]), np.array([2.7, 0.2, 1.0])
+    log_B = LogBetaTable(p, q, 12)
+    assert log_B(j, k).shape == (5, 3)
+    assert np.allclose(log_B(j, k), special.betaln(p + j[:, None], q + k[:, None]), rtol=1e-12)
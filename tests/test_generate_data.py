@@ -2,6 +2,9 @@ import math
 import pytest
 from lifetimes.generate_data import generate_monetary_values, sample_monetary_values
 import numpy as np
+from collections import OrderedDict
+import lifetimes.generate_data as gen
+import lifetimes.estimation as est
 
 
 @pytest.mark.generate
@@ -35,3 +38,52 @@ def test_sample_monetary_value_from_csv():
     assert len(sampled_values) == 100
     assert math.fabs(np.mean(sampled_values) - 8) < 3
     assert math.fabs(np.std(sampled_values) - 20) < 20
+
+
+@pytest.mark.generate
+@pytest.mark.parametrize("generator, fitter, params", [
+    (gen.beta_geometric_nbd_model, est.BetaGeoFitter, ['r', 'alpha', 'a', 'b']),
+    (gen.modified_beta_geometric_nbd_model, est.ModifiedBetaGeoFitter, ['r', 'alpha', 'a', 'b']),
+    (gen.pareto_nbd_model, est.ParetoNBDFitter, ['r', 'alpha', 's', 'beta']),
+])
+def test_continuous_time_generation_matches_expected_purchases(generator, fitter, params):
+    values = [0.8, 4.0, 1.5, 3.0]
+    T = 10
+    size = 50000
+
+    data = generator(T, *values, size=size)
+    assert len(data) == size
+    assert (data['recency'] <= data['T']).all()
+    assert ((data['recency'] > 0) == (data['frequency'] > 0)).all()
+
+    model = fitter()
+    model.params_ = OrderedDict(zip(params, values))
+    expected = model.expected_number_of_purchases_up_to_time(T)
+    assert math.fabs(data['frequency'].mean() - expected) < 5 * data['frequency'].std() / math.sqrt(size)
+
+
+@pytest.mark.generate
+def test_beta_geometric_nbd_model_with_transactions():
+    data, transactions = gen.beta_geometric_nbd_model_with_transactions([5, 10, 20] * 100, 2.0, 1.0, 1.5, 3.0)
+    assert len(data) == len(transactions) == 300
+    for i, times in transactions.items():
+        assert len(times) == data['frequency'][i]
+        assert (np.diff(times) >= 0).all()
+        if len(times) > 0:
+            assert times[-1] == data['recency'][i]
+
+
+@pytest.mark.generate
+@pytest.mark.parametrize("generator, params", [
+    (gen.beta_geometric_nbd_model, [0.8, 4.0, 1.5, 3.0]),
+    (gen.modified_beta_geometric_nbd_model, [0.8, 4.0, 1.5, 3.0]),
+    (gen.pareto_nbd_model, [0.8, 4.0, 1.5, 3.0]),
+    (gen.bgbb_model, [1.2, 0.7, 0.6, 2.7]),
+    (gen.bgbbbg_model, [1.2, 0.7, 0.6, 2.7, 1.0, 3.0]),
+    (gen.bgbbbgext_model, [1.2, 0.7, 0.6, 2.7, 1.0, 3.0, 0.3]),
+    (gen.bgext_model, [0.32, 0.85]),
+])
+def test_generation_is_reproducible(generator, params):
+    data = generator(10, *params, size=1000, random_state=7)
+    assert data.equals(generator(10, *params, size=1000, random_state=np.random.RandomState(7)))
+    assert not data.equals(generator(10, *params, size=1000, random_state=8))
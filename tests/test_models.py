@@ -24,7 +24,7 @@ def test_models_fitting_and_simulation():
 @pytest.mark.models
 def test_Pareto_expected_number_of_purchases_with_error():
     fitted_model = _fit_and_simulate(models.ParetoNBDModel(), params, t)
-    e_x, err_e_x = fitted_model.expected_number_of_sessions_up_to_time_with_errors(t)
+    e_x, err_e_x = fitted_model.expected_number_of_purchases_up_to_time(t)
     assert e_x is not None and err_e_x is not None
     assert math.fabs(err_e_x - EM_expected_number_of_purchases_up_to_time_error(fitted_model.fitter, t,
                                                                                 fitted_model.params_C)) < 10 ** -6
@@ -55,6 +55,107 @@ def test_params_covariance():
         assert covariance_matrix.item((i, i)) >= 0
 
 
+@pytest.mark.models
+def test_parallel_bootstrap_is_reproducible():
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': 0.32, 'beta': 0.85}, 500, random_state=1)
+
+    sampled_parameters = []
+    for n_jobs in [1, 2, 3]:
+        model.fit(data['frequency'], data['T'], bootstrap_size=6, random_state=2, n_jobs=n_jobs)
+        sampled_parameters.append([list(params.values()) for params in model.sampled_parameters])
+    assert sampled_parameters[0] == sampled_parameters[1] == sampled_parameters[2]
+
+
+@pytest.mark.models
+def test_warm_started_bootstrap():
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': 0.32, 'beta': 0.85}, 2000, random_state=1)
+    model.fit(data['frequency'], data['T'], bootstrap_size=10, random_state=2)
+    assert np.allclose(model._fitted_optimum(), [model.params[name] for name in model.param_names])
+
+    cold_C = model.params_C
+    model.fit(data['frequency'], data['T'], bootstrap_size=10, random_state=2, warm_start=False)
+    assert np.allclose(model.params_C, cold_C, rtol=0.5)
+
+    model.fit(data['frequency'], data['T'], bootstrap_size=10, random_state=2, jitter=0.1, max_nfev=200)
+    assert np.allclose(model.params_C, cold_C, rtol=0.5)
+
+
+@pytest.mark.models
+def test_bootstrap_resamplings():
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': 0.32, 'beta': 0.85}, 2000, random_state=1)
+    model.fit(data['frequency'], data['T'], bootstrap_size=10, random_state=2)
+    multinomial_C = model.params_C
+
+    model.fit(data['frequency'], data['T'], bootstrap_size=10, random_state=2, resampling='poisson')
+    assert np.allclose(model.params_C, multinomial_C, rtol=0.5)
+
+    # id-level data are compressed before re-sampling, so they give the same re-samplings as compressed data
+    compressed = data.groupby(['frequency', 'T'], sort=False).size().reset_index(name='N')
+    model.fit(compressed['frequency'], compressed['T'], N=compressed['N'], bootstrap_size=10, random_state=2)
+    assert np.allclose(model.params_C, multinomial_C, rtol=0.5)
+
+    with pytest.raises(ValueError):
+        model.fit(data['frequency'], data['T'], bootstrap_size=10, resampling='bayesian')
+
+
+@pytest.mark.models
+def test_hessian_covariance_matches_bootstrap():
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': 0.32, 'beta': 0.85}, 5000, random_state=1)
+    model.fit(data['frequency'], data['T'], bootstrap_size=50, random_state=2)
+    bootstrap_C = model.params_C
+
+    model.fit(data['frequency'], data['T'], random_state=2, covariance='hessian')
+    assert model.sampled_parameters is None
+    assert np.allclose(np.diag(model.params_C), np.diag(bootstrap_C), rtol=0.5)
+
+    # the BG/NBD fitter rescales time, and computes the Hessian from the gradient of the likelihood
+    model = models.BetaGeoModel()
+    data = model.generateData(40, model.parameters_dictionary_from_list(params), 2000, random_state=1)
+    model.fit(data['frequency'], data['recency'], data['T'], bootstrap_size=30, random_state=2)
+    bootstrap_C = model.params_C
+    model.fit(data['frequency'], data['recency'], data['T'], random_state=2, covariance='hessian')
+    assert np.allclose(np.diag(model.params_C), np.diag(bootstrap_C), rtol=0.6)
+
+    with pytest.raises(ValueError):
+        model.fit(data['frequency'], data['recency'], data['T'], covariance='jackknife')
+
+
+@pytest.mark.models
+def test_vectorized_errors_match_uncertainties():
+    model = models.BGModel()
+    data = model.generate_data(10, {'alpha': 0.32, 'beta': 0.85}, 2000, random_state=1)
+    model.fit(data['frequency'], data['T'], random_state=2, covariance='hessian')
+    assert model._uparams is None  # the uncertainties objects are only built on demand
+
+    ts = np.arange(20)
+    values, errors = model.expected_number_of_purchases_up_to_time(ts)
+    uvalues = [model.expected_number_of_purchases_up_to_time(t, uncertain=True) for t in ts]
+    assert np.allclose(values, [uvalue.n for uvalue in uvalues])
+    assert np.allclose(errors, [uvalue.s for uvalue in uvalues], rtol=1e-4)
+
+    numerical_values, numerical_errors = model.predict_with_errors('expected_number_of_purchases_up_to_time', ts)
+    assert np.allclose(numerical_values, values)
+    assert np.allclose(numerical_errors, errors, rtol=1e-4)
+
+    probability, error = model.probability_of_n_purchases_up_to_time(10, 3)
+    uprobability = model.probability_of_n_purchases_up_to_time(10, 3, uncertain=True)
+    assert np.isclose(probability, uprobability.n)
+    assert np.isclose(error, uprobability.s, rtol=1e-4)
+
+    # a prediction per customer in one shot
+    model = models.BetaGeoModel()
+    data = model.generateData(40, model.parameters_dictionary_from_list(params), 500, random_state=1)
+    model.fit(data['frequency'], data['recency'], data['T'], random_state=2, covariance='hessian')
+    values, errors = model.predict_with_errors('conditional_expected_number_of_purchases_up_to_time', 10,
+                                               data['frequency'].values, data['recency'].values, data['T'].values)
+    assert values.shape == errors.shape == (500,)
+    assert np.all(errors > 0)
+
+
 @pytest.mark.models
 def test_NumericalMetrics():
     p_x = [0.1, 0.2, 0.7]
@@ -74,7 +175,7 @@ def test_NumericalMetrics():
 
 
 def EM_expected_number_of_purchases_up_to_time_error(pareto_fitter, t, C):
-    E = pareto_fitter.expected_number_of_sessions_up_to_time(t)
+    E = pareto_fitter.expected_number_of_purchases_up_to_time(t)
     r, alpha, s, beta = pareto_fitter._unload_params('r', 'alpha', 's', 'beta')
 
     d_r = E / r
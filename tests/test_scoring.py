@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import numpy.testing as npt
+import lifetimes.estimation as estimation
+from lifetimes.scoring import score
+from lifetimes.datasets import load_summary_data_with_monetary_value
+
+cdnow_customers_with_monetary_value = load_summary_data_with_monetary_value()
+
+
+def _fitted_models():
+    bgf = estimation.BetaGeoFitter()
+    bgf.fit(cdnow_customers_with_monetary_value['frequency'], cdnow_customers_with_monetary_value['recency'],
+            cdnow_customers_with_monetary_value['T'])
+    returning_customers = cdnow_customers_with_monetary_value[cdnow_customers_with_monetary_value['frequency'] > 0]
+    ggf = estimation.GammaGammaFitter()
+    ggf.fit(returning_customers['frequency'], returning_customers['monetary_value'])
+    return bgf, ggf
+
+
+def test_chunked_scores_match_whole_column_predictions():
+    bgf, ggf = _fitted_models()
+    data = cdnow_customers_with_monetary_value
+    expected = pd.DataFrame({
+        'probability_alive': bgf.conditional_probability_alive(data['frequency'], data['recency'], data['T']),
+        'expected_purchases': bgf.conditional_expected_number_of_purchases_up_to_time(10, data['frequency'],
+                                                                                      data['recency'], data['T']),
+        'clv': ggf.customer_lifetime_value(bgf, data['frequency'], data['recency'], data['T'],
+                                           data['monetary_value'])
+    }, index=data.index)[['probability_alive', 'expected_purchases', 'clv']]
+
+    for chunk_size, n_jobs in [(len(data), 1), (1000, 1), (333, 2), (1000, -1)]:
+        chunks = list(score(bgf, data, t=10, monetary_value_model=ggf, chunk_size=chunk_size, n_jobs=n_jobs))
+        assert max(len(chunk) for chunk in chunks) <= chunk_size
+        scores = pd.concat(chunks)
+        assert (scores.index == data.index).all()
+        npt.assert_allclose(scores.values, expected.values)
+
+    # with a reused buffer, every chunk is overwritten by the next one and must be copied to be kept
+    chunks = [chunk.copy() for chunk in score(bgf, data, t=10, monetary_value_model=ggf, chunk_size=1000,
+                                              reuse_buffer=True)]
+    npt.assert_allclose(pd.concat(chunks).values, expected.values)
+
+
+def test_scores_of_an_iterator_in_float32():
+    bgf, _ = _fitted_models()
+    data = cdnow_customers_with_monetary_value
+    frames = (data.iloc[start:start + 700] for start in range(0, len(data), 700))
+    scores = pd.concat(score(bgf, frames, chunk_size=500, dtype=np.float32))
+    assert list(scores.columns) == ['probability_alive', 'expected_purchases']
+    assert (scores.dtypes == np.float32).all()
+    npt.assert_allclose(scores['probability_alive'],
+                        bgf.conditional_probability_alive(data['frequency'], data['recency'], data['T']), rtol=1e-5)
+
+
+def test_deduplicated_scores_match_scores_per_customer():
+    bgf, ggf = _fitted_models()
+    pnbd = estimation.ParetoNBDFitter()
+    pnbd.fit(cdnow_customers_with_monetary_value['frequency'], cdnow_customers_with_monetary_value['recency'],
+             cdnow_customers_with_monetary_value['T'])
+    data = cdnow_customers_with_monetary_value.copy()
+    data.iloc[3, data.columns.get_loc('recency')] = np.nan
+
+    for model, monetary_value_model in [(bgf, ggf), (pnbd, None)]:
+        for chunk_size, n_jobs in [(len(data), 1), (500, 2)]:
+            scores = pd.concat(score(model, data, t=10, chunk_size=chunk_size, n_jobs=n_jobs,
+                                     monetary_value_model=monetary_value_model))
+            deduplicated_scores = pd.concat(score(model, data, t=10, chunk_size=chunk_size, n_jobs=n_jobs,
+                                                  monetary_value_model=monetary_value_model, deduplicate=True))
+            assert (deduplicated_scores.index == data.index).all()
+            assert deduplicated_scores.iloc[3].isnull().all()
+            npt.assert_allclose(deduplicated_scores.drop(data.index[3]).values,
+                                scores.drop(data.index[3]).values)
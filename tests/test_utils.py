@@ -4,7 +4,9 @@ import numpy as np
 from pandas.util.testing import assert_frame_equal
 from numpy.testing import assert_almost_equal, assert_allclose
 
-from lifetimes import utils, BetaGeoFitter
+from lifetimes import utils
+from lifetimes.estimation import BetaGeoFitter
+from lifetimes.datasets import load_cdnow
 
 
 @pytest.fixture()
@@ -15,6 +17,16 @@ def example_transaction_data():
 def example_summary_data(example_transaction_data):
     return utils.summary_data_from_transaction_data(example_transaction_data, 'id', 'date', observation_period_end=max(example_transaction_data.date))
 
+@pytest.fixture()
+def cdnow_summary_data():
+    return load_cdnow(index_col=0)
+
+@pytest.fixture()
+def cdnow_fitted_bg(cdnow_summary_data):
+    bg = BetaGeoFitter()
+    bg.fit(cdnow_summary_data['frequency'], cdnow_summary_data['recency'], cdnow_summary_data['T'], iterative_fitting=0)
+    return bg
+
 @pytest.fixture()
 def fitted_bg(example_summary_data):
     bg = BetaGeoFitter()
@@ -266,6 +278,97 @@ def test_summary_data_from_transaction_data_obeys_data_contraints(example_summar
     assert utils._check_inputs(example_summary_data['frequency'], example_summary_data['recency'], example_summary_data['T']) is None
 
 
+def _quadratic(params, center):
+    return np.sum((params - center) ** 2)
+
+
+def test_fit_multi_start_in_parallel_gives_same_results_as_serial():
+    center = np.array([1., 2., 3.])
+    np.random.seed(0)
+    params, ll, summary = utils._fit(_quadratic, [center], 4, None, 3, False, full_output=True)
+    summaries = summary['starts']
+    assert summary['stop_reason'] == 'completed'
+    assert len(summaries) == 5
+    assert [s['method'] for s in summaries] == ['Powell', 'Nelder-Mead', 'BFGS', 'Powell', 'Nelder-Mead']
+    assert ll == min(s['fun'] for s in summaries)
+    assert_allclose(params, center, atol=1e-3)
+
+    for backend in ['thread', 'process']:
+        np.random.seed(0)
+        parallel_params, parallel_ll, parallel_summary = utils._fit(_quadratic, [center], 4, None, 3, False,
+                                                                    n_jobs=2, backend=backend, full_output=True)
+        assert_allclose(parallel_params, params)
+        assert parallel_ll == ll
+        assert [s['fun'] for s in parallel_summary['starts']] == [s['fun'] for s in summaries]
+
+
+def test_fit_stops_when_starts_agree():
+    center = np.array([1., 2., 3.])
+    np.random.seed(0)
+    params, ll, summary = utils._fit(_quadratic, [center], 9, None, 3, False, full_output=True, n_consensus=2)
+    assert summary['stop_reason'] == 'consensus'
+    assert sum(s['stopped'] is None for s in summary['starts']) == 2
+    assert_allclose(params, center, atol=1e-3)
+
+
+def test_fit_stops_when_budget_is_exhausted():
+    center = np.array([1., 2., 3.])
+    np.random.seed(0)
+    params, ll, summary = utils._fit(_quadratic, [center], 9, None, 3, False, full_output=True, max_nfev=100)
+    assert summary['stop_reason'] == 'max_nfev'
+    assert summary['nfev'] == 100
+    assert np.isfinite(ll)
+    assert ll == min(s['fun'] for s in summary['starts'] if not np.isnan(s['fun']))
+
+    np.random.seed(0)
+    params, ll, summary = utils._fit(_quadratic, [center], 9, None, 3, False, full_output=True, max_time=0)
+    assert summary['stop_reason'] == 'max_time'
+    assert all(s['stopped'] == 'max_time' for s in summary['starts'])
+
+
+def test_fit_with_unknown_backend():
+    with pytest.raises(ValueError):
+        utils._fit(_quadratic, [np.zeros(2)], 1, None, 2, False, n_jobs=2, backend='mpi')
+
+
+def test_hessian_with_and_without_gradient(cdnow_summary_data):
+    center = np.array([1., 2., 3.])
+    params, ll, summary = utils._fit(_quadratic, [center], 0, center + 0.5, 3, False, full_output=True, hessian=True)
+    assert_allclose(summary['hessian'], 2 * np.eye(3), atol=1e-4)
+
+    data = cdnow_summary_data
+    args = [data['frequency'].values, data['recency'].values, data['T'].values, 0., None]
+    params = np.array([0.24, 4.41, 0.79, 2.43])
+    with_gradient = utils._hessian(BetaGeoFitter._negative_log_likelihood, params, args + [True], jac=True)
+    without_gradient = utils._hessian(BetaGeoFitter._negative_log_likelihood, params, args + [False])
+    assert_allclose(with_gradient, with_gradient.T)
+    assert_allclose(with_gradient, without_gradient, rtol=1e-3)
+
+
+def test_check_random_state():
+    assert utils.check_random_state(None) is np.random.mtrand._rand
+    random_state = np.random.RandomState(1)
+    assert utils.check_random_state(random_state) is random_state
+    assert utils.check_random_state(1).random_sample() == np.random.RandomState(1).random_sample()
+    with pytest.raises(ValueError):
+        utils.check_random_state('seed')
+
+
+def test_spawn_random_states_do_not_depend_on_the_split():
+    children = utils.spawn_random_states(42, 4)
+    draws = [child.random_sample(3) for child in children]
+    assert len(set(tuple(d) for d in draws)) == 4
+
+    # the i-th child is the same whichever subset of tasks a worker runs
+    again = utils.spawn_random_states(42, 8)
+    for i in [3, 0, 2, 1]:
+        assert_allclose(again[i].random_sample(3), draws[i])
+
+    np.random.seed(0)
+    params, ll = utils._fit(_quadratic, [np.zeros(3)], 2, None, 3, False, random_state=5)
+    assert_allclose(utils._fit(_quadratic, [np.zeros(3)], 2, None, 3, False, random_state=5)[0], params)
+
+
 def test_scale_time():
     max_T = 200.
     T = np.arange(max_T)
@@ -306,3 +409,19 @@ def test_customer_lifetime_value_with_known_values(fitted_bg):
     # time=2, discount_rate=1 means the clv will be twice the initial
     clv_t2_d1 = utils.customer_lifetime_value(fitted_bg, t['frequency'], t['recency'], t['T'], monetary_value=pd.Series([1,1,1,1,1]), time=2, discount_rate=1.)
     assert_allclose(clv_t2_d1.values, expected/2. + expected/4., rtol=0.1)
+
+
+def test_customer_lifetime_value_matches_month_by_month_sum(cdnow_fitted_bg):
+    fitted_bg = cdnow_fitted_bg
+    t = fitted_bg.data.head(50)
+    monetary_value = pd.Series(np.linspace(1., 10., 50), index=t.index)
+    clv = utils.customer_lifetime_value(fitted_bg, t['frequency'], t['recency'], t['T'], monetary_value, time=36,
+                                        discount_rate=0.01)
+
+    expected = 0
+    for i in range(30, 36 * 30 + 1, 30):
+        expected_number_of_transactions = fitted_bg.predict(i, t['frequency'], t['recency'], t['T']) - \
+            fitted_bg.predict(i - 30, t['frequency'], t['recency'], t['T'])
+        expected += monetary_value * expected_number_of_transactions / 1.01 ** (i / 30)
+    assert_allclose(clv.values, expected.values, rtol=1e-10)
+    assert (clv.index == t.index).all()